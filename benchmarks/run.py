@@ -0,0 +1,428 @@
+"""
+py-stream-scraper のベンチマーク
+
+ローカルのベンチマーク用サーバー、fakeredis、一時ディレクトリの RocksDB を使い、
+外部のサービスなしで次のスループットを計測して JSON で出力する。
+
+- scrape_async / scrape_sync / DistributedScraper のページ数/秒（エンドツーエンド）
+- DiskURLManager の追加・走査の件数/秒
+- キャッシュ（DiskCache, RedisCache）の書き込み・読み込みの件数/秒
+- シンク（FileSink）の書き込みの件数/秒
+- 抽出仕様（extract.Schema, lxml）と同じ処理の BeautifulSoup の parse のページ数/秒
+
+使い方:
+    python -m benchmarks.run --pages 1000 --out results.json
+    python -m benchmarks.run --latency-ms 50 --error-rate 0.01 --only scrape_async
+    python -m benchmarks.run --baseline old.json --max-regression 0.2
+"""
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from importlib import metadata
+from typing import Callable, Dict, Optional
+
+import brotli
+import click
+import fakeredis
+from bs4 import BeautifulSoup
+
+from py_stream_scraper.cache import DiskCache, RedisCache
+from py_stream_scraper.http_client import HTTPClient
+from py_stream_scraper.log import configure_logging
+from py_stream_scraper.scraper import DistributedScraper, FetchStrategy, Scraper
+from py_stream_scraper.sink import FileSink
+from py_stream_scraper.url_manager import DiskURLManager
+
+from .server import BenchServer, ServerConfig
+
+_TITLE = re.compile(r"<title>(.*?)</title>", re.S)
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str):
+    def deco(fn):
+        BENCHMARKS[name] = fn
+        return fn
+
+    return deco
+
+
+def _result(ops: int, seconds: float, unit: str) -> dict:
+    return {
+        "ops": ops,
+        "seconds": round(seconds, 6),
+        "rate": round(ops / seconds, 2) if seconds > 0 else None,
+        "unit": unit,
+    }
+
+
+class _BenchMixin:
+    def parse(self, url, html):
+        m = _TITLE.search(html)
+        return {"URL": url, "title": m.group(1) if m else ""}
+
+
+class BenchScraper(_BenchMixin, Scraper):
+    pass
+
+
+class BenchDistributedScraper(_BenchMixin, DistributedScraper):
+    def __init__(self, *args, limit: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limit = limit
+        self.processed = 0
+
+    def _fetch_one_sync(self, *args, **kwargs):
+        super()._fetch_one_sync(*args, **kwargs)
+        self.processed += 1
+        if self.processed >= self.limit:
+            self.running = False
+
+
+def _scraper(ctx, name: str, cls=BenchScraper, **kwargs):
+    scraper = cls(
+        f"{name}.bench",
+        1_000_000,
+        redis_client=ctx["redis"],
+        max_concurrency=ctx["concurrency"],
+        fetch_strategy=FetchStrategy.NEVER_STOP,
+        http_client=HTTPClient(max_workers=ctx["workers"]),
+        **kwargs,
+    )
+    for i in range(ctx["pages"]):
+        scraper.url_manager.add_url(ctx["server"].url(f"/page/{i}"))
+    return scraper
+
+
+@benchmark("scrape_async")
+def bench_scrape_async(ctx):
+    scraper = _scraper(ctx, "async")
+    started = time.perf_counter()
+    asyncio.run(scraper.scrape_async())
+    return _result(ctx["pages"], time.perf_counter() - started, "pages/s")
+
+
+@benchmark("scrape_sync")
+def bench_scrape_sync(ctx):
+    scraper = _scraper(ctx, "sync")
+    started = time.perf_counter()
+    scraper.scrape_sync(workers=1)
+    return _result(ctx["pages"], time.perf_counter() - started, "pages/s")
+
+
+@benchmark("scrape_sync_threaded")
+def bench_scrape_sync_threaded(ctx):
+    scraper = _scraper(ctx, "threaded")
+    started = time.perf_counter()
+    scraper.scrape_sync(workers=ctx["workers"])
+    return _result(ctx["pages"], time.perf_counter() - started, "pages/s")
+
+
+@benchmark("distributed")
+def bench_distributed(ctx):
+    scraper = _scraper(
+        ctx, "distributed", cls=BenchDistributedScraper, limit=ctx["pages"]
+    )
+    scraper.start_stream()
+    started = time.perf_counter()
+    scraper.scrape_sync(workers=ctx["workers"])
+    return _result(scraper.processed, time.perf_counter() - started, "pages/s")
+
+
+@benchmark("url_manager_ingest")
+def bench_url_manager_ingest(ctx):
+    manager = DiskURLManager("ingest.bench")
+    n = ctx["urls"]
+    started = time.perf_counter()
+    for i in range(n):
+        manager.add_url(f"https://ingest.bench/item/{i}?ref={i % 97}")
+    return _result(n, time.perf_counter() - started, "urls/s")
+
+
+@benchmark("url_manager_iter")
+def bench_url_manager_iter(ctx):
+    manager = DiskURLManager("ingest.bench")
+    if next(manager.to_iter(), None) is None:
+        bench_url_manager_ingest(ctx)
+    started = time.perf_counter()
+    n = sum(1 for _ in manager.to_iter())
+    return _result(n, time.perf_counter() - started, "urls/s")
+
+
+@benchmark("url_manager_total")
+def bench_url_manager_total(ctx):
+    manager = DiskURLManager("ingest.bench")
+    if next(manager.to_iter(), None) is None:
+        bench_url_manager_ingest(ctx)
+    started = time.perf_counter()
+    n = manager.urls_total
+    return _result(n, time.perf_counter() - started, "urls/s")
+
+
+def _cache_pages(ctx):
+    # 圧縮は brotli_compress で別に計測するので、ページの種類ごとに一度だけ行う
+    if "compressed" not in ctx:
+        ctx["compressed"] = [brotli.compress(p) for p in ctx["server"].pages]
+    compressed = ctx["compressed"]
+    return [
+        (f"https://cache.bench/page/{i}", compressed[i % len(compressed)])
+        for i in range(ctx["pages"])
+    ]
+
+
+def _bench_cache(ctx, cache, op: str):
+    items = _cache_pages(ctx)
+    started = time.perf_counter()
+    for url, body in items:
+        cache.write(url, body)
+    if op == "write":
+        return _result(len(items), time.perf_counter() - started, "pages/s")
+
+    started = time.perf_counter()
+    for url, _ in items:
+        cache.read(url.encode("utf-8"))
+    return _result(len(items), time.perf_counter() - started, "pages/s")
+
+
+@benchmark("disk_cache_write")
+def bench_disk_cache_write(ctx):
+    return _bench_cache(ctx, DiskCache(os.path.join(ctx["tmp"], "cache")), "write")
+
+
+@benchmark("disk_cache_read")
+def bench_disk_cache_read(ctx):
+    return _bench_cache(ctx, DiskCache(os.path.join(ctx["tmp"], "cache")), "read")
+
+
+@benchmark("redis_cache_write")
+def bench_redis_cache_write(ctx):
+    return _bench_cache(ctx, RedisCache(fakeredis.FakeRedis()), "write")
+
+
+@benchmark("redis_cache_read")
+def bench_redis_cache_read(ctx):
+    return _bench_cache(ctx, RedisCache(fakeredis.FakeRedis()), "read")
+
+
+@benchmark("brotli_compress")
+def bench_brotli_compress(ctx):
+    pages = ctx["server"].pages
+    started = time.perf_counter()
+    for i in range(ctx["pages"]):
+        brotli.compress(pages[i % len(pages)])
+    return _result(ctx["pages"], time.perf_counter() - started, "pages/s")
+
+
+def _parse_pages(ctx):
+    pages = ctx["server"].pages
+    return [pages[i % len(pages)].decode("utf-8") for i in range(ctx["pages"])]
+
+
+def _parse_bs4(url, html):
+    soup = BeautifulSoup(html, "html.parser")
+    row = {"URL": url, "title": soup.title.get_text(strip=True)}
+    row["links"] = [a["href"] for a in soup.select("nav a") if a.has_attr("href")]
+    for table in soup.find_all("table", class_="info"):
+        for tr in table.find_all("tr"):
+            th, td = tr.find("th"), tr.find("td")
+            if th and td:
+                row[th.get_text(strip=True)] = td.get_text(strip=True)
+    return row
+
+
+def _bench_parse(ctx, parse):
+    pages = _parse_pages(ctx)
+    started = time.perf_counter()
+    for i, html in enumerate(pages):
+        parse(f"https://parse.bench/page/{i}", html)
+    return _result(len(pages), time.perf_counter() - started, "pages/s")
+
+
+@benchmark("parse_bs4")
+def bench_parse_bs4(ctx):
+    return _bench_parse(ctx, _parse_bs4)
+
+
+@benchmark("parse_schema")
+def bench_parse_schema(ctx):
+    try:
+        from py_stream_scraper.extract import Field, Pairs, Schema
+    except ImportError:
+        return {"skipped": "lxml is not installed"}
+
+    # _parse_bs4 と同じ結果になる抽出仕様
+    schema = Schema(
+        fields=[
+            Field("title", css="title"),
+            Field("links", css="nav a", attr="href", many=True),
+        ],
+        pairs=[Pairs("table.info")],
+    )
+    return _bench_parse(ctx, lambda url, html: schema.extract(html, url))
+
+
+@benchmark("file_sink")
+def bench_file_sink(ctx):
+    n = ctx["urls"]
+    rows = [
+        {"URL": f"https://sink.bench/{i}", "title": f"title {i}", "price": str(i)}
+        for i in range(n)
+    ]
+    with FileSink(os.path.join(ctx["tmp"], "sink.csv")) as sink:
+        started = time.perf_counter()
+        for row in rows:
+            sink.write(row)
+        seconds = time.perf_counter() - started
+    return _result(n, seconds, "rows/s")
+
+
+def _version() -> str:
+    try:
+        return metadata.version("py-stream-scraper")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def run(
+    names=None,
+    pages: int = 500,
+    urls: int = 20_000,
+    concurrency: int = 16,
+    workers: int = 8,
+    server_config: ServerConfig = ServerConfig(),
+) -> dict:
+    """
+    ベンチマークを実行して結果を辞書で返す（カレントディレクトリは一時ディレクトリに移る）
+    """
+    random.seed(server_config.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, BenchServer(server_config) as server:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            ctx = {
+                "tmp": tmp,
+                "server": server,
+                "redis": fakeredis.FakeRedis(),
+                "pages": pages,
+                "urls": urls,
+                "concurrency": concurrency,
+                "workers": workers,
+            }
+            for name in names or BENCHMARKS:
+                results[name] = result = BENCHMARKS[name](ctx)
+                if "skipped" in result:
+                    click.echo(f"{name:24s} skipped: {result['skipped']}", err=True)
+                    continue
+                click.echo(f"{name:24s} {result['rate']:>12} {result['unit']}", err=True)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "params": {
+            "pages": pages,
+            "urls": urls,
+            "concurrency": concurrency,
+            "workers": workers,
+            "server": vars(server_config),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict) -> Dict[str, Optional[float]]:
+    """
+    ベンチマークごとに baseline からの rate の変化率を返す（-0.1 なら 10% 低下）
+    """
+    changes = {}
+    for name, result in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("rate") or result.get("rate") is None:
+            changes[name] = None
+            continue
+        changes[name] = result["rate"] / old["rate"] - 1
+    return changes
+
+
+@click.command()
+@click.option("--only", multiple=True, type=click.Choice(list(BENCHMARKS)))
+@click.option("--pages", default=500, show_default=True, help="スクレイピング系で取得するページ数")
+@click.option("--urls", default=20_000, show_default=True, help="URL管理・シンク系の件数")
+@click.option("--concurrency", default=16, show_default=True)
+@click.option("--workers", default=8, show_default=True, help="同期版のスレッド数")
+@click.option("--latency-ms", default=0.0, show_default=True, help="サーバーの平均レイテンシ")
+@click.option("--size-kb", default=30.0, show_default=True, help="ページサイズの中央値")
+@click.option("--error-rate", default=0.0, show_default=True, help="503 を返す割合")
+@click.option("--throttle-rate", default=0.0, show_default=True, help="429 を返す割合")
+@click.option("--out", type=click.Path(dir_okay=False), help="結果の JSON の保存先")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="比較する過去の結果")
+@click.option(
+    "--max-regression",
+    type=float,
+    help="baseline からの低下がこの割合を超えたら終了コード 1 にする（例: 0.2）",
+)
+def main(
+    only,
+    pages,
+    urls,
+    concurrency,
+    workers,
+    latency_ms,
+    size_kb,
+    error_rate,
+    throttle_rate,
+    out,
+    baseline,
+    max_regression,
+):
+    configure_logging(level="WARNING", background=True)
+    report = run(
+        names=only or None,
+        pages=pages,
+        urls=urls,
+        concurrency=concurrency,
+        workers=workers,
+        server_config=ServerConfig(
+            latency_ms=latency_ms,
+            size_kb=size_kb,
+            error_rate=error_rate,
+            throttle_rate=throttle_rate,
+        ),
+    )
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        click.echo(text)
+
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            changes = compare(report, json.load(f))
+        regressed = False
+        for name, change in changes.items():
+            if change is None:
+                click.echo(f"{name:24s} {'n/a':>8}", err=True)
+                continue
+            click.echo(f"{name:24s} {change:+8.1%}", err=True)
+            if max_regression is not None and change < -max_regression:
+                regressed = True
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+ベンチマーク用のローカル HTTP サーバー
+
+実在のサイトに近い HTML（ナビゲーション、段落、表、リンク）を返す aiohttp の
+サーバーを別スレッドのイベントループで動かす。レイテンシ、ページサイズ、
+エラー率は ServerConfig で指定する。
+"""
+import asyncio
+import random
+import threading
+import zlib
+from dataclasses import dataclass
+
+from aiohttp import web
+
+_WORDS = (
+    "東京 大阪 求人 店舗 営業時間 アクセス 駅 徒歩 分 料金 予約 口コミ "
+    "menu about news contact access price review shop store open close"
+).split()
+
+
+@dataclass
+class ServerConfig:
+    latency_ms: float = 0.0  # 平均レイテンシ（指数分布）
+    size_kb: float = 30.0  # ページサイズの中央値（対数正規分布）
+    size_sigma: float = 0.5
+    error_rate: float = 0.0  # 503 を返す割合
+    throttle_rate: float = 0.0  # 429 を返す割合
+    pages: int = 64  # 事前に生成しておくページの種類
+    seed: int = 0
+
+
+def _paragraph(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+
+def generate_page(rng: random.Random, size: int, page_id: int) -> bytes:
+    """
+    おおよそ size バイトの HTML を生成する
+    """
+    head = (
+        "<!DOCTYPE html><html lang='ja'><head><meta charset='utf-8'>"
+        f"<title>page {page_id} | {_paragraph(rng, 4)}</title></head><body>"
+        "<header><nav><ul>"
+        + "".join(f"<li><a href='/page/{rng.randrange(10**6)}'>{w}</a></li>" for w in _WORDS[:8])
+        + "</ul></nav></header><main>"
+    )
+    parts = [head]
+    total = len(head)
+    while total < size:
+        block = (
+            f"<section><h2>{_paragraph(rng, 3)}</h2><p>{_paragraph(rng, 60)}</p>"
+            "<table class='info'>"
+            + "".join(
+                f"<tr><th>{rng.choice(_WORDS)}</th><td>{_paragraph(rng, 6)}</td></tr>"
+                for _ in range(5)
+            )
+            + "</table>"
+            + f"<a class='more' href='/page/{rng.randrange(10**6)}'>詳細</a></section>"
+        )
+        parts.append(block)
+        total += len(block.encode("utf-8"))
+    parts.append("</main><footer>&copy; bench</footer></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+class BenchServer:
+    """
+    バックグラウンドスレッドで動くベンチマーク用サーバー
+
+    with BenchServer(ServerConfig()) as server:
+        server.url("/page/1")
+    """
+
+    def __init__(self, config: ServerConfig = ServerConfig()):
+        self.config = config
+        rng = random.Random(config.seed)
+        self.pages = [
+            generate_page(
+                rng, int(rng.lognormvariate(0, config.size_sigma) * config.size_kb * 1024), i
+            )
+            for i in range(config.pages)
+        ]
+        self.requests = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._runner = None
+        self.port = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        cfg = self.config
+        if cfg.latency_ms > 0:
+            await asyncio.sleep(random.expovariate(1000 / cfg.latency_ms))
+        r = random.random()
+        if r < cfg.error_rate:
+            return web.Response(status=503)
+        if r < cfg.error_rate + cfg.throttle_rate:
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        page = self.pages[zlib.crc32(request.path_qs.encode("utf-8")) % len(self.pages)]
+        return web.Response(body=page, content_type="text/html", charset="utf-8")
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def start(self) -> "BenchServer":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
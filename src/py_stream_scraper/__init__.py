@@ -1,2 +1,26 @@
-from .scraper import Scraper
-from .sink import FileSink
+from typing import TYPE_CHECKING
+
+# Scraper は aiohttp・requests・redis などを読み込むので、使われたときに import する
+# （sx の起動や、url_manager などだけを使う場合に重い依存を読まないため）
+_LAZY = {
+    "Scraper": ".scraper",
+    "MultiHostScraper": ".multi_host",
+    "FileSink": ".sink",
+}
+
+__all__ = list(_LAZY)
+
+if TYPE_CHECKING:
+    from .multi_host import MultiHostScraper
+    from .scraper import Scraper
+    from .sink import FileSink
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
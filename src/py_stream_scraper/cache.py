@@ -1,10 +1,36 @@
 import abc
+import enum
 import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from click import Path
+from pathlib import Path
+
+
+class CachePolicy(enum.Enum):
+    """
+    スクレイピング時のキャッシュの使い方
+
+    WRITE_ONLY: 毎回取得してキャッシュに保存するだけで、parse はしない（従来の動作）
+    READ_THROUGH: キャッシュにあればそれを parse し、なければ取得して保存してから parse する
+    CACHE_ONLY: キャッシュにあるページだけを parse する（ネットワークには出ない）
+    """
+
+    WRITE_ONLY = "write_only"
+    READ_THROUGH = "read_through"
+    CACHE_ONLY = "cache_only"
+
+
+def _key(k) -> str:
+    return k.decode("utf-8") if isinstance(k, bytes) else k
 
 
 class Cache(abc.ABC):
+    # True なら brotli で圧縮した本文を write/read する。False の実装（WARCCache）は
+    # 圧縮していない本文を write_response でステータス・ヘッダーとともに受け取り、read で返す
+    compressed = True
+
     @abc.abstractmethod
     def write(self, k: bytes, v: bytes):
         pass
@@ -13,35 +39,163 @@ class Cache(abc.ABC):
     def read(self, k: bytes):
         pass
 
+    def write_response(
+        self,
+        k,
+        body: bytes,
+        status: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        fetched_at: Optional[float] = None,
+    ):
+        """
+        圧縮していない本文をレスポンスの情報とともに保存する（compressed = False の実装のみ）
+        """
+        raise NotImplementedError
+
+    def write_content_type(self, k, content_type: Optional[str]):
+        """
+        write で保存した本文の Content-Type を保存する（raw_cache で元の charset のまま保存する場合）
+
+        既定では保存しない（再生時は meta タグか UTF-8 でデコードされる）。
+        """
+
+    def read_with_content_type(self, k) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        read の値と、保存した Content-Type（分からなければ None）を返す
+        """
+        return self.read(k), None
+
+    def fetched_at_many(self, keys: Sequence) -> List[Optional[float]]:
+        """
+        keys それぞれを保存した時刻（UNIX 時間）を返す。ないものは None、時刻が分からないものは 0
+
+        既定では1件ずつ read するので、実装ごとにまとめて確認できるものは上書きする。
+        """
+        out = []
+        for k in keys:
+            try:
+                v = self.read(k)
+            except FileNotFoundError:
+                v = None
+            out.append(None if v is None else 0.0)
+        return out
+
+    def fresh_many(self, keys: Sequence, max_age: Optional[float] = None) -> List[bool]:
+        """
+        keys それぞれがキャッシュにあり、保存してから max_age 秒以内かどうか
+        """
+        now = time.time()
+        return [
+            ts is not None and (max_age is None or now - ts <= max_age)
+            for ts in self.fetched_at_many(keys)
+        ]
+
 
 class DiskCache(Cache):
+    def __init__(self, cache_dir: str | None = None):
+        """
+        Args:
+            cache_dir: 保存先のディレクトリ（省略時はこのファイルと同じ場所の .cache_html）
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
     def _cache_path(self, url: str) -> Path:
-        base_dir = Path(__file__).resolve().parent  # このファイルと同じディレクトリ
-        cache_dir = base_dir / ".cache_html"  # 隠しディレクトリっぽく
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            base_dir = Path(__file__).resolve().parent  # このファイルと同じディレクトリ
+            cache_dir = base_dir / ".cache_html"  # 隠しディレクトリっぽく
         cache_dir.mkdir(parents=True, exist_ok=True)
 
         digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
         return cache_dir / f"{digest}.br"
 
     def write(self, k: bytes, v: bytes):
-        path = self._cache_path(k.decode("utf-8"))
+        path = self._cache_path(_key(k))
         with open(path, "wb") as f:
             f.write(v)
 
     def read(self, k: bytes):
-        path = self._cache_path(k.decode("utf-8"))
-        r = b""
-        with open(path, "wb") as f:
-            r = f.read()
-        return r
+        path = self._cache_path(_key(k))
+        with open(path, "rb") as f:
+            return f.read()
+
+    def write_content_type(self, k, content_type: Optional[str]):
+        # 本文の横に {digest}.ct として保存する
+        path = self._cache_path(_key(k)).with_suffix(".ct")
+        if content_type is None:
+            path.unlink(missing_ok=True)
+            return
+        path.write_text(content_type, encoding="utf-8")
+
+    def read_with_content_type(self, k) -> Tuple[Optional[bytes], Optional[str]]:
+        value = self.read(k)
+        try:
+            content_type = (
+                self._cache_path(_key(k)).with_suffix(".ct").read_text(encoding="utf-8")
+            )
+        except FileNotFoundError:
+            content_type = None
+        return value, content_type
+
+    def fetched_at_many(self, keys: Sequence) -> List[Optional[float]]:
+        # ファイルの更新時刻を保存した時刻とする
+        out = []
+        for k in keys:
+            try:
+                out.append(os.stat(self._cache_path(_key(k))).st_mtime)
+            except FileNotFoundError:
+                out.append(None)
+        return out
 
 
 class RedisCache(Cache):
+    """
+    URL をキーにして Redis に保存するキャッシュ
+
+    保存した時刻は {TS_PREFIX}{URL} に別に保存する（これより前に保存したものは時刻が分からない）。
+    write_content_type で保存した Content-Type は {CT_PREFIX}{URL} に保存する。
+    """
+
+    TS_PREFIX = "stream-scraper:cache-ts:"
+    CT_PREFIX = "stream-scraper:cache-ct:"
+
     def __init__(self, r):
         self.redis = r
 
     def write(self, k: bytes, v: bytes):
-        self.redis.set(k, v)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(k, v)
+        pipe.set(self.TS_PREFIX + _key(k), time.time())
+        pipe.execute()
 
     def read(self, k: bytes):
         return self.redis.get(k)
+
+    def write_content_type(self, k, content_type: Optional[str]):
+        if content_type is None:
+            self.redis.delete(self.CT_PREFIX + _key(k))
+        else:
+            self.redis.set(self.CT_PREFIX + _key(k), content_type)
+
+    def read_with_content_type(self, k) -> Tuple[Optional[bytes], Optional[str]]:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(k)
+        pipe.get(self.CT_PREFIX + _key(k))
+        value, content_type = pipe.execute()
+        if isinstance(content_type, bytes):
+            content_type = content_type.decode("utf-8")
+        return value, content_type
+
+    def fetched_at_many(self, keys: Sequence) -> List[Optional[float]]:
+        if not keys:
+            return []
+        # 本体は読まずに EXISTS と時刻の MGET を1往復で確認する
+        pipe = self.redis.pipeline(transaction=False)
+        for k in keys:
+            pipe.exists(k)
+        pipe.mget([self.TS_PREFIX + _key(k) for k in keys])
+        *exists, stamps = pipe.execute()
+        return [
+            None if not e else float(ts) if ts is not None else 0.0
+            for e, ts in zip(exists, stamps)
+        ]
@@ -1,16 +1,13 @@
 from urllib.parse import urlparse
-import sys, os, csv, json, importlib, xml.etree.ElementTree as ET
-from typing import Iterator, Optional
+import sys, os, csv, json, importlib
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterator, Optional
 import click
-from py_stream_scraper.scraper import DistributedScraper, Scraper
-from rich.console import Console
-from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, TextColumn
-import redis
 
-from py_stream_scraper.url_manager import DiskURLManager
-
-log = Console(stderr=True)
+# sx はシェルのパイプラインやジョブから何千回も起動されるので、aiohttp・requests・redis・rich
+# などの重い依存はサブコマンドの中で必要になったときに import する
+if TYPE_CHECKING:
+    from py_stream_scraper.url_manager import DiskURLManager
 
 BANNER = r"""
    _____ _______ _____  ______          __  __    _____  _____ _____            _____  ______ _____  
@@ -24,6 +21,28 @@ BANNER = r"""
 """
 
 
+@lru_cache(maxsize=None)
+def _log():
+    from rich.console import Console
+
+    return Console(stderr=True)
+
+
+def _spinner():
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+
+    return Progress(SpinnerColumn(), TextColumn("{task.description}"), console=_log())
+
+
+class _Group(click.Group):
+    def format_help(self, ctx, formatter):
+        # バナーは sx / sx --help のときだけ表示する
+        from rich.panel import Panel
+
+        _log().print(Panel(BANNER, style="green"))
+        super().format_help(ctx, formatter)
+
+
 def load_class(path: str):
     mod, cls = path.rsplit(".", 1)
     return getattr(importlib.import_module(mod), cls)
@@ -55,6 +74,8 @@ def discover_builtin(kind: str, source: str) -> Iterator[str]:
     elif kind == "sitemap":
         import requests
 
+        import xml.etree.ElementTree as ET
+
         r = requests.get(source, timeout=15)
         r.raise_for_status()
         root = ET.fromstring(r.content)
@@ -66,9 +87,57 @@ def discover_builtin(kind: str, source: str) -> Iterator[str]:
         raise click.UsageError("--from は sitemap/txt/csv のみ")
 
 
-@click.group(context_settings={"help_option_names": ["-h", "--help"]})
-def _cli():
-    log.print(Panel(BANNER, style="green"))
+@click.group(cls=_Group, context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "--log-format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    help="ログの出力形式",
+)
+@click.option("--log-level", default="INFO", help="ログレベル")
+@click.option(
+    "--log-sample",
+    type=float,
+    default=1.0,
+    help="URLごとのログ（fetching/streaming）を出力する割合",
+)
+@click.option(
+    "--log-levels",
+    default="",
+    help="サブシステムごとのレベル（例: fetch=WARNING,retry=DEBUG）。"
+    "fetch/retry/crawl/lease/cache/warc を指定できる",
+)
+@click.option(
+    "--db",
+    envvar="SX_DB",
+    default="./.rocksdb",
+    show_default=True,
+    help="URLを保存する RocksDB のパス",
+)
+def _cli(
+    log_format: str, log_level: str, log_sample: float, log_levels: str, db: str
+):
+    from py_stream_scraper.url_manager import StorageConfig, set_default_storage
+
+    set_default_storage(StorageConfig(path=db))
+
+    from py_stream_scraper.log import configure_logging
+
+    items = [item.strip() for item in log_levels.split(",") if item.strip()]
+    if any("=" not in item for item in items):
+        raise click.BadParameter(
+            "name=LEVEL をカンマ区切りで指定してください", param_hint="--log-levels"
+        )
+    levels = dict(item.split("=", 1) for item in items)
+    try:
+        configure_logging(
+            level=log_level.upper(),
+            structured=log_format == "json",
+            sample_rate=log_sample,
+            levels=levels,
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--log-levels")
 
 
 # ---------------- discover ----------------
@@ -93,7 +162,7 @@ def discover(from_: Optional[str], host: Optional[str], arg: Optional[str]):
       sx discover --from txt     --host example.com urls.txt
       sx discover --from csv     --host example.com urls.csv
     """
-    log.rule("[bold green]discover")
+    _log().rule("[bold green]discover")
 
     # --- クラスモード（--from なし）: クラス名必須 ---
     if from_ is None:
@@ -103,9 +172,7 @@ def discover(from_: Optional[str], host: Optional[str], arg: Optional[str]):
             )
         Cls = load_class(arg)
         inst = Cls()
-        with Progress(
-            SpinnerColumn(), TextColumn("{task.description}"), console=log
-        ) as p:
+        with _spinner() as p:
             t = p.add_task("discover_urls()", start=True)
             inst.discover_urls()  # クラス側で self.url_manager.add_url(...)
             p.update(t, description="done")
@@ -120,9 +187,7 @@ def discover(from_: Optional[str], host: Optional[str], arg: Optional[str]):
         from py_stream_scraper import Scraper
 
         inst = Scraper(host=host, qps=10)
-        with Progress(
-            SpinnerColumn(), TextColumn("{task.description}"), console=log
-        ) as p:
+        with _spinner() as p:
             t = p.add_task(f"discover_urls_from_sitemap({host})", start=True)
             inst.discover_urls_from_sitemap()  # USPで自動的にサイトマップ探索→URLManagerへenqueue
             p.update(t, description="done")
@@ -163,7 +228,7 @@ def discover(from_: Optional[str], host: Optional[str], arg: Optional[str]):
                     if row and row[0].strip():
                         yield row[0].strip()
 
-    with Progress(SpinnerColumn(), TextColumn("{task.description}"), console=log) as p:
+    with _spinner() as p:
         t = p.add_task(f"enqueue from {from_} → {host}", start=True)
         cnt = 0
         it = iter_urls_txt if from_ == "txt" else iter_urls_csv
@@ -173,30 +238,320 @@ def discover(from_: Optional[str], host: Optional[str], arg: Optional[str]):
         p.update(t, description=f"done ({cnt} urls)")
 
 
+def _reader(host: str) -> "DiskURLManager":
+    """
+    scrape 中のプロセスが DB を開いていても読めるよう secondary として開く
+    """
+    from py_stream_scraper.url_manager import (
+        DiskURLManager,
+        StorageConfig,
+        get_default_storage,
+    )
+
+    path = get_default_storage().path
+    try:
+        return DiskURLManager(host, StorageConfig(path=path, mode="secondary"))
+    except FileNotFoundError:
+        raise click.ClickException(
+            f"URL の DB が見つかりません: {path}（--db または SX_DB で指定できます）"
+        )
+
+
 @_cli.command()
 @click.option("--host", help="show details")
 def list(host):
-    manager = DiskURLManager(host)
+    manager = _reader(host)
     cnt = 0
-    for key, value in manager.to_iter(manager.lower):
-        url_str = value.decode("utf-8")
-        cnt += 1
-        print(url_str)
+    out = sys.stdout.buffer
+    for batch in manager.iter_batches(manager.lower, batch_size=10_000):
+        cnt += len(batch)
+        out.write(b"\n".join(url for _, url in batch) + b"\n")
+    out.flush()
     print(f"Total: {cnt} urls")
 
 
+@_cli.command()
+@click.option("--host", required=True, help="対象ホスト")
+@click.option("--shards", type=int, required=True, help="シャード数")
+@click.option(
+    "--out", default=".", show_default=True, help="スナップショットの出力先ディレクトリ"
+)
+def partition(host, shards, out):
+    """
+    フロンティアをURLのハッシュでシャードに分け、シャードごとのファイルに書き出す
+
+    使い方:
+      sx partition --host example.com --shards 4 --out shards/
+      # 各ノードで
+      sx discover --from txt --host example.com shards/example.com.shard-0-of-4.txt
+      sx scrape module.ClassName
+    """
+    manager = _reader(host)
+    for path, cnt in manager.partition(shards, out):
+        print(f"{path}\t{cnt}")
+
+
 @_cli.command()
 @click.option("--host", help="show details")
-def stream(host):
-    scraper = DistributedScraper(host, 10)
+@click.option(
+    "--shards",
+    default=1,
+    show_default=True,
+    help="配信ストリームのシャード数（ワーカーの stream_shards と同じ値にする）",
+)
+def stream(host, shards: int):
+    from py_stream_scraper.scraper import DistributedScraper
+
+    scraper = DistributedScraper(host, 10, stream_shards=shards)
     scraper.start_stream()
-    log.print("Stream started. name: " + scraper.stream_name)
+    _log().print("Stream started. name: " + ", ".join(scraper.stream_names))
+
+
+@_cli.command()
+@click.option("--host", required=True, help="対象ホスト")
+@click.option("--kind", help="エラー分類で絞り込む（例: http_5xx, timeout）")
+def failures(host, kind):
+    """
+    デッドレターに移されたURLと再試行待ちの件数を表示する
+    """
+    from py_stream_scraper.retry import RetryQueue
+
+    queue = RetryQueue(_reader(host))
+    cnt = 0
+    for state in queue.dead_letters(kind):
+        cnt += 1
+        print(f"{state['kind']}\t{state['attempts']}\t{state['url']}\t{state['error']}")
+    pending = sum(1 for _ in queue.pending())
+    print(f"Dead: {cnt} urls, Retry pending: {pending} urls")
+
+
+@_cli.command()
+@click.option("--host", required=True, help="対象ホスト")
+@click.option("--top", default=20, show_default=True, help="表示するクラスタとパラメータの数")
+def dupes(host, top: int):
+    """
+    重複したページのクラスタと、URLの正規化で落とせそうなクエリパラメータを表示する
+    """
+    from py_stream_scraper.dedupe import DedupeIndex
+
+    index = DedupeIndex(_reader(host))
+    clusters = sorted(index.clusters().items(), key=lambda c: -len(c[1]))
+    for original, dups in clusters[:top]:
+        print(f"{len(dups)}\t{original}")
+        for url in dups[:5]:
+            print(f"\t{url}")
+    print(f"Clusters: {len(clusters)}, duplicates: {sum(len(d) for _, d in clusters)}")
+    for name, cnt in index.normalization_candidates()[:top]:
+        print(f"param\t{name}\t{cnt}")
+
+
+_CACHE_KINDS = click.Choice(["disk", "redis", "warc"])
+
+
+def _open_cache(kind: str, cache_dir: Optional[str]):
+    from py_stream_scraper.cache import DiskCache, RedisCache
+
+    if kind == "redis":
+        import redis
+
+        # 本文はバイト列なので decode_responses は使わない
+        return RedisCache(redis.Redis(host="localhost", port=6379))
+    if kind == "warc":
+        from py_stream_scraper.warc import WARCCache
+
+        if not cache_dir:
+            raise click.UsageError("--cache warc には --cache-dir が必要です")
+        return WARCCache(cache_dir)
+    return DiskCache(cache_dir)
+
+
+@_cli.group()
+def warc():
+    """
+    ページキャッシュを WARC で書き出す・読み込む
+    """
+
+
+@warc.command("export")
+@click.option("--host", required=True, help="対象ホスト（フロンティアのURLを書き出す）")
+@click.option("--cache", "cache_kind", type=_CACHE_KINDS, default="disk", show_default=True)
+@click.option("--cache-dir", help="DiskCache / WARCCache のディレクトリ")
+@click.argument("out")
+def warc_export(host, cache_kind: str, cache_dir: Optional[str], out: str):
+    """
+    フロンティアのURLのうちキャッシュにあるページを WARC に書き出す（OUT.cdxj にインデックス）
+
+    使い方:
+      sx warc export --host example.com --cache redis example.com.warc.gz
+    """
+    from py_stream_scraper.warc import export_cache
+
+    manager = _reader(host)
+
+    def urls():
+        for batch in manager.iter_batches(manager.lower, batch_size=10_000):
+            for _, url in batch:
+                url_str = url.decode("utf-8")
+                if url_str.startswith("/") or not url_str.startswith("http"):
+                    url_str = f"https://{host}{url_str}"
+                yield url_str
+
+    cache = _open_cache(cache_kind, cache_dir)
+    written, missing = export_cache(cache, urls(), out)
+    if hasattr(cache, "close"):
+        cache.close()
+    _log().print(f"exported {written} pages to {out} (not in cache: {missing})")
+
+
+@warc.command("import")
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--cache", "cache_kind", type=_CACHE_KINDS, default="disk", show_default=True)
+@click.option("--cache-dir", help="DiskCache / WARCCache のディレクトリ")
+@click.option("--host", help="このホストのURLをフロンティアにも追加する")
+def warc_import(paths, cache_kind: str, cache_dir: Optional[str], host: Optional[str]):
+    """
+    WARC の 200 のレスポンスをキャッシュに読み込む（scrape の READ_THROUGH / CACHE_ONLY で再生できる）
+
+    使い方:
+      sx warc import --cache redis --host example.com example.com.warc.gz
+    """
+    from py_stream_scraper.url_manager import DiskURLManager
+    from py_stream_scraper.warc import import_warc
+
+    cache = _open_cache(cache_kind, cache_dir)
+    manager = DiskURLManager(host) if host else None
+    total = added = 0
+    for path in paths:
+        urls = import_warc(path, cache)
+        total += len(urls)
+        if manager is not None:
+            added += manager.add_urls(u for u in urls if urlparse(u).hostname == host)
+    if hasattr(cache, "close"):
+        cache.close()
+    _log().print(f"imported {total} pages ({added} new urls)")
+
+
+@_cli.command()
+@click.option("--host", required=True, help="対象ホスト")
+@click.option("--kind", help="このエラー分類のものだけを戻す（例: http_5xx）")
+def retry(host, kind):
+    """
+    デッドレターのURLを再試行キューに戻す（次の scrape で最初に取得される）
+    """
+    from py_stream_scraper.retry import RetryQueue
+    from py_stream_scraper.url_manager import DiskURLManager
+
+    queue = RetryQueue(DiskURLManager(host))
+    cnt = queue.requeue_dead(kind)
+    _log().print(f"requeued {cnt} urls")
+
+
+@_cli.command()
+@click.option("--host", "hosts", multiple=True, required=True, help="対象ホスト（複数指定可）")
+@click.option("--window", default=60.0, show_default=True, help="ack レートを計算する期間（秒）")
+@click.option("--json", "as_json", is_flag=True, help="JSON で出力する")
+@click.option("--shards", default=1, show_default=True, help="配信ストリームのシャード数")
+@click.option(
+    "--serve",
+    "serve_port",
+    type=int,
+    help="このポートで /status/{host} を JSON で公開し続ける（オートスケーラー用）",
+)
+def status(hosts, window: float, as_json: bool, shards: int, serve_port: Optional[int]):
+    """
+    配信ストリームのバックログ、lag、pending、ack レート、処理完了までの推定時間を表示する
+    """
+    import time
+
+    import redis
+    from rich.console import Console
+    from rich.table import Table
+
+    from py_stream_scraper import status as status_mod
+
+    client = redis.Redis(host="localhost", port=6379, decode_responses=True)
+    if serve_port is not None:
+        status_mod.serve(client, hosts, window, port=serve_port, shards=shards)
+        _log().print(f"serving stream status on :{serve_port}/status")
+        while True:
+            time.sleep(3600)
+
+    results = [
+        status_mod.stream_status(client, h, window, shards=shards) for h in hosts
+    ]
+    if as_json:
+        data = {r.host: r.to_dict() for r in results}
+        click.echo(json.dumps(data, ensure_ascii=False))
+        return
+
+    def _secs(v):
+        return "-" if v is None else f"{v:.0f}s"
+
+    table = Table()
+    for col in ("host", "length", "lag", "pending", "oldest", "ack/s", "eta", "dead"):
+        table.add_column(col, justify="left" if col == "host" else "right")
+    for r in results:
+        table.add_row(
+            r.host,
+            str(r.length),
+            "-" if r.lag is None else str(r.lag),
+            str(r.pending),
+            _secs(r.oldest_pending_age),
+            f"{r.ack_rate:.2f}",
+            _secs(r.eta_seconds),
+            str(r.dead_letters),
+        )
+    Console().print(table)
+
+    consumers = Table("host", "consumer", "pending", "idle")
+    for r in results:
+        for name, c in r.consumers.items():
+            consumers.add_row(r.host, name, str(c.pending), _secs(c.idle_seconds))
+    if consumers.row_count:
+        Console().print(consumers)
+
+    if shards > 1:
+        per_shard = Table("host", "stream", "length", "lag", "pending")
+        for r in results:
+            for name, sh in r.shards.items():
+                per_shard.add_row(
+                    r.host,
+                    name,
+                    str(sh.length),
+                    "-" if sh.lag is None else str(sh.lag),
+                    str(sh.pending),
+                )
+        Console().print(per_shard)
 
 
 # ---------------- scrape ----------------
 @_cli.command()
-@click.argument("klass", required=True)
-def scrape(klass: str):
+@click.argument("klass", nargs=-1, required=True)
+@click.option(
+    "--metrics-port", type=int, help="指定したポートで /metrics（Prometheus形式）を公開する"
+)
+@click.option(
+    "--shard",
+    envvar="SX_SHARD",
+    help="i/N の形式で指定すると、URLのハッシュで i 番目のシャードだけを取得する（例: 0/4）",
+)
+@click.option(
+    "--follow",
+    is_flag=True,
+    help="stdin（なければ discover_urls）からURLを追加しながら、追加されたそばから取得する",
+)
+@click.option(
+    "--procs",
+    type=int,
+    help="N 個のワーカープロセスで取得する（フロンティアをURLのハッシュで N 個に分ける）",
+)
+def scrape(
+    klass: tuple,
+    metrics_port: Optional[int],
+    shard: Optional[str],
+    follow: bool,
+    procs: Optional[int],
+):
     """
     使い方:
       # 1) 事前に class discover を行ってURLManagerにURLがある場合
@@ -204,28 +559,204 @@ def scrape(klass: str):
 
       # 2) discover --from の結果をパイプで投入してから実行したい場合
       sx discover --from sitemap https://.../sitemap.xml | sx scrape module.ClassName
+
+      # 3) 複数ホストを1プロセスでまとめて実行する場合
+      sx scrape module.ClassA module.ClassB
+
+      # 4) 収集と取得を並行に行う場合（stdin がなければ discover_urls を並行に実行する）
+      sx discover --from sitemap https://.../sitemap.xml | sx scrape --follow module.ClassName
+
+      # 5) 1台の複数のコアで取得する場合（qps は全プロセスの合計）
+      sx scrape --procs 8 module.ClassName
     """
-    Cls = load_class(klass)
-    inst = Cls()
+    if procs is not None and (len(klass) != 1 or follow or shard):
+        raise click.UsageError(
+            "--procs はクラスを1つだけ指定し、--follow・--shard とは併用しないでください"
+        )
+
+    if metrics_port:
+        from py_stream_scraper import metrics
+
+        metrics.serve(metrics_port)
+        _log().print(f"metrics: http://localhost:{metrics_port}/metrics")
+
+    insts = [load_class(k)() for k in klass]
+    by_host = {inst.host: inst for inst in insts}
+
+    if shard:
+        try:
+            shard_id, num_shards = (int(x) for x in shard.split("/", 1))
+            for inst in insts:
+                inst.url_manager.set_shard(shard_id, num_shards)
+        except ValueError:
+            raise click.BadParameter(
+                "0 <= i < N となる i/N の形式で指定してください", param_hint="--shard"
+            )
+
+    if follow:
+        if len(insts) != 1:
+            raise click.UsageError("--follow はクラスを1つだけ指定してください")
+        source = None if sys.stdin.isatty() else sys.stdin
+        _log().rule("[bold green]scrape(follow)")
+        insts[0].scrape_follow(source, progress=True)
+        return
 
     # stdin からURLが来ているなら URLManager に積む
     if not sys.stdin.isatty():
-        with Progress(
-            SpinnerColumn(), TextColumn("{task.description}"), console=log
-        ) as p:
+        with _spinner() as p:
             t = p.add_task("enqueue urls → URLManager", start=True)
             enq = 0
             for line in sys.stdin:
                 u = line.strip()
                 if u:
+                    # 複数クラス指定時はURLのホストで振り分ける
+                    inst = by_host.get(urlparse(u).netloc, insts[0])
                     # Scraper 実装に合わせる（url_managerはpy_stream_scraper.Scraperにある想定）
                     inst.url_manager.add_url(u)
                     enq += 1
             p.update(t, description=f"enqueued {enq} urls")
 
+    if procs is not None:
+        _log().rule(f"[bold green]scrape({procs} procs)")
+        insts[0].scrape_procs(procs, progress=True)
+        return
+
     # 実行（ユーザー実装の scrape(progress=True) をそのまま呼ぶ）
-    log.rule("[bold green]scrape(progress=True)")
-    inst.scrape(progress=True)
+    if len(insts) == 1:
+        _log().rule("[bold green]scrape(progress=True)")
+        insts[0].scrape(progress=True)
+        return
+
+    from py_stream_scraper.multi_host import MultiHostScraper
+
+    _log().rule(f"[bold green]scrape {len(insts)} hosts")
+    MultiHostScraper(insts).scrape(progress=True)
+
+
+# ---------------- profile ----------------
+@_cli.command()
+@click.argument("klass")
+@click.option("-n", "--num", default=20, show_default=True, help="計測するURL数")
+@click.option(
+    "--source",
+    type=click.Choice(["live", "cache"]),
+    default="live",
+    show_default=True,
+    help="live: フロンティアのURLを実際に取得する / cache: DiskCache のページを使う",
+)
+@click.option(
+    "--profiler",
+    type=click.Choice(["cprofile", "pyinstrument"]),
+    default="cprofile",
+    show_default=True,
+    help="parse のプロファイラ",
+)
+@click.option("--top", default=20, show_default=True, help="表示する関数の数")
+def profile(klass: str, num: int, source: str, profiler: str, top: int):
+    """
+    N件のURLを処理してステージ別の所要時間と parse のプロファイルを表示する
+
+    カーソルは進めず、パース結果はシンクに書き込まない。recrawl・再試行キュー・dedupe の
+    状態も記録しない。
+
+    使い方:
+      sx profile module.ClassName -n 50
+      sx profile module.ClassName --source cache --profiler pyinstrument
+    """
+    import itertools
+
+    import brotli
+    from rich.table import Table
+
+    from py_stream_scraper.cache import DiskCache
+    from py_stream_scraper.http_client import decode_body
+    from py_stream_scraper.sink import NullSink
+    from py_stream_scraper.tracing import TimingTracer
+
+    scraper = load_class(klass)()
+    tracer = TimingTracer()
+    scraper.tracer = tracer
+    scraper.sink = NullSink()
+    # 再取得の予定・再試行キュー・重複の索引を書き換えると次の本番の実行が変わるので使わない
+    scraper.recrawl = scraper.retry_queue = scraper.dedupe = None
+
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise click.UsageError("pyinstrument がインストールされていません")
+        prof = Profiler()
+        start, stop = prof.start, prof.stop
+    else:
+        import cProfile
+
+        prof = cProfile.Profile()
+        start, stop = prof.enable, prof.disable
+
+    parse = scraper.parse
+
+    def profiled_parse(url, html):
+        start()
+        try:
+            return parse(url, html)
+        finally:
+            stop()
+
+    scraper.parse = profiled_parse
+
+    cache = DiskCache() if source == "cache" else None
+    processed = missing = 0
+    targets = scraper._iter_targets(scraper.url_manager.lower)
+    for key, url, _ in itertools.islice(targets, num):
+        url_str = url.decode("utf-8")
+        if url_str.startswith("/") or not url_str.startswith("http"):
+            url_str = f"https://{scraper.host}{url_str}"
+
+        if cache is None:
+            scraper._fetch_one_sync(
+                scraper.http.session, key, url_str, advance_cursor=False
+            )
+        else:
+            try:
+                with tracer.span("cache_read", url_str):
+                    raw, content_type = cache.read_with_content_type(url_str)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            with tracer.span("decompress", url_str):
+                body = brotli.decompress(raw)
+            html = decode_body(body, scraper._cached_content_type(content_type))
+            scraper._parse_and_write(url_str, html)
+        processed += 1
+
+    summary = tracer.summary()
+    grand_total = sum(v["total"] for v in summary.values()) or 1.0
+    table = Table(title=f"{scraper.host}: {processed} urls ({source})")
+    for col in ("stage", "count", "total ms", "mean ms", "p50 ms", "p95 ms", "share"):
+        table.add_column(col, justify="left" if col == "stage" else "right")
+    for stage, v in summary.items():
+        table.add_row(
+            stage,
+            str(v["count"]),
+            f"{v['total'] * 1000:.1f}",
+            f"{v['mean'] * 1000:.2f}",
+            f"{v['p50'] * 1000:.2f}",
+            f"{v['p95'] * 1000:.2f}",
+            f"{v['total'] / grand_total:.0%}",
+        )
+    _log().print(table)
+    if missing:
+        _log().print(f"not in cache: {missing} urls")
+
+    if "parse" not in summary:
+        return
+    _log().rule("[bold green]parse profile")
+    if profiler == "pyinstrument":
+        print(prof.output_text())
+    else:
+        import pstats
+
+        pstats.Stats(prof, stream=sys.stdout).sort_stats("cumulative").print_stats(top)
 
 
 def main():
@@ -0,0 +1,284 @@
+"""
+サイト内のリンクをたどって取得対象のURLを集める非同期クロールエンジン
+
+シードのURLから一覧ページ（ページ送りなど）をたどり、詳細ページへのリンクを
+フロンティア（DiskURLManager）に追加する。
+
+    spec = CrawlSpec(
+        seeds=[f"https://baito.nights.fun/A{i:02d}/job-list/" for i in range(1, 31)],
+        follow=["ul.pagination"],
+        detail=["a.anothertab"],
+        allow=[r"^/A\\d+/"],
+    )
+
+    class MyScraper(Scraper):
+        crawl_spec = spec  # discover_urls がこの仕様でクロールする
+
+- 一覧ページの取得はスクレイパーと同じレートリミッタを使う（qps を共有する）
+- 同じページは一度しか取得しない。フロンティアにすでにあるURLは追加しない
+- 詳細ページのURLは batch_size 件ごとに WriteBatch でまとめて書き込む
+
+セレクタは lxml があれば XPath にコンパイルして使い、なければ BeautifulSoup で評価する。
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import aiohttp
+
+from .http_client import decode_body
+from .log import subsystem_logger
+
+try:
+    from cssselect import GenericTranslator
+    from lxml import etree
+except ImportError:  # pragma: no cover - 任意の依存
+    etree = None
+
+_log = subsystem_logger("crawl")
+
+
+@dataclass(frozen=True)
+class CrawlSpec:
+    """
+    クロールの仕様
+
+    Attributes:
+        seeds: 最初に取得するURL
+        follow: たどる一覧ページへのリンクの CSS セレクタ（a 以外の要素なら中の a をすべて使う）
+        detail: フロンティアに追加するリンクの CSS セレクタ（省略時はページ内のすべての a）
+        allow: パス（?クエリを含む）がどれかに一致するリンクだけを使う（省略時はすべて）
+        deny: パスがどれかに一致するリンクは使わない
+        max_depth: シードからたどる一覧ページの深さの上限
+        max_pages: 取得する一覧ページ数の上限
+        batch_size: フロンティアにまとめて書き込む件数
+    """
+
+    seeds: Sequence[str]
+    follow: Sequence[str] = ()
+    detail: Sequence[str] = ()
+    allow: Sequence[str] = ()
+    deny: Sequence[str] = ()
+    max_depth: int = 3
+    max_pages: Optional[int] = None
+    batch_size: int = 500
+
+
+@dataclass
+class CrawlStats:
+    pages: int = 0  # 取得した一覧ページ数
+    failed: int = 0  # 取得に失敗した一覧ページ数
+    links: int = 0  # 見つけた詳細ページのURL数（重複を除く）
+    added: int = 0  # フロンティアに新しく追加したURL数
+
+
+class LinkExtractor:
+    """
+    HTML からたどるリンクと詳細ページのリンクの href を取り出す
+    """
+
+    def __init__(self, follow: Sequence[str], detail: Sequence[str]):
+        # 詳細ページのセレクタがなければすべての a を対象にする
+        self._selectors = (tuple(follow), tuple(detail) or ("a",))
+        if etree is not None:
+            translator = GenericTranslator()
+            self._compiled = tuple(
+                [etree.XPath(translator.css_to_xpath(s)) for s in selectors]
+                for selectors in self._selectors
+            )
+            self._hrefs = etree.XPath("descendant::a/@href")
+            self._parser = etree.HTMLParser(encoding="utf-8")
+        else:
+            import soupsieve
+
+            self._compiled = tuple(
+                [soupsieve.compile(s) for s in selectors]
+                for selectors in self._selectors
+            )
+
+    def extract(self, html: str) -> Tuple[List[str], List[str]]:
+        """
+        (たどるリンク, 詳細ページのリンク) の href を返す
+        """
+        if etree is not None:
+            root = etree.HTML(html.encode("utf-8"), self._parser)
+            if root is None:
+                return [], []
+            return tuple(self._lxml_hrefs(root, xps) for xps in self._compiled)
+
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        return tuple(self._bs4_hrefs(soup, sels) for sels in self._compiled)
+
+    def _lxml_hrefs(self, root, xpaths) -> List[str]:
+        hrefs = []
+        for xp in xpaths:
+            for el in xp(root):
+                href = el.get("href")
+                if href is not None:
+                    hrefs.append(href)
+                else:
+                    hrefs.extend(self._hrefs(el))
+        return hrefs
+
+    def _bs4_hrefs(self, soup, selectors) -> List[str]:
+        hrefs = []
+        for sel in selectors:
+            for el in sel.select(soup):
+                if el.has_attr("href"):
+                    hrefs.append(el["href"])
+                else:
+                    hrefs.extend(a["href"] for a in el.find_all("a", href=True))
+        return hrefs
+
+
+class Crawler:
+    """
+    CrawlSpec にしたがって一覧ページを並行に取得し、詳細ページのURLをフロンティアに追加する
+
+    同時に取得するページ数は scraper.max_concurrency まで。
+    """
+
+    def __init__(self, scraper, spec: CrawlSpec):
+        self.scraper = scraper
+        self.spec = spec
+        self.url_manager = scraper.url_manager
+        self.extractor = LinkExtractor(spec.follow, spec.detail)
+        self._allow = [re.compile(p) for p in spec.allow]
+        self._deny = [re.compile(p) for p in spec.deny]
+        self.stats = CrawlStats()
+        self._visited = set()
+        self._seen = set()
+        self._pending: List[str] = []
+
+    def _allowed(self, url: str) -> bool:
+        p = urlparse(url)
+        if p.scheme not in ("http", "https") or p.hostname != self.scraper.host:
+            return False
+        target = (p.path or "/") + ("?" + p.query if p.query else "")
+        if any(rx.search(target) for rx in self._deny):
+            return False
+        return not self._allow or any(rx.search(target) for rx in self._allow)
+
+    def _resolve(self, base: str, hrefs: Sequence[str]):
+        for href in hrefs:
+            try:
+                url = urldefrag(urljoin(base, href.strip()))[0]
+                allowed = self._allowed(url)
+            except ValueError:
+                # http://[broken/ のような解釈できない URL は飛ばす
+                _log.debug("invalid link: %r on %s", href, base)
+                continue
+            if allowed:
+                yield url
+
+    def _enqueue(self, queue: asyncio.Queue, url: str, depth: int):
+        if url in self._visited:
+            return
+        if self.spec.max_pages is not None and len(self._visited) >= self.spec.max_pages:
+            return
+        self._visited.add(url)
+        queue.put_nowait((url, depth))
+
+    def _add(self, url: str):
+        if url in self._seen:
+            return
+        self._seen.add(url)
+        self.stats.links += 1
+        self._pending.append(url)
+        if len(self._pending) >= self.spec.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        たまっている詳細ページのURLをフロンティアに書き込む
+        """
+        if self._pending:
+            self.stats.added += self.url_manager.add_urls(self._pending)
+            self._pending = []
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str):
+        """
+        (リダイレクト後のURL, HTML) を返す。失敗したら None
+        """
+        scraper = self.scraper
+        await scraper._wait_for_token(url)
+        started = time.monotonic()
+        try:
+            scraper.fetch_log.info("crawling: %s", url)
+            async with session.get(url, allow_redirects=True, timeout=15) as resp:
+                scraper._observe(resp.status, started, resp.headers.get("Retry-After"))
+                resp.raise_for_status()
+                body = await scraper.http.read_async(resp)
+                scraper.metrics.count("crawled", resp.status)
+                return str(resp.url), decode_body(body, resp.headers.get("Content-Type"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not isinstance(e, aiohttp.ClientResponseError):
+                scraper._observe(None, started)
+            status = e.status if isinstance(e, aiohttp.ClientResponseError) else None
+            scraper.metrics.count("crawl_failed", status)
+            _log.warning("crawl failed: %s (%s)", url, e)
+            self.stats.failed += 1
+            return None
+
+    async def _worker(self, session: aiohttp.ClientSession, queue: asyncio.Queue):
+        while True:
+            url, depth = await queue.get()
+            try:
+                fetched = await self._fetch(session, url)
+                if fetched is None:
+                    continue
+                base, html = fetched
+                follow, detail = self.extractor.extract(html)
+                for link in self._resolve(base, detail):
+                    self._add(link)
+                if depth < self.spec.max_depth:
+                    for link in self._resolve(base, follow):
+                        self._enqueue(queue, link, depth + 1)
+                self.stats.pages += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # ワーカーが止まると queue.join() が終わらないので、ページ単位で失敗にする
+                self.scraper.metrics.count("crawl_failed")
+                _log.warning("crawl failed: %s (%r)", url, e)
+                self.stats.failed += 1
+            finally:
+                queue.task_done()
+
+    async def run(self, ssl: bool = True) -> CrawlStats:
+        scraper = self.scraper
+        queue: asyncio.Queue = asyncio.Queue()
+        for seed in self.spec.seeds:
+            self._enqueue(queue, seed, 0)
+
+        connector = scraper.http.connector(limit_per_host=scraper.max_concurrency, ssl=ssl)
+        async with aiohttp.ClientSession(
+            connector=connector, headers=scraper.headers
+        ) as session:
+            workers = [
+                asyncio.create_task(self._worker(session, queue))
+                for _ in range(scraper.max_concurrency)
+            ]
+            try:
+                await queue.join()
+            finally:
+                for w in workers:
+                    w.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                self.flush()
+
+        _log.info(
+            "crawled %d pages (%d failed), %d links, %d new urls",
+            self.stats.pages,
+            self.stats.failed,
+            self.stats.links,
+            self.stats.added,
+        )
+        return self.stats
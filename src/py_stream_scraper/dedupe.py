@@ -0,0 +1,238 @@
+"""
+取得したページの重複（完全一致・ほぼ一致）を検出するモジュール
+
+ページごとに次の2つを計算し、ホストごとのインデックスを RocksDB に保持する。
+
+- 指紋: 空白をならした本文の blake2b。並び順やセッションのパラメータだけが違うURLや、
+  200 を返す soft-404 ページのような完全一致を見つける
+- SimHash: テキストノードを特徴量にした 64bit の SimHash。広告や日時だけが違うページの
+  ようなほぼ一致を、ハミング距離で見つける
+
+ほぼ一致の検索は 64bit を 16bit ずつ4つの帯に分けて行う。ハミング距離が3以下なら
+どれかの帯は必ず一致するので、帯ごとの前方一致の走査で候補を絞り込める。
+
+見つけた重複はクラスタとして記録し、normalization_candidates() でURLの正規化で
+落とせそうなクエリパラメータを集計できる（sx dupes --host で表示する）。
+
+キーの構成:
+    {host}:dedupe:fp\\x00{指紋}                          -> 最初に取得したURL
+    {host}:dedupe:sh\\x00{帯}{帯の値:04x}{simhash:016x}  -> 最初に取得したURL
+    {host}:dedupe:dup\\x00{元のURL}\\x00{重複したURL}     -> exact / near:{距離}
+"""
+import enum
+import hashlib
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlparse
+
+import rocksdbpy
+
+from .url_manager import DiskURLManager
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+_MASK = (1 << BITS) - 1
+
+_SCRIPT = re.compile(rb"<(script|style|noscript)\b.*?</\1\s*>", re.S | re.I)
+_TAG = re.compile(rb"<[^>]*>")
+_WS = re.compile(rb"\s+")
+
+
+class DedupeMode(enum.Enum):
+    """
+    重複したページの扱い
+
+    EXACT: 本文が完全に一致するページだけを重複として parse・キャッシュ・シンクを飛ばす
+    NEAR: SimHash のハミング距離が max_distance 以下のページも重複として飛ばす
+    """
+
+    EXACT = "exact"
+    NEAR = "near"
+
+
+@dataclass(frozen=True)
+class Duplicate:
+    url: str  # 元のページ（最初に取得したURL）
+    kind: str  # exact / near
+    distance: int = 0
+
+
+def _as_bytes(content: Union[str, bytes]) -> bytes:
+    return content.encode("utf-8") if isinstance(content, str) else content
+
+
+def fingerprint(content: Union[str, bytes]) -> bytes:
+    """
+    空白の違いを無視した本文の指紋（16バイト）
+    """
+    return hashlib.blake2b(
+        _WS.sub(b" ", _as_bytes(content)).strip(), digest_size=16
+    ).digest()
+
+
+def text_features(content: Union[str, bytes]) -> Counter:
+    """
+    script/style を除いたテキストノードを、空白をならして数える
+    """
+    body = _SCRIPT.sub(b" ", _as_bytes(content))
+    features = Counter()
+    for node in _TAG.split(body):
+        node = _WS.sub(b" ", node).strip()
+        if node:
+            features[node] += 1
+    return features
+
+
+def simhash(content: Union[str, bytes]) -> int:
+    """
+    テキストノードを特徴量（長さで重み付け）にした 64bit の SimHash
+    """
+    weights = [0] * BITS
+    for node, count in text_features(content).items():
+        h = int.from_bytes(hashlib.blake2b(node, digest_size=8).digest(), "big")
+        w = count * len(node)
+        for i in range(BITS):
+            if h >> i & 1:
+                weights[i] += w
+            else:
+                weights[i] -= w
+    value = 0
+    for i, w in enumerate(weights):
+        if w > 0:
+            value |= 1 << i
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & _MASK).bit_count()
+
+
+class DedupeIndex:
+    """
+    ホストごとの重複検出のインデックス（フロンティアと同じ RocksDB に保存する）
+
+    check() は登録と検索を同時に行う。スレッドから同時に呼んでもよい。
+    """
+
+    def __init__(
+        self,
+        url_manager: DiskURLManager,
+        mode: DedupeMode = DedupeMode.EXACT,
+        max_distance: int = 3,
+    ):
+        """
+        Args:
+            url_manager: 対象ホストの DiskURLManager（同じ RocksDB を共有する）
+            mode: 重複として扱う範囲
+            max_distance: NEAR でほぼ一致とみなす SimHash のハミング距離（BANDS - 1 以下）
+        """
+        if not 0 <= max_distance < BANDS:
+            raise ValueError(f"max_distance must be in [0, {BANDS})")
+
+        self.url_manager = url_manager
+        self.db = url_manager.db
+        self.host = url_manager.host
+        self.mode = mode
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+
+        self.fp_prefix = f"{self.host}:dedupe:fp\x00".encode("utf-8")
+        self.sh_prefix = f"{self.host}:dedupe:sh\x00".encode("utf-8")
+        self.dup_prefix = f"{self.host}:dedupe:dup\x00".encode("utf-8")
+
+    def _band_prefix(self, band: int, value: int) -> bytes:
+        part = value >> (band * BAND_BITS) & ((1 << BAND_BITS) - 1)
+        return self.sh_prefix + f"{band}{part:04x}".encode("ascii")
+
+    def _near(self, value: int) -> Optional[Tuple[str, int]]:
+        best = None
+        for band in range(BANDS):
+            prefix = self._band_prefix(band, value)
+            for key, url in self.db.iterator(mode="from", key=prefix):
+                if not key.startswith(prefix):
+                    break
+                d = hamming(value, int(key[len(prefix) :], 16))
+                if d <= self.max_distance and (best is None or d < best[1]):
+                    best = (url.decode("utf-8"), d)
+        return best
+
+    def check(self, url: str, content: Union[str, bytes]) -> Optional[Duplicate]:
+        """
+        content が既に取得したページの重複なら Duplicate を返し、重複として記録する
+
+        重複でなければこのページを元のページとして登録して None を返す。
+        同じURLを取り直した場合（再クロールなど）は重複として扱わない。
+        """
+        content = _as_bytes(content)
+        fp_key = self.fp_prefix + fingerprint(content)
+        value = simhash(content) if self.mode == DedupeMode.NEAR else None
+        encoded = url.encode("utf-8")
+
+        with self._lock:
+            original = self.db.get(fp_key)
+            if original is not None and original != encoded:
+                self._record(original, encoded, b"exact")
+                return Duplicate(original.decode("utf-8"), "exact")
+
+            if value is not None:
+                near = self._near(value)
+                if near is not None and near[0] != url:
+                    kind = f"near:{near[1]}".encode("ascii")
+                    self._record(near[0].encode("utf-8"), encoded, kind)
+                    return Duplicate(near[0], "near", near[1])
+
+            batch = rocksdbpy.WriteBatch()
+            batch.add(fp_key, encoded)
+            if value is not None:
+                suffix = f"{value:016x}".encode("ascii")
+                for band in range(BANDS):
+                    batch.add(self._band_prefix(band, value) + suffix, encoded)
+            self.db.write(batch)
+        return None
+
+    def _record(self, original: bytes, duplicate: bytes, kind: bytes):
+        self.db.set(self.dup_prefix + original + b"\x00" + duplicate, kind)
+
+    def duplicates(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        記録した重複を (元のURL, 重複したURL, exact / near:{距離}) で返す
+        """
+        for key, kind in self.db.iterator(mode="from", key=self.dup_prefix):
+            if not key.startswith(self.dup_prefix):
+                break
+            original, _, duplicate = key[len(self.dup_prefix) :].partition(b"\x00")
+            yield (
+                original.decode("utf-8"),
+                duplicate.decode("utf-8"),
+                kind.decode("utf-8"),
+            )
+
+    def clusters(self) -> Dict[str, List[str]]:
+        """
+        元のURLごとに、重複したURLのリストを返す
+        """
+        out = defaultdict(list)
+        for original, duplicate, _ in self.duplicates():
+            out[original].append(duplicate)
+        return dict(out)
+
+    def normalization_candidates(self) -> List[Tuple[str, int]]:
+        """
+        URLの正規化で落とせそうなクエリパラメータを、重複の組で値が違った回数の多い順に返す
+
+        パスが同じでクエリだけが違う重複の組について、値が違う（片方にしかない）パラメータを数える。
+        """
+        counts = Counter()
+        for original, duplicate, _ in self.duplicates():
+            a, b = urlparse(original), urlparse(duplicate)
+            if a.path != b.path:
+                continue
+            qa, qb = dict(parse_qsl(a.query, True)), dict(parse_qsl(b.query, True))
+            for name in set(qa) | set(qb):
+                if qa.get(name) != qb.get(name):
+                    counts[name] += 1
+        return counts.most_common()
@@ -0,0 +1,248 @@
+"""
+宣言的な抽出仕様（スキーマ）で HTML から1行分の dict を取り出すモジュール
+
+BeautifulSoup（html.parser）で table をたどって th/td を組にする処理を、
+セレクタと列の対応だけで書けるようにする。セレクタは Schema を作るときに一度だけ
+XPath にコンパイルし、解析は C 実装の lxml で行う。
+
+    schema = Schema(
+        columns=["URL", "都道府県", "店名", "所在地"],
+        fields=[Field("都道府県", css="#header_area_name")],
+        pairs=[Pairs("table.basic_information_table", value_css={"所在地": "div.address"})],
+    )
+
+    class MyScraper(Scraper):
+        schema = schema  # parse を書かなくてよい
+
+lxml と cssselect が必要（pip install "py-stream-scraper[lxml]"）。
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from .http_client import decode_body
+
+try:
+    from cssselect import GenericTranslator
+    from lxml import etree
+except ImportError:  # pragma: no cover - 任意の依存
+    etree = None
+
+# 値を受け取って加工した値を返す関数
+PostProcessor = Callable[[Any], Any]
+
+
+def _require_lxml():
+    if etree is None:
+        raise ImportError(
+            "py_stream_scraper.extract requires lxml and cssselect "
+            '(pip install "py-stream-scraper[lxml]")'
+        )
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    1つの列の取り出し方
+
+    Attributes:
+        name: 列名
+        css: CSS セレクタ（css と xpath のどちらかを指定する）
+        xpath: XPath
+        attr: 属性の値を取り出す（省略時は要素のテキスト）
+        many: True ならすべての一致をリストで返す（省略時は最初の一致）
+        default: 一致しなかったときの値
+        post: 値に順に適用する関数
+    """
+
+    name: str
+    css: Optional[str] = None
+    xpath: Optional[str] = None
+    attr: Optional[str] = None
+    many: bool = False
+    default: Any = ""
+    post: Tuple[PostProcessor, ...] = ()
+
+
+@dataclass(frozen=True)
+class Pairs:
+    """
+    見出しと値の組（th/td など）を列名と値として取り出す
+
+    Attributes:
+        css: 対象の要素（table など）の CSS セレクタ
+        row: 組を含む要素（row 内で最初の key と value を組にする）
+        key: 見出しの要素
+        value: 値の要素
+        value_css: 見出しごとに値の要素内をさらに絞り込む CSS セレクタ（一致しなければ値の要素全体）
+        rename: 見出しから列名への対応
+        post: 値に順に適用する関数
+    """
+
+    css: str
+    row: str = "tr"
+    key: str = "th"
+    value: str = "td"
+    value_css: Dict[str, str] = field(default_factory=dict)
+    rename: Dict[str, str] = field(default_factory=dict)
+    post: Tuple[PostProcessor, ...] = ()
+
+
+def text(el) -> str:
+    """
+    要素内のテキストを、各断片の前後の空白を除いてつなげる（BeautifulSoup の get_text(strip=True) 相当）
+    """
+    return "".join(t.strip() for t in el.itertext())
+
+
+def collapse_whitespace(value: str) -> str:
+    return " ".join(value.split())
+
+
+def regex(pattern: str, group: int = 1, default: str = "") -> PostProcessor:
+    """
+    pattern に一致した group を返す後処理を作る
+    """
+    compiled = re.compile(pattern)
+
+    def _post(value):
+        m = compiled.search(value)
+        return m.group(group) if m else default
+
+    return _post
+
+
+def digits(value: str) -> str:
+    """
+    数字だけを残す（電話番号、郵便番号など）
+    """
+    return re.sub(r"\D", "", value)
+
+
+class Schema:
+    """
+    コンパイル済みの抽出仕様
+
+    extract() は columns の順に列を並べ、一致しなかった列は "" のままにする。
+    Pairs の見出しは columns に含まれるものだけを取り出す（columns を省略した場合はすべて）。
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[Field] = (),
+        pairs: Sequence[Pairs] = (),
+        columns: Optional[Sequence[str]] = None,
+        url_field: Optional[str] = "URL",
+    ):
+        """
+        Args:
+            fields: 列ごとの取り出し方
+            pairs: 見出しと値の組の取り出し方
+            columns: 出力する列（省略時は url_field と fields の列）
+            url_field: 取得したURLを入れる列（None なら入れない）
+        """
+        _require_lxml()
+        self.url_field = url_field
+        # columns を省略した場合は Pairs で見つかった見出しをすべて列にする
+        self._select_all = columns is None
+        if columns is None:
+            columns = ([url_field] if url_field else []) + [f.name for f in fields]
+        self.columns = tuple(columns)
+        self._keep = set(self.columns)
+
+        self._translator = GenericTranslator()
+        self._fields = [(f, self._compile(f.css, f.xpath)) for f in fields]
+        self._pairs = [
+            (
+                p,
+                self._compile(p.css),
+                self._compile(p.row, relative=True),
+                self._compile(p.key, relative=True),
+                self._compile(p.value, relative=True),
+                {k: self._compile(v, relative=True) for k, v in p.value_css.items()},
+            )
+            for p in pairs
+        ]
+        self._local = threading.local()
+
+    def _compile(self, css: Optional[str], xpath: Optional[str] = None, relative=False):
+        if xpath is None:
+            if css is None:
+                raise ValueError("either css or xpath is required")
+            prefix = "descendant::" if relative else "descendant-or-self::"
+            xpath = self._translator.css_to_xpath(css, prefix=prefix)
+        return etree.XPath(xpath)
+
+    def _parser(self):
+        # lxml のパーサーはスレッド間で共有しない
+        parser = getattr(self._local, "parser", None)
+        if parser is None:
+            parser = self._local.parser = etree.HTMLParser()
+        return parser
+
+    def parse_html(self, html):
+        """
+        HTML（str か bytes）を lxml の要素にする（空の文書なら None）
+
+        bytes は decode_body と同じく meta タグの charset（なければ UTF-8）でデコードし、
+        lxml には str を渡す。
+        """
+        if isinstance(html, bytes):
+            html = decode_body(html)
+        return etree.HTML(html, self._parser())
+
+    def extract(self, html, url: Optional[str] = None) -> Dict[str, Any]:
+        row = dict.fromkeys(self.columns, "")
+        if self.url_field:
+            row[self.url_field] = url
+        root = self.parse_html(html)
+
+        for f, xp in self._fields:
+            row[f.name] = self._field_value(f, xp(root) if root is not None else [])
+
+        if root is None:
+            return row
+        for p, table_xp, row_xp, key_xp, value_xp, value_css in self._pairs:
+            for table in table_xp(root):
+                for tr in row_xp(table):
+                    keys = key_xp(tr)
+                    values = value_xp(tr)
+                    if not keys or not values:
+                        continue
+                    key = text(keys[0])
+                    name = p.rename.get(key, key)
+                    if not self._select_all and name not in self._keep:
+                        continue
+                    value_el = values[0]
+                    if key in value_css:
+                        narrowed = value_css[key](value_el)
+                        if narrowed:
+                            value_el = narrowed[0]
+                    value = text(value_el)
+                    for post in p.post:
+                        value = post(value)
+                    row[name] = value
+        return row
+
+    def _field_value(self, f: Field, matches):
+        values = []
+        for m in matches:
+            if isinstance(m, str):
+                # XPath の text() や @attr の結果
+                value = str(m).strip()
+            elif f.attr is not None:
+                value = m.get(f.attr)
+                if value is None:
+                    continue
+                value = value.strip()
+            else:
+                value = text(m)
+            for post in f.post:
+                value = post(value)
+            values.append(value)
+            if not f.many:
+                break
+        if f.many:
+            return values
+        return values[0] if values else f.default
@@ -0,0 +1,316 @@
+"""
+同期・非同期のスクレイピングで共有する HTTP クライアント層
+
+requests.Session の接続プール（keep-alive）をプロセス内で使い回し、
+DNS の解決結果をキャッシュすることで、ページごとの TCP/TLS ハンドシェイクと
+名前解決をほぼなくす（非同期側は aiohttp のコネクタごとのキャッシュを使う。
+同期側のキャッシュはプロセス全体に効くので process_dns_cache=True のときだけ有効にする）。
+
+レスポンスボディはストリーミングで読み、サイズ上限を超えたら途中で打ち切る。
+Content-Type はボディを読む前に許可リストと照合し、デコードは宣言された
+charset（ヘッダーまたは meta タグ）で行う。
+"""
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class _DNSCache:
+    """
+    socket.getaddrinfo の結果を TTL 付きでキャッシュする
+
+    urllib3 は名前解決を差し替える口を持たないため、プロセス全体の
+    socket.getaddrinfo をラップする。install した HTTPClient がすべて
+    uninstall すると元に戻す。件数が max_entries を超えたら古いものから捨てる。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._original = None
+        self._users = 0
+        self.max_entries = max_entries
+        self.ttl = 0.0
+
+    @property
+    def installed(self) -> bool:
+        return self._original is not None
+
+    def install(self, ttl: float):
+        with self._lock:
+            self.ttl = max(self.ttl, ttl)
+            self._users += 1
+            if self._original is None:
+                self._original = socket.getaddrinfo
+                socket.getaddrinfo = self._getaddrinfo
+
+    def uninstall(self):
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users or self._original is None:
+                return
+            socket.getaddrinfo = self._original
+            self._original = None
+            self._entries.clear()
+            self.ttl = 0.0
+
+    def _getaddrinfo(self, *args, **kwargs):
+        key = args + tuple(sorted(kwargs.items()))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+            original = self._original or _SOCKET_GETADDRINFO
+
+        result = original(*args, **kwargs)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_SOCKET_GETADDRINFO = socket.getaddrinfo
+_DNS_CACHE = _DNSCache()
+
+_CHUNK_SIZE = 64 * 1024
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([a-zA-Z0-9_-]+)""", re.I)
+
+# 既定で受け付ける Content-Type（"/" で終わるものは前方一致）
+DEFAULT_CONTENT_TYPES = (
+    "text/",
+    "application/xhtml+xml",
+    "application/xml",
+    "application/json",
+)
+
+
+class ResponseRejected(Exception):
+    """
+    ボディを読む前後の検査で取り込まないと判断したレスポンス
+    """
+
+
+class ContentTypeNotAllowed(ResponseRejected):
+    pass
+
+
+class BodyTooLarge(ResponseRejected):
+    pass
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def charset_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset" and value.strip():
+            return value.strip().strip("\"'")
+    return None
+
+
+def decode_body(body: bytes, content_type: Optional[str] = None) -> str:
+    """
+    宣言された charset でボディをデコードする
+
+    Content-Type の charset、先頭 1024 バイト内の meta タグ、UTF-8 の順に使い、
+    文字コードの推測（chardet 等）は行わない。
+    """
+    charset = charset_from_content_type(content_type)
+    if charset is None:
+        m = _META_CHARSET.search(body[:1024])
+        if m:
+            charset = m.group(1).decode("ascii")
+    try:
+        return body.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+class HTTPClient:
+    """
+    接続プールを共有する HTTP クライアント
+
+    Scraper.scrape_sync と DistributedScraper.scrape_sync はこのクライアントの
+    セッションを使い回すため、バッチや実行をまたいでも接続が再利用される。
+    """
+
+    def __init__(
+        self,
+        headers: Optional[dict] = None,
+        pool_connections: int = 10,
+        pool_maxsize: Optional[int] = None,
+        keep_alive: bool = True,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: float = 300.0,
+        process_dns_cache: bool = False,
+        max_workers: int = 1,
+        timeout: float = 15.0,
+        verify: bool = True,
+        max_body_bytes: Optional[int] = 20 * 1024 * 1024,
+        allowed_content_types: Optional[Iterable[str]] = DEFAULT_CONTENT_TYPES,
+    ):
+        """
+        Args:
+            headers: すべてのリクエストに付けるヘッダー
+            pool_connections: 接続プールを保持するホスト数
+            pool_maxsize: ホストごとに保持する接続数（省略時は max(10, max_workers)）
+            keep_alive: 接続を使い回すかどうか
+            keepalive_timeout: 非同期側で未使用の接続を保持する秒数
+            dns_cache_ttl: 名前解決結果をキャッシュする秒数（0で無効）
+            process_dns_cache: 同期（requests）側でも名前解決をキャッシュする。
+                プロセス全体の socket.getaddrinfo を置き換えるので、Redis など他の接続にも効く
+                （close で元に戻す）
+            max_workers: scrape_sync で並行してリクエストを送るスレッド数
+            timeout: リクエストのタイムアウト（秒）
+            verify: TLS 証明書を検証するかどうか
+            max_body_bytes: 読み込むボディの上限バイト数（None で無制限）
+            allowed_content_types: 受け付ける Content-Type（None ですべて受け付ける）
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize or max(10, max_workers)
+        self.keep_alive = keep_alive
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_body_bytes = max_body_bytes
+        self.allowed_content_types = (
+            tuple(t.lower() for t in allowed_content_types)
+            if allowed_content_types is not None
+            else None
+        )
+
+        self._dns_cache_installed = process_dns_cache and dns_cache_ttl > 0
+        if self._dns_cache_installed:
+            _DNS_CACHE.install(dns_cache_ttl)
+
+        self.session = self._build_session(headers or {})
+        self.verify = verify
+
+    def _build_session(self, headers: dict) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(headers)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            # スレッド数がプールより多くても接続を作り捨てずに待たせる
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def verify(self) -> bool:
+        return self.session.verify
+
+    @verify.setter
+    def verify(self, value: bool):
+        self.session.verify = value
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def check_headers(self, content_type: Optional[str], content_length=None):
+        """
+        ボディを読む前に Content-Type と Content-Length を検査する
+
+        Raises:
+            ContentTypeNotAllowed: 許可リストにない Content-Type の場合
+            BodyTooLarge: Content-Length が上限を超えている場合
+        """
+        media_type = _media_type(content_type)
+        if media_type and self.allowed_content_types is not None:
+            if not any(
+                media_type.startswith(t) if t.endswith("/") else media_type == t
+                for t in self.allowed_content_types
+            ):
+                raise ContentTypeNotAllowed(media_type)
+
+        if content_length and self.max_body_bytes is not None:
+            if int(content_length) > self.max_body_bytes:
+                raise BodyTooLarge(f"Content-Length {content_length}")
+
+    def _append_chunk(self, chunks: list, size: int, chunk: bytes) -> int:
+        size += len(chunk)
+        if self.max_body_bytes is not None and size > self.max_body_bytes:
+            raise BodyTooLarge(f"body exceeds {self.max_body_bytes} bytes")
+        chunks.append(chunk)
+        return size
+
+    def read(self, resp: requests.Response) -> bytes:
+        """
+        stream=True で取得したレスポンスのボディを上限付きで読む
+        """
+        self.check_headers(
+            resp.headers.get("Content-Type"), resp.headers.get("Content-Length")
+        )
+        chunks, size = [], 0
+        for chunk in resp.iter_content(_CHUNK_SIZE):
+            size = self._append_chunk(chunks, size, chunk)
+        return b"".join(chunks)
+
+    async def read_async(self, resp: aiohttp.ClientResponse) -> bytes:
+        """
+        aiohttp のレスポンスのボディを上限付きで読む
+        """
+        self.check_headers(
+            resp.headers.get("Content-Type"), resp.headers.get("Content-Length")
+        )
+        chunks, size = [], 0
+        async for chunk in resp.content.iter_chunked(_CHUNK_SIZE):
+            size = self._append_chunk(chunks, size, chunk)
+        return b"".join(chunks)
+
+    def connector(
+        self, limit_per_host: int, ssl: bool = True, limit: int = 100
+    ) -> aiohttp.TCPConnector:
+        """
+        同じ設定で非同期用（aiohttp）のコネクタを作る
+        """
+        return aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            ssl=ssl,
+            use_dns_cache=self.dns_cache_ttl > 0,
+            ttl_dns_cache=self.dns_cache_ttl or None,
+            force_close=not self.keep_alive,
+            keepalive_timeout=self.keepalive_timeout if self.keep_alive else None,
+        )
+
+    def close(self):
+        self.session.close()
+        if self._dns_cache_installed:
+            self._dns_cache_installed = False
+            _DNS_CACHE.uninstall()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
@@ -1,8 +1,32 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Dict, Optional, Union
+
+LOGGER_NAME = "py_stream_scraper"
+
+# URLごとに出るイベント（fetching/streaming など）のロガー
+FETCH_LOGGER_NAME = f"{LOGGER_NAME}.fetch"
+
+# configure_logging(levels=...) や sx --log-levels で個別にレベルを変えられるサブシステム
+SUBSYSTEMS = ("fetch", "retry", "crawl", "lease", "cache", "warc")
+
+_configured = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# LogRecord が標準で持つ属性（これ以外は extra として JSON に含める）
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+}
 
 
 def setup_logger(level=logging.INFO) -> logging.Logger:
-    logger = logging.getLogger("py_stream_scraper")
+    logger = logging.getLogger(LOGGER_NAME)
     if not logger.handlers:
         h = logging.StreamHandler()
         fmt = logging.Formatter(
@@ -11,5 +35,176 @@ def setup_logger(level=logging.INFO) -> logging.Logger:
         )
         h.setFormatter(fmt)
         logger.addHandler(h)
+    # configure_logging 済みならその設定（サブシステムごとのレベル等）を優先する
+    if not _configured:
+        logger.setLevel(level)
+    return logger
+
+
+def subsystem_logger(name: str) -> logging.Logger:
+    """
+    サブシステム（SUBSYSTEMS のどれか）のロガー "py_stream_scraper.{name}" を返す
+    """
+    if name not in SUBSYSTEMS:
+        raise ValueError(f"unknown subsystem {name!r} (one of {', '.join(SUBSYSTEMS)})")
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    1レコードを1行の JSON として出力するフォーマッタ
+
+    logger.info("...", extra={"url": url}) のように渡した値もフィールドとして含める。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in vars(record).items():
+            if k not in _RECORD_ATTRS and not k.startswith("_"):
+                data[k] = v
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    N件に1件だけ通すフィルタ（WARNING 以上は常に通す）
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        if not 0 < rate <= 1:
+            raise ValueError("rate must be in (0, 1]")
+        self.every = max(1, round(1 / rate))
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            self._count += 1
+            return self._count % self.every == 1 or self.every == 1
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    ログを呼び出し元スレッドで整形せずにキューへ渡すハンドラ
+
+    キューが満杯なら待たずに捨て、捨てた件数を dropped に数える。
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # メッセージの整形は QueueListener 側のスレッドで行う
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    level: Union[int, str] = logging.INFO,
+    structured: bool = False,
+    background: bool = True,
+    sample_rate: float = 1.0,
+    levels: Optional[Dict[str, Union[int, str]]] = None,
+    stream=None,
+    max_queue: int = 10_000,
+) -> logging.Logger:
+    """
+    ライブラリ全体のロギングを設定する
+
+    Args:
+        level: py_stream_scraper ロガーのレベル
+        structured: True なら JSON Lines で出力する
+        background: True なら QueueHandler/QueueListener で別スレッドから書き出し、
+            呼び出し元（リクエストのホットパス）がログの I/O で止まらないようにする
+        sample_rate: URLごとのイベント（py_stream_scraper.fetch）を出力する割合
+        levels: サブシステムごとのレベル（例: {"fetch": "WARNING", "retry": "DEBUG"}）。
+            SUBSYSTEMS にない名前は ValueError
+        stream: 出力先（省略時は stderr）
+        max_queue: background 時にためておけるレコード数（超えた分は捨てる）
+
+    Returns:
+        py_stream_scraper ロガー
+    """
+    global _configured, _listener
+
+    unknown = sorted(set(levels or ()) - set(SUBSYSTEMS))
+    if unknown:
+        raise ValueError(
+            f"unknown subsystem {', '.join(unknown)} (one of {', '.join(SUBSYSTEMS)})"
+        )
+
+    logger = logging.getLogger(LOGGER_NAME)
+    shutdown_logging()
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if structured:
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter(
+                "[%(asctime)s] %(levelname)s %(name)s - %(message)s",
+                datefmt="%Y-%m-%d %H:%M:%S",
+            )
+        )
+
+    if background:
+        q = queue.Queue(maxsize=max_queue)
+        logger.addHandler(_NonBlockingQueueHandler(q))
+        _listener = logging.handlers.QueueListener(
+            q, handler, respect_handler_level=True
+        )
+        _listener.start()
+        # 終了時にキューに残ったログを書き出す
+        atexit.register(shutdown_logging)
+    else:
+        logger.addHandler(handler)
+
     logger.setLevel(level)
+    logger.propagate = False
+
+    fetch_logger = logging.getLogger(FETCH_LOGGER_NAME)
+    for f in list(fetch_logger.filters):
+        if isinstance(f, SamplingFilter):
+            fetch_logger.removeFilter(f)
+    if sample_rate < 1:
+        fetch_logger.addFilter(SamplingFilter(sample_rate))
+
+    for name, lv in (levels or {}).items():
+        subsystem_logger(name).setLevel(
+            lv.upper() if isinstance(lv, str) else lv
+        )
+
+    _configured = True
     return logger
+
+
+def shutdown_logging():
+    """
+    バックグラウンドの書き出しスレッドを止め、キューに残ったログを出力する
+    """
+    global _listener
+    if _listener is not None:
+        atexit.unregister(shutdown_logging)
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,369 @@
+"""
+スクレイピングの計測値（メトリクス）を集計・公開するモジュール
+
+Counter / Gauge / Histogram をレジストリに登録し、snapshot() で辞書として取り出すか、
+serve() で Prometheus 互換のテキスト形式を /metrics として HTTP で公開する。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+# 秒単位のレイテンシ用の既定のバケット
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def merge(self, values: dict, previous: dict):
+        """
+        別のプロセスの snapshot() の値を、previous との差分だけ加える
+        """
+        raise NotImplementedError
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    """
+    単調増加するカウンタ
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def snapshot(self) -> dict:
+        # inc は別スレッドから新しいラベルを足すので、ロックを取ってコピーする
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: dict, previous: dict):
+        with self._lock:
+            for key, value in values.items():
+                delta = value - previous.get(key, 0)
+                if delta:
+                    self._values[key] = self._values.get(key, 0) + delta
+
+    def render(self):
+        yield from super().render()
+        for key, value in sorted(self.snapshot().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(Counter):
+    """
+    増減する値（処理中のリクエスト数など）
+    """
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    値の分布（累積バケット、合計、件数）
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = [(k, (list(c), t, n)) for k, (c, t, n) in self._values.items()]
+        result = {}
+        for key, (counts, total, count) in items:
+            cumulative, acc = {}, 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                cumulative[bound] = acc
+            result[key] = {"buckets": cumulative, "sum": total, "count": count}
+        return result
+
+    def merge(self, values: dict, previous: dict):
+        def counts(state):
+            # 累積のバケットをバケットごとの件数に戻す
+            out, prev = [], 0
+            for acc in state["buckets"].values():
+                out.append(acc - prev)
+                prev = acc
+            return out
+
+        with self._lock:
+            for key, state in values.items():
+                old = previous.get(key)
+                new_counts = counts(state)
+                if old is not None:
+                    new_counts = [a - b for a, b in zip(new_counts, counts(old))]
+                    total = state["sum"] - old["sum"]
+                    count = state["count"] - old["count"]
+                else:
+                    total, count = state["sum"], state["count"]
+                if not count:
+                    continue
+                mine = self._values.get(key)
+                if mine is None:
+                    mine = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                mine[0] = [a + b for a, b in zip(mine[0], new_counts)]
+                mine[1] += total
+                mine[2] += count
+
+    def render(self):
+        yield from super().render()
+        for key, state in sorted(self.snapshot().items()):
+            for bound, n in state["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, [("le", le)])
+                yield f"{self.name}_bucket{labels} {n}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {state['sum']}"
+            yield f"{self.name}_count{labels} {state['count']}"
+
+
+class MetricsRegistry:
+    """
+    メトリクスの登録先。同じ名前で登録すると既存のメトリクスを返す
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(
+        self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> dict:
+        """
+        すべてのメトリクスの現在値を {名前: {ラベル値のタプル: 値}} で返す
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return {name: m.snapshot() for name, m in metrics}
+
+    def merge(self, snapshot: dict, previous: Optional[dict] = None):
+        """
+        別のプロセスの snapshot() を、前回の snapshot（previous）との差分だけ加える
+
+        ワーカープロセスのメトリクスを親プロセスで合算するのに使う。このレジストリに
+        登録されていないメトリクスは無視する（ゲージは各プロセスの値の合計になる）。
+        """
+        previous = previous or {}
+        for name, values in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(values, previous.get(name, {}))
+
+    def render(self) -> str:
+        """
+        Prometheus のテキスト形式（exposition format 0.0.4）で出力する
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9100, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        /metrics を返す HTTP サーバーをバックグラウンドスレッドで起動する
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = MetricsRegistry()
+
+
+def status_class(status: Optional[int]) -> str:
+    return "error" if status is None else f"{status // 100}xx"
+
+
+class ScraperMetrics:
+    """
+    Scraper が使うメトリクスをホストのラベル付きでまとめたもの
+    """
+
+    def __init__(self, host: str, registry: MetricsRegistry = REGISTRY):
+        self.host = host
+        self.registry = registry
+        self.requests = registry.counter(
+            "sx_requests_total",
+            "Requests by outcome (fetched/failed/skipped/cached/cache_miss/duplicate/crawled/crawl_failed) and status class.",
+            ["host", "outcome", "status_class"],
+        )
+        self.stage_seconds = registry.histogram(
+            "sx_stage_seconds",
+            "Time spent per stage (fetch, body_read, parse, compress, cache_write, cache_lookup, cache_read, decompress, dedupe, sink_write, cursor).",
+            ["host", "stage"],
+        )
+        self.token_wait_seconds = registry.histogram(
+            "sx_token_wait_seconds",
+            "Time spent waiting for a rate limiter token.",
+            ["host"],
+        )
+        self.inflight = registry.gauge(
+            "sx_inflight_requests", "Requests currently in flight.", ["host"]
+        )
+        self.stream_pending = registry.gauge(
+            "sx_stream_pending",
+            "Messages delivered to the consumer group but not acknowledged.",
+            ["host"],
+        )
+        self.stream_lag = registry.gauge(
+            "sx_stream_lag",
+            "Messages in the stream not yet delivered to the consumer group.",
+            ["host"],
+        )
+
+    def count(self, outcome: str, status: Optional[int] = None):
+        self.requests.inc(
+            host=self.host, outcome=outcome, status_class=status_class(status)
+        )
+
+    def time(self, stage: str):
+        return self.stage_seconds.time(host=self.host, stage=stage)
+
+    def observe_token_wait(self, seconds: float):
+        self.token_wait_seconds.observe(seconds, host=self.host)
+
+    @contextmanager
+    def track_inflight(self):
+        self.inflight.inc(host=self.host)
+        try:
+            yield
+        finally:
+            self.inflight.dec(host=self.host)
+
+
+def serve(port: int = 9100, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    既定のレジストリの /metrics を公開する
+    """
+    return REGISTRY.serve(port, addr)
+
+
+def snapshot() -> dict:
+    """
+    既定のレジストリのスナップショットを返す
+    """
+    return REGISTRY.snapshot()
@@ -0,0 +1,178 @@
+"""
+複数ホストを1プロセスでスクレイピングするためのモジュール
+
+ホストごとのトークンバケット（各 Scraper の Limiter）と同時接続数の上限を守りつつ、
+1つのイベントループと aiohttp セッション上で deficit round-robin により
+各ホストのフロンティアを順番に取り出して取得する。
+"""
+import asyncio
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+from tqdm import tqdm
+
+from .scraper import Scraper
+from .tracing import trace_config
+
+
+class _HostFrontier:
+    """
+    1ホスト分のスケジューリング状態
+    """
+
+    def __init__(self, scraper: Scraper):
+        self.scraper = scraper
+        self.targets = None
+        self.pending = None
+        self.inflight = 0
+        self.deficit = 0.0
+        self.exhausted = False
+
+    def peek(self):
+        if self.pending is None and not self.exhausted:
+            self.pending = next(self.targets, None)
+            if self.pending is None:
+                self.exhausted = True
+        return self.pending
+
+    @property
+    def done(self) -> bool:
+        return self.exhausted and self.inflight == 0
+
+
+class MultiHostScraper:
+    """
+    複数の Scraper を1つのイベントループ・aiohttp セッションで多重化して実行する
+
+    各ホストのレートは Scraper.qps（ホストごとのトークンバケット）、
+    同時接続数は Scraper.max_concurrency で制限されるため、
+    全体のスループットは各ホストの qps の合計になる。
+    """
+
+    def __init__(
+        self,
+        scrapers: Iterable[Scraper],
+        max_concurrency: int = 100,
+        quantum: float = 1.0,
+    ):
+        """
+        Args:
+            scrapers: ホストごとの Scraper（parse と sink は各 Scraper のものを使う）
+            max_concurrency: 全ホスト合計の同時リクエスト数の上限
+            quantum: deficit round-robin で1巡ごとに各ホストへ与える送信枠
+        """
+        self.scrapers: Dict[str, Scraper] = {}
+        for scraper in scrapers:
+            self.add(scraper)
+        self.max_concurrency = max_concurrency
+        self.quantum = quantum
+
+    def add(self, scraper: Scraper):
+        if scraper.host in self.scrapers:
+            raise ValueError(f"host already registered: {scraper.host}")
+        self.scrapers[scraper.host] = scraper
+
+    def _dispatch(self, frontier: _HostFrontier, session, tasks, inflight_total: int):
+        """
+        1ホスト分の送信枠の範囲でタスクを起動し、起動した数を返す
+        """
+        scraper = frontier.scraper
+        frontier.deficit += self.quantum
+        started = 0
+
+        while frontier.deficit >= 1:
+            if inflight_total + started >= self.max_concurrency:
+                break
+            if frontier.inflight >= scraper.max_concurrency:
+                break
+            if frontier.peek() is None:
+                break
+            if not scraper._try_acquire_token():
+                break
+
+            key, url, from_frontier = frontier.pending
+            frontier.pending = None
+            frontier.deficit -= 1
+            frontier.inflight += 1
+            started += 1
+
+            task = asyncio.create_task(
+                scraper._fetch_page(
+                    session,
+                    key,
+                    url.decode("utf-8"),
+                    advance_cursor=from_frontier,
+                )
+            )
+            task.frontier = frontier
+            tasks.add(task)
+
+        # 送れなかった分の枠は持ち越さない（アイドルなホストがバーストしないように）
+        if started == 0:
+            frontier.deficit = min(frontier.deficit, self.quantum)
+        return started
+
+    async def scrape_async(self, progress: bool = False, ssl: bool = True):
+        if not self.scrapers:
+            return
+        frontiers = [_HostFrontier(s) for s in self.scrapers.values()]
+
+        pbar: Optional[tqdm] = None
+        for frontier in frontiers:
+            um = frontier.scraper.url_manager
+            if um.get_cursor() == um.upper:
+                um.set_cursor()
+            frontier.targets = frontier.scraper._iter_targets(um.get_cursor())
+        if progress:
+            pbar = tqdm(
+                total=sum(f.scraper.url_manager.urls_total for f in frontiers),
+                initial=sum(f.scraper.url_manager.url_current_index for f in frontiers),
+                desc=f"Scraping {len(frontiers)} hosts",
+            )
+
+        per_host = max(s.max_concurrency for s in self.scrapers.values())
+        # セッションは1つなので、DNS キャッシュや keep-alive は最初の Scraper の HTTPClient に従う
+        http = frontiers[0].scraper.http
+        connector = http.connector(
+            limit=self.max_concurrency, limit_per_host=per_host, ssl=ssl
+        )
+        tasks = set()
+        try:
+            traced = any(s.tracer.enabled for s in self.scrapers.values())
+            async with aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[trace_config()] if traced else None,
+            ) as session:
+                while any(not f.done for f in frontiers):
+                    started = 0
+                    for frontier in frontiers:
+                        if frontier.exhausted:
+                            continue
+                        started += self._dispatch(frontier, session, tasks, len(tasks))
+                    # 先頭を回して次の巡回の開始ホストをずらす
+                    frontiers.append(frontiers.pop(0))
+
+                    if tasks:
+                        timeout = 0 if started else 0.01
+                        finished, _ = await asyncio.wait(
+                            tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in finished:
+                            tasks.discard(task)
+                            task.frontier.inflight -= 1
+                            task.result()
+                            if pbar:
+                                pbar.update(1)
+                    elif not started:
+                        await asyncio.sleep(0.01)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if pbar:
+                pbar.close()
+
+        for scraper in self.scrapers.values():
+            scraper.url_manager.set_cursor()
+
+    def scrape(self, progress: bool = False):
+        return asyncio.run(self.scrape_async(progress=progress))
@@ -0,0 +1,360 @@
+"""
+1台のマシンの複数のコアで取得するモジュール（sx scrape --procs N）
+
+1つの scrape_async は1つのコアしか使わないので、parse や圧縮まで含めるとネットワークより
+先に CPU が詰まる。run_procs() は N 個のワーカープロセスを起動し、それぞれが自分の
+イベントループ（uvloop があれば uvloop）で取得と parse を行う。
+
+- フロンティアはURLのハッシュで N 個のシャードに分け（sx scrape --shard と同じ分け方）、
+  シャードごとのカーソル（{host}:cursor:{i}-of-{N}）から再開する
+- RocksDB を書き込みで開けるのは1プロセスだけなので、親プロセスがシャードごとに
+  フロンティアを読んでワーカーにバッチを渡す。ワーカーは parse した行・成功と失敗・
+  メトリクスをバッチごとに返し、カーソル・再試行キュー・シンクへの書き込みは親が行う
+- レート制限のトークンバケットは共有メモリ（SharedMemoryStorage）に置くので、
+  全プロセスの合計が qps を超えない
+- 進捗と /metrics は親プロセスで合算する
+
+ワーカーではスクレイパーのクラスを引数なしで作り直す（フロンティアは secondary として開く）。
+recrawl と dedupe は取得しながら状態を RocksDB に書き込むので併用できない。
+"""
+import asyncio
+import multiprocessing
+import queue
+import threading
+import traceback
+from dataclasses import replace
+from typing import Callable, List, Optional
+
+from .cache import Cache, CachePolicy
+from .metrics import REGISTRY
+from .rate_limiter import Limiter, SharedMemoryStorage
+from .retry import classify_error
+from .sink import Sink
+from .url_manager import DiskURLManager, set_default_storage, shard_of
+
+# ワーカーごとに先読みしておくバッチ数
+PREFETCH = 2
+# 停止を確認する間隔（秒）
+POLL_INTERVAL = 0.1
+
+
+class _ForwardSink(Sink):
+    """
+    parse した行をためておき、バッチの終わりに親プロセスへ送る
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, data):
+        if data is not None:
+            self.rows.append(data)
+
+    def close(self):
+        pass
+
+
+class _RetryEvents:
+    """
+    ワーカーでの再試行キューの代わりに、成功と失敗を記録して親プロセスへ送る
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def succeed(self, url: str):
+        self.events.append(("succeed", url))
+
+    def fail(self, url: str, exc: BaseException) -> str:
+        kind = classify_error(exc)
+        self.events.append(("fail", url, kind, f"{type(exc).__name__}: {exc}"))
+        # デッドレターに移すかどうかは親プロセスで決まる
+        return "retry"
+
+    def due(self, now=None):
+        return iter(())
+
+
+def _run(coro):
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(coro)
+    return uvloop.run(coro)
+
+
+async def _work(scraper, shard_id, tasks, results, sink, retry, cache, options):
+    import aiohttp
+
+    from .tracing import trace_config
+
+    cache_policy = options["cache_policy"]
+    connector = scraper.http.connector(
+        limit_per_host=scraper.max_concurrency, ssl=options["ssl"]
+    )
+    async with aiohttp.ClientSession(
+        connector=connector,
+        headers=scraper.headers,
+        trace_configs=[trace_config()] if scraper.tracer.enabled else None,
+    ) as session:
+        sem = asyncio.Semaphore(scraper.max_concurrency)
+
+        async def one(key: bytes, url: str, cached: bool):
+            if cached and scraper._replay_cached(key, url, cache, False):
+                return
+            if cache is not None and cache_policy == CachePolicy.CACHE_ONLY:
+                scraper.metrics.count("cache_miss")
+                return
+            async with sem:
+                await scraper._fetch_one(
+                    session,
+                    key,
+                    url,
+                    advance_cursor=False,
+                    cache=cache,
+                    cache_policy=cache_policy,
+                )
+
+        while scraper.running:
+            item = await asyncio.to_thread(tasks.get)
+            if item is None:
+                break
+            last_key, batch = item
+            targets = scraper._with_cache_lookup(
+                ((key, url, False) for key, url in batch),
+                cache,
+                cache_policy,
+                options["cache_max_age"],
+            )
+            await asyncio.gather(
+                *(
+                    one(key, url.decode("utf-8"), cached)
+                    for key, url, _, cached in targets
+                )
+            )
+            results.put(
+                (
+                    "batch",
+                    shard_id,
+                    last_key,
+                    len(batch),
+                    sink.rows,
+                    retry.events if retry else [],
+                    REGISTRY.snapshot(),
+                )
+            )
+            sink.rows = []
+            if retry:
+                retry.events = []
+
+
+def _worker_main(
+    factory, shard_id, storage, limiter_storage, tasks, results, cache_factory, options
+):
+    stopped = False
+    try:
+        # フロンティアは親プロセスが書き込みで開いているので secondary として開く
+        set_default_storage(replace(storage, mode="secondary", secondary_path=None))
+        scraper = factory()
+        scraper.limiter = Limiter(
+            scraper.limiter.rate, scraper.limiter.capacity, limiter_storage
+        )
+        if scraper.rate_controller:
+            scraper.rate_controller.limiter = scraper.limiter
+        sink = scraper.sink = _ForwardSink()
+        retry = scraper.retry_queue = _RetryEvents() if scraper.retry_queue else None
+        cache = cache_factory() if cache_factory else None
+        scraper.running = True
+        _run(_work(scraper, shard_id, tasks, results, sink, retry, cache, options))
+        # STOP_ON_FAIL で止まった場合は他のワーカーも止める
+        stopped = not scraper.running
+    except BaseException:
+        results.put(("exit", shard_id, traceback.format_exc(), True))
+        return
+    results.put(("exit", shard_id, None, stopped))
+
+
+def _put(tasks, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            tasks.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _feed(manager: DiskURLManager, due: List, tasks, batch_size: int, stop):
+    """
+    シャードの再試行予定のURLとフロンティアを、カーソルの位置からバッチにしてワーカーに渡す
+    """
+    try:
+        for i in range(0, len(due), batch_size):
+            # 再試行のURLはフロンティアの順ではないのでカーソルは進めない
+            if not _put(tasks, (None, due[i : i + batch_size]), stop):
+                return
+        for batch in manager.iter_batches(manager.get_cursor(), batch_size):
+            if not _put(tasks, (batch[-1][0], batch), stop):
+                return
+    finally:
+        if _put(tasks, None, stop):
+            return
+        # 止める場合、先読み分は取得しない（カーソルは進めていないので次回に取得される）
+        while True:
+            try:
+                tasks.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            tasks.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+def run_procs(
+    scraper,
+    factory: Callable,
+    procs: int,
+    progress: bool = False,
+    ssl: bool = True,
+    cache_factory: Optional[Callable[[], Cache]] = None,
+    cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+    cache_max_age: Optional[float] = None,
+):
+    """
+    procs 個のワーカープロセスでフロンティアを取得する
+
+    Args:
+        scraper: フロンティアを書き込みで開いている親プロセスのスクレイパー（シンク・再試行キュー・
+            メトリクスはこのスクレイパーのものを使う）
+        factory: ワーカーでスクレイパーを作る関数（引数なしで呼べるクラスなど。pickle できること）
+        procs: ワーカープロセス数
+        cache_factory: ワーカーでキャッシュを作る関数（pickle できること）
+        cache_policy: キャッシュの使い方（CachePolicy）
+        cache_max_age: READ_THROUGH でキャッシュを使う保存からの最大の秒数
+    """
+    if procs < 1:
+        raise ValueError("procs must be >= 1")
+    if scraper.recrawl is not None or scraper.dedupe is not None:
+        raise ValueError("recrawl and dedupe cannot be used with procs")
+    if cache_factory is None and cache_policy == CachePolicy.CACHE_ONLY:
+        raise ValueError("cache_policy=CACHE_ONLY requires a cache_factory")
+
+    url_manager = scraper.url_manager
+    storage = url_manager.storage
+    managers = [
+        DiskURLManager(scraper.host, storage, shard_id, procs)
+        for shard_id in range(procs)
+    ]
+    batch_size = scraper.max_concurrency * 4
+
+    due = [[] for _ in range(procs)]
+    if scraper.retry_queue:
+        offset = len(url_manager.lower)
+        for key, url in scraper.retry_queue.due():
+            due[shard_of(key[offset:], procs)].append((key, url))
+
+    pbar = None
+    if progress:
+        from tqdm import tqdm
+
+        pbar = tqdm(
+            total=url_manager.urls_total,
+            initial=sum(m.url_current_index for m in managers),
+            desc=f"Scraping {scraper.host} ({procs} procs)",
+        )
+
+    ctx = multiprocessing.get_context("spawn")
+    limiter_storage = SharedMemoryStorage(ctx=ctx)
+    results = ctx.Queue()
+    queues = [ctx.Queue(maxsize=PREFETCH) for _ in range(procs)]
+    options = {"ssl": ssl, "cache_policy": cache_policy, "cache_max_age": cache_max_age}
+    workers = [
+        ctx.Process(
+            target=_worker_main,
+            args=(
+                factory,
+                shard_id,
+                storage,
+                limiter_storage,
+                queues[shard_id],
+                results,
+                cache_factory,
+                options,
+            ),
+            daemon=True,
+        )
+        for shard_id in range(procs)
+    ]
+    for w in workers:
+        w.start()
+
+    stop = threading.Event()
+    feeders = [
+        threading.Thread(
+            target=_feed,
+            args=(managers[i], due[i], queues[i], batch_size, stop),
+            daemon=True,
+        )
+        for i in range(procs)
+    ]
+    for f in feeders:
+        f.start()
+
+    errors = []
+    stopped = False
+    snapshots = {}
+    running = set(range(procs))
+    try:
+        while running:
+            try:
+                message = results.get(timeout=1.0)
+            except queue.Empty:
+                for shard_id in [i for i in running if not workers[i].is_alive()]:
+                    # 報告せずに終了した（強制終了など）
+                    running.discard(shard_id)
+                    errors.append(f"worker {shard_id} exited unexpectedly")
+                    stop.set()
+                continue
+
+            if message[0] == "exit":
+                _, shard_id, error, was_stopped = message
+                running.discard(shard_id)
+                if error:
+                    errors.append(error)
+                if error or was_stopped:
+                    stopped = True
+                    stop.set()
+                continue
+
+            _, shard_id, last_key, n, rows, events, snapshot = message
+            for row in rows:
+                scraper.sink.write(row)
+            for event in events:
+                if event[0] == "succeed":
+                    scraper.retry_queue.succeed(event[1])
+                elif scraper.retry_queue.record_failure(*event[1:]) == "dead":
+                    scraper.retry_log.warning("gave up: %s (%s)", event[1], event[3])
+            REGISTRY.merge(snapshot, snapshots.get(shard_id))
+            snapshots[shard_id] = snapshot
+            if last_key is not None:
+                managers[shard_id].set_cursor(last_key)
+            if pbar:
+                pbar.update(n)
+    finally:
+        stop.set()
+        for f in feeders:
+            f.join()
+        for w in workers:
+            w.join(timeout=10)
+            if w.is_alive():
+                w.terminate()
+        if pbar:
+            pbar.close()
+
+    if errors:
+        raise RuntimeError("worker failed:\n" + "\n".join(errors))
+    if not stopped:
+        # 最後まで取得したので、次回は最初から取得する
+        for m in managers:
+            m.set_cursor()
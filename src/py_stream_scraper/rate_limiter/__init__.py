@@ -6,5 +6,8 @@
 #   fully-qualified paths.
 
 from .storage import MemoryStorage  # NOQA
+from .redis_storage import RedisStorage  # NOQA
+from .shared_storage import SharedMemoryStorage  # NOQA
 from .storage_base import StorageBase  # NOQA
 from .limiter import Limiter  # NOQA
+from .adaptive import AIMDController, parse_retry_after  # NOQA
@@ -0,0 +1,247 @@
+import collections
+import email.utils
+import threading
+import time
+
+
+def parse_retry_after(value, now=None):
+    """Convert a ``Retry-After`` header value to a delay in seconds.
+
+    Both forms allowed by RFC 9110 are accepted: a number of seconds
+    or an HTTP-date.
+
+    Returns:
+        float: Seconds to wait, or None if the value can't be parsed.
+    """
+    if value is None:
+        return None
+
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+
+    if now is None:
+        now = time.time()
+    return max(0.0, when.timestamp() - now)
+
+
+class AIMDController(object):
+    """Adjusts the rate of a Limiter from latency and error signals.
+
+    The controller follows an additive increase / multiplicative
+    decrease (AIMD) policy. While the p95 latency and the error rate
+    of the recent requests stay below their targets, the limiter rate
+    is raised by ``increase`` tokens/sec at most once per ``interval``.
+    A 429 or 5xx response, a transport error, a ``Retry-After`` header
+    or an unhealthy p95 latency multiplies the rate by ``decrease``
+    (at most once per ``interval``, so that a burst of failures from
+    concurrent requests counts as a single congestion signal).
+
+    When a Redis client is given, the effective rate, pauses and the
+    once-per-interval locks are shared through Redis, so that workers
+    that also share a RedisStorage bucket adapt as one.
+
+    Args:
+        limiter (Limiter): The limiter whose rate is controlled.
+        floor (float): Lowest rate the controller may set.
+        ceiling (float): Highest rate the controller may set.
+        increase (float): Tokens/sec added on each healthy interval.
+        decrease (float): Factor applied to the rate on congestion.
+        interval (float): Minimum seconds between two adjustments.
+        latency_target (float): Healthy p95 latency, in seconds.
+        max_error_rate (float): Healthy fraction of failed requests.
+        window (int): Number of recent requests used for statistics.
+        min_samples (int): Samples required before increasing.
+        redis_client (redis.Redis): Optional client for sharing state.
+        key (str): Name of the shared state (required with Redis).
+    """
+
+    def __init__(
+        self,
+        limiter,
+        floor,
+        ceiling,
+        increase=None,
+        decrease=0.5,
+        interval=5.0,
+        latency_target=2.0,
+        max_error_rate=0.05,
+        window=100,
+        min_samples=10,
+        redis_client=None,
+        key=None,
+    ):
+        if not 0 < floor <= ceiling:
+            raise ValueError("floor must be > 0 and <= ceiling")
+
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+
+        if redis_client is not None and not key:
+            raise ValueError("key is required when sharing state through Redis")
+
+        self.limiter = limiter
+        self.floor = floor
+        self.ceiling = ceiling
+        self.increase = increase if increase is not None else max(floor, 0.1)
+        self.decrease = decrease
+        self.interval = interval
+        self.latency_target = latency_target
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+
+        self._redis = redis_client
+        self._key = f"stream-scraper:rate:{key}" if key else None
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._last_change = {"increase": 0.0, "decrease": 0.0}
+        self._last_sync = 0.0
+        self._paused_until = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+        self.limiter.rate = min(self.ceiling, max(self.floor, self.limiter.rate))
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def p95_latency(self):
+        latencies = sorted(latency for latency, _ in self._samples)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def error_rate(self):
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, failed in self._samples if failed) / len(self._samples)
+
+    def paused_for(self, now=None):
+        """Seconds left before requests may resume (0 if not paused)."""
+        if now is None:
+            now = time.time()
+        self._sync(now)
+        return max(0.0, self._paused_until - now)
+
+    def observe(self, status, latency, retry_after=None):
+        """Record the outcome of one request and adjust the rate.
+
+        Args:
+            status (int): HTTP status code, or None for transport
+                errors (connection failure, timeout, ...).
+            latency (float): Seconds until the response headers arrived.
+            retry_after: Raw ``Retry-After`` header value, if any.
+        """
+        now = time.time()
+        self._sync(now)
+        congested = status is None or status == 429 or status >= 500
+        delay = parse_retry_after(retry_after, now)
+
+        with self._lock:
+            self._samples.append((latency, congested))
+
+            if delay:
+                self._pause(now + delay)
+
+            if congested or delay is not None:
+                self._cut(now)
+                return
+
+            if len(self._samples) < self.min_samples:
+                return
+
+            p95 = self.p95_latency()
+            if p95 > self.latency_target:
+                self._cut(now)
+            elif self.error_rate() <= self.max_error_rate:
+                self._grow(now)
+
+    def _acquire_turn(self, name, now):
+        """Allow at most one adjustment per interval (fleet-wide with Redis).
+
+        A decrease only waits for the previous decrease, while an
+        increase also waits for an interval after any decrease.
+        """
+        if name == "decrease":
+            last = self._last_change["decrease"]
+        else:
+            last = max(self._last_change.values())
+        if now - last < self.interval:
+            return False
+
+        if self._redis is not None:
+            if name == "increase" and self._redis.exists(f"{self._key}:decrease"):
+                return False
+            acquired = self._redis.set(
+                f"{self._key}:{name}",
+                1,
+                nx=True,
+                px=max(1, int(self.interval * 1000)),
+            )
+            if not acquired:
+                return False
+
+        self._last_change[name] = now
+        return True
+
+    def _cut(self, now):
+        if not self._acquire_turn("decrease", now):
+            return
+        self._set_rate(max(self.floor, self.limiter.rate * self.decrease))
+        self.decreases += 1
+
+    def _grow(self, now):
+        if not self._acquire_turn("increase", now):
+            return
+        self._set_rate(min(self.ceiling, self.limiter.rate + self.increase))
+        self.increases += 1
+
+    def _set_rate(self, rate):
+        self.limiter.rate = rate
+        if self._redis is not None:
+            self._redis.hset(self._key, "rate", rate)
+
+    def _pause(self, until):
+        self._paused_until = max(self._paused_until, until)
+        if self._redis is not None:
+            self._redis.hset(self._key, "paused_until", self._paused_until)
+
+    def _sync(self, now):
+        """Adopt the rate and pause published by other workers."""
+        if self._redis is None or now - self._last_sync < 1.0:
+            return
+        self._last_sync = now
+
+        rate, paused_until = self._redis.hmget(self._key, "rate", "paused_until")
+        if rate is not None:
+            self.limiter.rate = min(self.ceiling, max(self.floor, float(rate)))
+        if paused_until is not None:
+            self._paused_until = max(self._paused_until, float(paused_until))
+
+    def state(self):
+        """Export the controller state (e.g. for logging or metrics).
+
+        Returns:
+            dict: Current rate, bounds, statistics and counters.
+        """
+        return {
+            "rate": self.limiter.rate,
+            "floor": self.floor,
+            "ceiling": self.ceiling,
+            "p95_latency": self.p95_latency(),
+            "error_rate": self.error_rate(),
+            "samples": len(self._samples),
+            "paused_for": max(0.0, self._paused_until - time.time()),
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
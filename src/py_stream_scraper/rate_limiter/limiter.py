@@ -85,6 +85,30 @@ class Limiter(object):
         self._capacity = capacity
         self._storage = storage
 
+    @property
+    def rate(self):
+        """float: Number of tokens per second added to each bucket.
+
+        The rate may be changed at runtime (e.g. by a rate controller);
+        the new value applies from the next replenishment onwards.
+        """
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        if not isinstance(rate, (float, int)):
+            raise TypeError("rate must be an int or float")
+
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+
+        self._rate = rate
+
+    @property
+    def capacity(self):
+        """int: Maximum number of tokens that a bucket can hold."""
+        return self._capacity
+
     def consume(self, key, num_tokens=1):
         """Attempt to take one or more tokens from a bucket.
 
@@ -0,0 +1,94 @@
+import redis
+
+from .storage_base import StorageBase
+
+
+class RedisStorage(StorageBase):
+    """Redis-backed token bucket storage engine.
+
+    Buckets are kept in Redis hashes, so every process that shares the
+    same Redis instance (and key prefix) draws from the same bucket.
+    This allows a fleet of workers to stay within a single, global rate.
+
+    Replenishment and consumption happen together inside one optimistic
+    transaction (WATCH/MULTI/EXEC) using the Redis server clock, so the
+    result does not depend on clock skew between workers.
+
+    Args:
+        redis_client (redis.Redis): Client used to store the buckets.
+        prefix (str): Prefix for the Redis keys holding the buckets.
+        ttl (int): Seconds after which an idle bucket is dropped.
+    """
+
+    def __init__(self, redis_client, prefix="stream-scraper:bucket:", ttl=3600):
+        self._redis = redis_client
+        self._prefix = prefix
+        self._ttl = ttl
+        self._params = {}
+
+    def _name(self, key):
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
+        return self._prefix + key
+
+    def get_token_count(self, key):
+        """Query the current token count for the given bucket.
+
+        Note that the bucket is not replenished first, so the count
+        will be what it was the last time consume() was called.
+
+        Args:
+            key (str): Name of the bucket to query.
+
+        Returns:
+            float: Number of tokens currently in the bucket (may be
+            fractional).
+        """
+        tokens = self._redis.hget(self._name(key), "tokens")
+        if tokens is None:
+            return 0
+
+        return float(tokens)
+
+    def replenish(self, key, rate, capacity):
+        """Remember the bucket parameters for the following consume().
+
+        The actual replenishment is deferred to consume() so that both
+        steps run atomically on the server.
+        """
+        self._params[key] = (rate, capacity)
+
+    def consume(self, key, num_tokens):
+        """Attempt to take one or more tokens from a bucket.
+
+        This method is exposed for use by the token_bucket.Limiter
+        class.
+        """
+        rate, capacity = self._params[key]
+        name = self._name(key)
+
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name)
+                    tokens, last_replenished_at = pipe.hmget(name, "tokens", "ts")
+                    seconds, microseconds = pipe.time()
+                    now = seconds + microseconds / 1_000_000
+
+                    if tokens is None:
+                        tokens = capacity
+                    else:
+                        elapsed = max(0.0, now - float(last_replenished_at))
+                        tokens = min(capacity, float(tokens) + rate * elapsed)
+
+                    conforming = tokens >= num_tokens
+                    if conforming:
+                        tokens -= num_tokens
+
+                    pipe.multi()
+                    pipe.hset(name, mapping={"tokens": tokens, "ts": now})
+                    pipe.expire(name, self._ttl)
+                    pipe.execute()
+                    return conforming
+                except redis.WatchError:
+                    continue
@@ -0,0 +1,91 @@
+import multiprocessing
+import time
+import zlib
+
+from .storage_base import StorageBase
+
+
+class SharedMemoryStorage(StorageBase):
+    """Token bucket storage shared between processes.
+
+    The buckets live in a shared-memory array, so limiters in several
+    worker processes that use the same storage draw from the same
+    buckets and together stay within the configured rate.
+
+    Unlike MemoryStorage, every update is made under a process-shared
+    lock. With many processes contending for a single bucket, the races
+    that MemoryStorage tolerates would let the combined rate overshoot.
+
+    Keys are hashed into a fixed number of slots; distinct keys that
+    collide share a bucket. Timestamps come from time.monotonic(), which
+    is system-wide, so they can be compared across processes.
+
+    The storage must be created in the parent process and handed to the
+    children when they are started (for example as a Process argument).
+
+    Args:
+        slots (int): Number of buckets that can be tracked.
+        ctx: The multiprocessing context to allocate the shared memory
+            from (defaults to the default context).
+    """
+
+    def __init__(self, slots=16, ctx=None):
+        if slots < 1:
+            raise ValueError("slots must be >= 1")
+
+        ctx = ctx or multiprocessing.get_context()
+        self._slots = slots
+        # NOTE: Two doubles per slot: the token count and the time of the
+        #   last replenishment (0 until the bucket is first used).
+        self._state = ctx.RawArray("d", 2 * slots)
+        self._lock = ctx.Lock()
+
+    def _index(self, key):
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        return 2 * (zlib.crc32(key) % self._slots)
+
+    def get_token_count(self, key):
+        """Query the current token count for the given bucket.
+
+        Note that the bucket is not replenished first, so the count
+        will be what it was the last time replenish() was called.
+        """
+        i = self._index(key)
+        with self._lock:
+            return self._state[i]
+
+    def replenish(self, key, rate, capacity):
+        """Add tokens to a bucket per the given rate.
+
+        This method is exposed for use by the token_bucket.Limiter
+        class.
+        """
+        i = self._index(key)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_replenished_at = self._state[i], self._state[i + 1]
+            if last_replenished_at == 0:
+                tokens = capacity
+            elif now > last_replenished_at:
+                tokens = min(capacity, tokens + rate * (now - last_replenished_at))
+            else:
+                # Another process has already replenished with a later time.
+                return
+
+            self._state[i] = tokens
+            self._state[i + 1] = now
+
+    def consume(self, key, num_tokens):
+        """Attempt to take one or more tokens from a bucket.
+
+        This method is exposed for use by the token_bucket.Limiter
+        class.
+        """
+        i = self._index(key)
+        with self._lock:
+            if self._state[i] < num_tokens:
+                return False
+
+            self._state[i] -= num_tokens
+            return True
@@ -0,0 +1,240 @@
+"""
+取得に失敗したURLの再試行キューを管理するモジュール
+
+一時的な失敗（タイムアウト、接続エラー、429、5xx）は指数バックオフ（ジッター付き）で
+再試行予定時刻順のキューに積み、恒久的な失敗や試行回数の上限に達したものは
+エラー分類とともにデッドレターに移す。
+
+キーの構成:
+    {host}:retry:state\\x00{path}               -> JSON (URL, 試行回数, 最後のエラー, 予定時刻)
+    {host}:retry:due\\x00{due_ms:015d}\\x00{path} -> URL
+    {host}:dead\\x00{path}                      -> JSON (URL, 試行回数, 最後のエラー, 分類)
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Iterator, Optional, Tuple
+
+import aiohttp
+import requests
+import rocksdbpy
+
+from .http_client import ResponseRejected
+from .url_manager import DiskURLManager
+
+# 再試行すれば成功する見込みのある失敗
+TRANSIENT_ERRORS = {"timeout", "connection", "http_429", "http_5xx"}
+
+
+def classify_error(exc: BaseException) -> str:
+    """
+    例外を再試行判定用の分類に変換する
+
+    Returns:
+        "timeout", "connection", "http_429", "http_5xx", "http_4xx", "rejected",
+        "other" のいずれか
+    """
+    if isinstance(exc, ResponseRejected):
+        return "rejected"
+
+    status = None
+    if isinstance(exc, aiohttp.ClientResponseError):
+        status = exc.status
+    elif isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+
+    if status is not None:
+        if status == 429:
+            return "http_429"
+        if status == 408:
+            return "timeout"
+        if status >= 500:
+            return "http_5xx"
+        return "http_4xx"
+
+    if isinstance(exc, (asyncio.TimeoutError, requests.Timeout)):
+        return "timeout"
+    if isinstance(exc, (aiohttp.ClientConnectionError, requests.ConnectionError)):
+        return "connection"
+    return "other"
+
+
+class RetryQueue:
+    """
+    RocksDB 上の遅延再試行キューとデッドレター
+    """
+
+    def __init__(
+        self,
+        url_manager: DiskURLManager,
+        max_attempts: int = 5,
+        base_delay: float = 2.0,
+        max_delay: float = 3600.0,
+    ):
+        """
+        Args:
+            url_manager: 対象ホストの DiskURLManager（同じ RocksDB を共有する）
+            max_attempts: デッドレターに移すまでの最大試行回数
+            base_delay: 1回目の再試行までの基準待ち時間（秒）
+            max_delay: 再試行までの待ち時間の上限（秒）
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be >= 1")
+
+        self.url_manager = url_manager
+        self.db = url_manager.db
+        self.host = url_manager.host
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.state_prefix = f"{self.host}:retry:state\x00".encode("utf-8")
+        self.due_prefix = f"{self.host}:retry:due\x00".encode("utf-8")
+        self.dead_prefix = f"{self.host}:dead\x00".encode("utf-8")
+
+    def _tail(self, url: str) -> bytes:
+        path, query = DiskURLManager.normalize_url(url)
+        key = self.url_manager.key_for(path, query)
+        return key[len(self.url_manager.lower) :]
+
+    def _due_key(self, due: float, tail: bytes) -> bytes:
+        return (
+            self.due_prefix + f"{int(due * 1000):015d}".encode("utf-8") + b"\x00" + tail
+        )
+
+    def backoff(self, attempts: int) -> float:
+        """
+        attempts 回失敗した後の待ち時間（equal jitter 付き指数バックオフ）
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def fail(self, url: str, exc: BaseException, now: Optional[float] = None) -> str:
+        """
+        失敗を記録し、再試行キューかデッドレターに振り分ける
+
+        Returns:
+            "retry"（再試行予定に積んだ）または "dead"（デッドレターに移した）
+        """
+        return self.record_failure(
+            url, classify_error(exc), f"{type(exc).__name__}: {exc}", now
+        )
+
+    def record_failure(
+        self, url: str, kind: str, error: str, now: Optional[float] = None
+    ) -> str:
+        """
+        分類済みの失敗を記録する（別のプロセスで起きた失敗を記録する場合など）
+        """
+        if now is None:
+            now = time.time()
+        tail = self._tail(url)
+        state_key = self.state_prefix + tail
+
+        raw = self.db.get(state_key)
+        state = json.loads(raw) if raw else {"url": url, "attempts": 0}
+
+        batch = rocksdbpy.WriteBatch()
+        if "due" in state:
+            batch.delete(self._due_key(state["due"], tail))
+
+        state["attempts"] += 1
+        state["kind"] = kind
+        state["error"] = error
+        state["failed_at"] = now
+
+        if kind not in TRANSIENT_ERRORS or state["attempts"] >= self.max_attempts:
+            state.pop("due", None)
+            batch.delete(state_key)
+            batch.add(self.dead_prefix + tail, json.dumps(state).encode("utf-8"))
+            self.db.write(batch)
+            return "dead"
+
+        state["due"] = now + self.backoff(state["attempts"])
+        batch.add(state_key, json.dumps(state).encode("utf-8"))
+        batch.add(self._due_key(state["due"], tail), url.encode("utf-8"))
+        self.db.write(batch)
+        return "retry"
+
+    def succeed(self, url: str):
+        """
+        再試行待ちのURLが成功したら記録を消す
+        """
+        tail = self._tail(url)
+        state_key = self.state_prefix + tail
+        raw = self.db.get(state_key)
+        if raw is None:
+            return
+
+        state = json.loads(raw)
+        batch = rocksdbpy.WriteBatch()
+        batch.delete(state_key)
+        if "due" in state:
+            batch.delete(self._due_key(state["due"], tail))
+        self.db.write(batch)
+
+    def due(self, now: Optional[float] = None) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        再試行予定時刻を過ぎたURLを予定時刻順に返す
+
+        Yields:
+            (フロンティアのキー, URL) のタプル（DiskURLManager.to_iter と同じ形式）
+        """
+        if now is None:
+            now = time.time()
+        limit = f"{int(now * 1000):015d}".encode("utf-8")
+
+        for key, value in self.db.iterator(mode="from", key=self.due_prefix):
+            if not key.startswith(self.due_prefix):
+                break
+            ts, _, tail = key[len(self.due_prefix) :].partition(b"\x00")
+            if ts > limit:
+                break
+            yield self.url_manager.lower + tail, value
+
+    def pending(self) -> Iterator[dict]:
+        """
+        再試行待ちのURLの状態を返す
+        """
+        for key, value in self.db.iterator(mode="from", key=self.state_prefix):
+            if not key.startswith(self.state_prefix):
+                break
+            yield json.loads(value)
+
+    def dead_letters(self, kind: Optional[str] = None) -> Iterator[dict]:
+        """
+        デッドレターに移されたURLの状態を返す
+
+        Args:
+            kind: 指定した場合はこのエラー分類のものだけを返す
+        """
+        for key, value in self.db.iterator(mode="from", key=self.dead_prefix):
+            if not key.startswith(self.dead_prefix):
+                break
+            state = json.loads(value)
+            if kind is None or state["kind"] == kind:
+                yield state
+
+    def requeue_dead(self, kind: Optional[str] = None, now: Optional[float] = None) -> int:
+        """
+        デッドレターのURLを試行回数をリセットして再試行キューに戻す
+
+        Returns:
+            戻したURLの数
+        """
+        if now is None:
+            now = time.time()
+
+        cnt = 0
+        batch = rocksdbpy.WriteBatch()
+        for state in list(self.dead_letters(kind)):
+            tail = self._tail(state["url"])
+            state["attempts"] = 0
+            state["due"] = now
+            batch.delete(self.dead_prefix + tail)
+            batch.add(self.state_prefix + tail, json.dumps(state).encode("utf-8"))
+            batch.add(self._due_key(now, tail), state["url"].encode("utf-8"))
+            cnt += 1
+        self.db.write(batch)
+        return cnt
@@ -0,0 +1,191 @@
+"""
+再クロールのスケジューリングを行うモジュール
+
+URLごとの最終取得時刻とコンテンツハッシュを記録して更新頻度を推定し、
+次回取得予定時刻をキーにしたインデックスを RocksDB に保持する。
+
+キーの構成:
+    {host}:recrawl:meta\\x00{path}               -> JSON (最終取得時刻, 取得間隔, ハッシュ...)
+    {host}:recrawl:due\\x00{due:012d}\\x00{path}  -> URL
+"""
+import hashlib
+import json
+import time
+from typing import Iterator, Optional, Tuple, Union
+
+import rocksdbpy
+
+from .url_manager import DiskURLManager
+
+
+def content_digest(content: Union[str, bytes]) -> str:
+    """
+    更新の検出に使うコンテンツハッシュ
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class RecrawlScheduler:
+    """
+    更新頻度に応じて再取得のタイミングを決めるスケジューラ
+
+    取得のたびにコンテンツハッシュを比較し、変化していれば取得間隔を
+    ``speedup`` 倍に縮め、変化していなければ ``slowdown`` 倍に広げる。
+    間隔は ``min_interval`` 〜 ``max_interval`` (秒) の範囲に収める。
+    """
+
+    def __init__(
+        self,
+        url_manager: DiskURLManager,
+        min_interval: float = 3600,
+        max_interval: float = 30 * 86400,
+        initial_interval: float = 86400,
+        speedup: float = 0.5,
+        slowdown: float = 1.5,
+    ):
+        """
+        Args:
+            url_manager: 対象ホストの DiskURLManager（同じ RocksDB を共有する）
+            min_interval: 取得間隔の下限（秒）
+            max_interval: 取得間隔の上限（秒）
+            initial_interval: 初回取得後の取得間隔（秒）
+            speedup: 変化を検出したときに間隔に掛ける係数
+            slowdown: 変化がなかったときに間隔に掛ける係数
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("min_interval must be > 0 and <= max_interval")
+
+        self.url_manager = url_manager
+        self.db = url_manager.db
+        self.host = url_manager.host
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.speedup = speedup
+        self.slowdown = slowdown
+
+        self.meta_prefix = f"{self.host}:recrawl:meta\x00".encode("utf-8")
+        self.due_prefix = f"{self.host}:recrawl:due\x00".encode("utf-8")
+
+    def _tail(self, key: bytes) -> bytes:
+        return key[len(self.url_manager.lower) :]
+
+    def _key_for_url(self, url: str) -> bytes:
+        path, query = DiskURLManager.normalize_url(url)
+        return self.url_manager.key_for(path, query)
+
+    def _due_key(self, due: float, tail: bytes) -> bytes:
+        return self.due_prefix + f"{int(due):012d}".encode("utf-8") + b"\x00" + tail
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def get_state(self, key: bytes) -> Optional[dict]:
+        """
+        URLキーに対する記録済みの状態を返す（未取得なら None）
+        """
+        raw = self.db.get(self.meta_prefix + self._tail(key))
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def is_tracked(self, key: bytes) -> bool:
+        return self.db.get(self.meta_prefix + self._tail(key)) is not None
+
+    def record(
+        self,
+        url: str,
+        content: Union[str, bytes],
+        fetched_at: Optional[float] = None,
+    ) -> bool:
+        """
+        取得結果を記録し、次回の取得予定を更新する
+
+        Args:
+            url: 取得したURL
+            content: 取得したコンテンツ
+            fetched_at: 取得時刻（UNIX時間、省略時は現在時刻）
+
+        Returns:
+            前回取得時からコンテンツが変化していれば True（初回取得も True）
+        """
+        return self.record_digest(url, content_digest(content), fetched_at)
+
+    def record_digest(
+        self, url: str, digest: str, fetched_at: Optional[float] = None
+    ) -> bool:
+        """
+        content_digest で計算済みのハッシュで取得結果を記録する
+
+        分散ワーカーが送り返した結果を start_stream 側で記録するのに使う。
+        """
+        if fetched_at is None:
+            fetched_at = time.time()
+
+        key = self._key_for_url(url)
+        tail = self._tail(key)
+        state = self.get_state(key)
+
+        batch = rocksdbpy.WriteBatch()
+        if state is None:
+            changed = True
+            interval = self._clamp(self.initial_interval)
+            state = {"url": url, "fetches": 0, "changes": 0}
+        else:
+            changed = digest != state["hash"]
+            factor = self.speedup if changed else self.slowdown
+            interval = self._clamp(state["interval"] * factor)
+            batch.delete(self._due_key(state["due"], tail))
+            if changed:
+                state["changes"] += 1
+
+        due = fetched_at + interval
+        state.update(
+            {
+                "last_fetch": fetched_at,
+                "interval": interval,
+                "hash": digest,
+                "due": due,
+            }
+        )
+        state["fetches"] += 1
+
+        batch.add(self.meta_prefix + tail, json.dumps(state).encode("utf-8"))
+        batch.add(self._due_key(due, tail), url.encode("utf-8"))
+        self.db.write(batch)
+        return changed
+
+    def change_rate(self, key: bytes) -> Optional[float]:
+        """
+        推定した更新頻度（回/秒）を返す。取得回数が2回未満なら None
+        """
+        state = self.get_state(key)
+        if state is None or state["fetches"] < 2:
+            return None
+        return 1.0 / state["interval"]
+
+    def due(self, now: Optional[float] = None) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        取得予定時刻を過ぎたURLを予定時刻の古い順に返す
+
+        Yields:
+            (フロンティアのキー, URL) のタプル（DiskURLManager.to_iter と同じ形式）
+        """
+        if now is None:
+            now = time.time()
+        limit = f"{int(now):012d}".encode("utf-8")
+
+        for key, value in self.db.iterator(mode="from", key=self.due_prefix):
+            if not key.startswith(self.due_prefix):
+                break
+            rest = key[len(self.due_prefix) :]
+            ts, _, tail = rest.partition(b"\x00")
+            if ts > limit:
+                break
+            yield self.url_manager.lower + tail, value
+
+    @property
+    def due_total(self) -> int:
+        return sum(1 for _ in self.due())
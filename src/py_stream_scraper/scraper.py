@@ -1,5 +1,11 @@
 import datetime
 import hashlib
+import itertools
+from contextlib import contextmanager
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import re
 import random
 import time
@@ -15,16 +21,24 @@ import aiohttp
 import asyncio
 import brotli
 import enum
+import math
 import socket
 import os
 import re
 from typing import Callable, Iterable, List, Optional, Pattern, Union
 
 from .sink import Sink, FileSink
-from .url_manager import DiskURLManager
-from .rate_limiter import Limiter, MemoryStorage
-from .log import setup_logger
-from .cache import Cache
+from .url_manager import DiskURLManager, StorageConfig, shard_of
+from .rate_limiter import AIMDController, Limiter, MemoryStorage, RedisStorage
+from .log import FETCH_LOGGER_NAME, setup_logger, subsystem_logger
+from .cache import Cache, CachePolicy
+from .dedupe import DedupeIndex, DedupeMode
+from .scheduler import RecrawlScheduler, content_digest
+from .retry import RetryQueue
+from .http_client import HTTPClient, ResponseRejected, decode_body
+from .metrics import MetricsRegistry, REGISTRY, ScraperMetrics
+from .status import StreamStatus, record_ack, stream_names, stream_status
+from .tracing import Tracer, trace_config
 
 
 def _random_user_agent():
@@ -51,9 +65,22 @@ _DEFAULT_USER_AGENT = _random_user_agent()
 class FetchStrategy(enum.Enum):
     STOP_ON_FAIL = 1
     NEVER_STOP = 2
+    # 一時的な失敗は再試行キューに積み、止まらずに次へ進む
+    RETRY = 3
+
+
+# フォロー中にフロンティアへの追加を待つ最大の間隔（秒）
+FOLLOW_POLL_INTERVAL = 0.2
+# キャッシュにあるかどうかをまとめて確認する件数
+CACHE_LOOKUP_BATCH = 256
 
 
 class Scraper:
+    # extract.Schema を指定すると、parse を書かなくてもその抽出仕様で1行を取り出す
+    schema = None
+    # crawl.CrawlSpec を指定すると、discover_urls がリンクをたどって取得対象を集める
+    crawl_spec = None
+
     def __init__(
         self,
         host,
@@ -61,8 +88,25 @@ class Scraper:
         redis_client=None,
         max_concurrency=10,
         fetch_strategy=FetchStrategy.STOP_ON_FAIL,
+        recrawl: bool = False,
+        adaptive_rate: bool = False,
+        min_qps: float | None = None,
+        max_qps: float | None = None,
+        http_client: HTTPClient | None = None,
+        raw_cache: bool = False,
+        metrics: MetricsRegistry | None = None,
+        tracer: Tracer | None = None,
+        storage: StorageConfig | None = None,
+        shard_id: int | None = None,
+        num_shards: int = 1,
+        dedupe: DedupeMode | None = None,
+        dedupe_distance: int = 3,
     ):
         self.log = setup_logger()
+        # URLごとのイベントはサンプリングやレベルを個別に設定できるよう分ける
+        self.fetch_log = logging.getLogger(FETCH_LOGGER_NAME)
+        self.retry_log = subsystem_logger("retry")
+        self.cache_log = subsystem_logger("cache")
         self.host = host
         self.qps = qps
         self.redis = redis_client or redis.Redis(
@@ -71,8 +115,25 @@ class Scraper:
         self.max_concurrency = max_concurrency
         self.fetch_strategy = fetch_strategy
         self.stream_name = f"stream-scraper:scrape:{self.host}"
-        self.url_manager = DiskURLManager(host)
+        # shard_id を指定すると、ハッシュでこのシャードに当たるURLだけを独自のカーソルで取得する
+        self.url_manager = DiskURLManager(host, storage, shard_id, num_shards)
+        self.metrics = ScraperMetrics(host, metrics or REGISTRY)
+        # URLごとのステージ別の所要時間の記録先（既定は何もしない）
+        self.tracer = tracer or Tracer()
         self.limiter = Limiter(self.qps, 100, MemoryStorage())
+        # レイテンシとエラーに応じて qps を min_qps〜max_qps の範囲で調整する
+        self.rate_controller = None
+        if adaptive_rate:
+            self._setup_rate_controller(min_qps or self.qps / 10, max_qps or self.qps * 2)
+        # 更新頻度に応じた再取得（Noneなら常にフロンティアを順に取得する）
+        self.recrawl = RecrawlScheduler(self.url_manager) if recrawl else None
+        self.retry_queue = None
+        if fetch_strategy == FetchStrategy.RETRY:
+            self.retry_queue = RetryQueue(self.url_manager)
+        # 重複したページは parse・キャッシュ・シンクを飛ばす（None なら検出しない）
+        self.dedupe = None
+        if dedupe is not None:
+            self.dedupe = DedupeIndex(self.url_manager, dedupe, dedupe_distance)
         outfilename = self.host.replace(".", "-") + ".csv"
         self.sink = FileSink(outfilename)
 
@@ -91,13 +152,29 @@ class Scraper:
             "upgrade-insecure-requests": "1",
         }
 
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+        # 同期リクエストは接続プールを共有するこのクライアントを使う
+        self.http = http_client or HTTPClient(headers=self.headers)
+        self.session = self.http.session
+        # True ならキャッシュにはデコードせず受信したバイト列をそのまま圧縮して保存する
+        self.raw_cache = raw_cache
+        self._pace_lock = threading.Lock()
+        self._next_slot = 0.0
 
         self.running = False
 
     def discover_urls(self):
-        pass
+        if self.crawl_spec is not None:
+            self.crawl(self.crawl_spec)
+
+    def crawl(self, spec, ssl: bool = True):
+        """
+        spec（crawl.CrawlSpec）にしたがって一覧ページをたどり、詳細ページのURLをフロンティアに追加する
+
+        一覧ページの取得はこのスクレイパーのレートリミッタを使う。crawl.CrawlStats を返す。
+        """
+        from .crawl import Crawler
+
+        return asyncio.run(Crawler(self, spec).run(ssl=ssl))
 
     def discover_urls_from_sitemap(self, r_filter=None):
         tree = sitemap_tree_for_homepage(f"https://{self.host}")
@@ -106,91 +183,545 @@ class Scraper:
                 self.url_manager.add_url(page.url)
 
     def parse(self, url, html) -> List[str]:
-        pass
+        if self.schema is not None:
+            return self.schema.extract(html, url)
+
+    def _iter_targets(self, start_key: bytes | None = None, frontier=None):
+        """
+        取得対象を (key, url, from_frontier) で返す（key と url は bytes のまま）。
+
+        再試行予定を過ぎたURL、再取得予定を過ぎたURLを先に返す。
+        recrawl が有効な場合、フロンティアからは未取得のURLだけを返す。
+        frontier に DiskURLManager.follow() を渡すと、追いついたときに None を返す
+        （呼び出し側は url_manager.wait_for_writes で追加を待つ）。
+        """
+        owns = self.url_manager.owns
+        if self.retry_queue:
+            for key, url in self.retry_queue.due():
+                if owns(key):
+                    yield key, url, False
+
+        if self.recrawl:
+            for key, url in self.recrawl.due():
+                if owns(key):
+                    yield key, url, False
+
+        if frontier is None:
+            frontier = ((b, True) for b in self.url_manager.iter_batches(start_key))
+        for batch, in_order in frontier:
+            if not batch:
+                yield None
+                continue
+            for key, url in batch:
+                if self.recrawl and self.recrawl.is_tracked(key):
+                    continue
+                yield key, url, in_order
 
     def _path_allowed(self, url):
         path = urlparse(url).path or "/"
         return any(rx.search(path) for rx in self.url_filter)
 
-    async def _wait_for_token(self):
-        while not self.limiter.consume(self.host):
+    def _setup_rate_controller(self, min_qps: float, max_qps: float):
+        # バースト幅を約1秒分に抑え、レートを下げたときにすぐ効くようにする
+        self.limiter = Limiter(self.qps, max(1, math.ceil(max_qps)), MemoryStorage())
+        self.rate_controller = AIMDController(self.limiter, min_qps, max_qps)
+
+    def _observe(self, status: int | None, started: float, retry_after=None):
+        if self.rate_controller:
+            self.rate_controller.observe(
+                status, time.monotonic() - started, retry_after
+            )
+
+    def _on_fetch_success(self, url: str, status: int = 200):
+        self.metrics.count("fetched", status)
+        if self.retry_queue:
+            self.retry_queue.succeed(url)
+
+    def _count_failure(self, exc: BaseException):
+        status = None
+        if isinstance(exc, aiohttp.ClientResponseError):
+            status = exc.status
+        elif isinstance(exc, requests.HTTPError) and exc.response is not None:
+            status = exc.response.status_code
+        outcome = "skipped" if isinstance(exc, ResponseRejected) else "failed"
+        self.metrics.count(outcome, status)
+
+    def _on_fetch_error(self, url: str, exc: BaseException) -> bool:
+        """
+        失敗を再試行キューに記録する。記録した場合は True を返す
+        """
+        self._count_failure(exc)
+        if not self.retry_queue:
+            return False
+        if self.retry_queue.fail(url, exc) == "dead":
+            self.retry_log.warning("gave up: %s (%s)", url, exc)
+        return True
+
+    def _try_acquire_token(self) -> bool:
+        if self.rate_controller and self.rate_controller.paused_for() > 0:
+            return False
+        return self.limiter.consume(self.host)
+
+    def _record_token_wait(self, seconds: float, url: str | None):
+        self.metrics.observe_token_wait(seconds)
+        if self.tracer.enabled:
+            self.tracer.record("token_wait", seconds, url)
+
+    async def _wait_for_token(self, url: str | None = None):
+        started = time.monotonic()
+        while not self._try_acquire_token():
             await asyncio.sleep(0.01)
+        self._record_token_wait(time.monotonic() - started, url)
+
+    def _throttle_sync(self, url: str | None = None):
+        started = time.monotonic()
+        if self.rate_controller is None:
+            # スレッド間で送信スロットを予約し、合計で qps を超えないようにする
+            with self._pace_lock:
+                slot = max(started, self._next_slot)
+                self._next_slot = slot + 1.0 / self.qps
+            if slot > started:
+                time.sleep(slot - started)
+        else:
+            while not self._try_acquire_token():
+                time.sleep(0.01)
+        self._record_token_wait(time.monotonic() - started, url)
+
+    async def _fetch_one(
+        self,
+        session: aiohttp.ClientSession,
+        key: bytes,
+        url: str,
+        advance_cursor: bool = True,
+        cache: Cache | None = None,
+        cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+    ):
+        await self._wait_for_token(url)
+        await self._fetch_page(
+            session,
+            key,
+            url,
+            advance_cursor=advance_cursor,
+            cache=cache,
+            cache_policy=cache_policy,
+        )
 
-    async def _fetch_one(self, session: aiohttp.ClientSession, key: str, url: str):
-        await self._wait_for_token()
+    async def _fetch_page(
+        self,
+        session: aiohttp.ClientSession,
+        key: bytes,
+        url: str,
+        advance_cursor: bool = True,
+        cache: Cache | None = None,
+        cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+    ):
+        started = time.monotonic()
+        self.metrics.inflight.inc(host=self.host)
         try:
-            self.log.info(f"fetching: {url}")
+            self.fetch_log.info("fetching: %s", url)
             async with session.get(
-                url, headers=self.headers, allow_redirects=True, timeout=15
+                url,
+                headers=self.headers,
+                allow_redirects=True,
+                timeout=15,
+                trace_request_ctx=self.tracer if self.tracer.enabled else None,
             ) as resp:
+                self._observe(resp.status, started, resp.headers.get("Retry-After"))
                 resp.raise_for_status()
                 if resp.status == 200:
-                    html = await resp.text()
-                    parsed = self.parse(url, html)
-                    self.sink.write(parsed)
-        except aiohttp.ClientConnectorError:
-            pass
-        except aiohttp.ClientResponseError:
-            pass
+                    with self._stage("body_read", url):
+                        body = await self.http.read_async(resp)
+                    self._observe_fetch(started)
+                    html = self._decode_if_needed(
+                        body, resp.headers.get("Content-Type"), cache, cache_policy
+                    )
+                    if self.recrawl:
+                        self.recrawl.record(url, body)
+                    if self._is_duplicate(url, html):
+                        self._on_fetch_success(url, resp.status)
+                        return
+                    if cache:
+                        # 圧縮と保存はイベントループを止めないよう別スレッドで行う
+                        await asyncio.to_thread(
+                            self._write_cache,
+                            cache,
+                            url,
+                            body,
+                            html,
+                            resp.status,
+                            resp.headers,
+                        )
+                    if cache is None or cache_policy != CachePolicy.WRITE_ONLY:
+                        self._parse_and_write(url, html)
+                    self._on_fetch_success(url, resp.status)
+        except aiohttp.ClientConnectorError as e:
+            self._observe(None, started)
+            self._on_fetch_error(url, e)
+        except aiohttp.ClientResponseError as e:
+            self._on_fetch_error(url, e)
         except asyncio.CancelledError:
             raise
+        except asyncio.TimeoutError as e:
+            self._observe(None, started)
+            self.log.error(e)
+            self._on_fetch_error(url, e)
+        except ResponseRejected as e:
+            self.fetch_log.warning("skipped: %s (%s)", url, e)
+            self._on_fetch_error(url, e)
         except Exception as e:
             self.log.error(e)
+            self._on_fetch_error(url, e)
         finally:
-            self.url_manager.set_cursor(key.encode("utf-8"))
+            self.metrics.inflight.dec(host=self.host)
+            if advance_cursor:
+                self._advance_cursor(key, url)
 
-    def _fetch_one_sync(self, session, key, url, cache: Cache | None = None):
-        time.sleep(1.0 / self.qps)
+    def _fetch_one_sync(
+        self,
+        session,
+        key: bytes,
+        url: str,
+        cache: Cache | None = None,
+        advance_cursor: bool = True,
+        cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+    ):
+        self._throttle_sync(url)
+        started = time.monotonic()
+        self.metrics.inflight.inc(host=self.host)
         try:
-            self.log.info(f"fetching: {url}")
+            self.fetch_log.info("fetching: %s", url)
             with session.get(
-                url, headers=self.headers, allow_redirects=True, timeout=15
+                url,
+                headers=self.headers,
+                allow_redirects=True,
+                timeout=self.http.timeout,
+                stream=True,
             ) as resp:
+                self._observe(
+                    resp.status_code, started, resp.headers.get("Retry-After")
+                )
+                if self.tracer.enabled:
+                    self.tracer.record("ttfb", resp.elapsed.total_seconds(), url)
                 resp.raise_for_status()
                 if resp.status_code == 200:
-                    html = resp.text
-                    if cache:
-                        compressed = brotli.compress(html.encode("utf-8"))
-                        cache.write(url, compressed)
-                    else:
-                        parsed = self.parse(url, html)
-                        self.sink.write(parsed)
-                    self.url_manager.set_cursor(key.encode("utf-8"))
+                    with self._stage("body_read", url):
+                        body = self.http.read(resp)
+                    self._observe_fetch(started)
+                    if self.recrawl:
+                        self.recrawl.record(url, body)
+                    self._handle_body_sync(url, body, resp, cache, cache_policy)
+                    self._on_fetch_success(url, resp.status_code)
+                    if advance_cursor:
+                        self._advance_cursor(key, url)
+        except ResponseRejected as e:
+            # 対象外のレスポンスは失敗扱いにせず次へ進む
+            self.fetch_log.warning("skipped: %s (%s)", url, e)
+            self._on_fetch_error(url, e)
+            if advance_cursor:
+                self._advance_cursor(key, url)
         except Exception as e:
+            if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                self._observe(None, started)
             self.log.error(e)
+            if self._on_fetch_error(url, e) and advance_cursor:
+                # 失敗したURLは再試行キューに残るので、カーソルは先へ進める
+                self._advance_cursor(key, url)
             if self.fetch_strategy == FetchStrategy.STOP_ON_FAIL:
                 self.running = False
+        finally:
+            self.metrics.inflight.dec(host=self.host)
+
+    def _observe_fetch(self, started: float):
+        self.metrics.stage_seconds.observe(
+            time.monotonic() - started, host=self.host, stage="fetch"
+        )
+
+    @contextmanager
+    def _stage(self, stage: str, url: str | None = None):
+        """
+        ステージの所要時間をメトリクスと Tracer の両方に記録する
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.stage_seconds.observe(elapsed, host=self.host, stage=stage)
+            if self.tracer.enabled:
+                self.tracer.record(stage, elapsed, url)
+
+    def _advance_cursor(self, key: bytes, url: str | None = None):
+        with self._stage("cursor", url):
+            self.url_manager.set_cursor(key)
+
+    def _is_duplicate(self, url: str, html: str) -> bool:
+        if self.dedupe is None:
+            return False
+        with self._stage("dedupe", url):
+            dup = self.dedupe.check(url, html)
+        if dup is None:
+            return False
+        self.metrics.count("duplicate")
+        self.fetch_log.info("duplicate (%s) of %s: %s", dup.kind, dup.url, url)
+        return True
+
+    def _decode_if_needed(
+        self,
+        body: bytes,
+        content_type: str | None,
+        cache: Cache | None,
+        cache_policy: CachePolicy,
+    ) -> str | None:
+        """
+        dedupe・parse・UTF-8 でのキャッシュ保存のどれかで使うときだけボディをデコードする
+
+        raw_cache で WRITE_ONLY のときはバイト列のまま保存するだけなので None を返す。
+        """
+        if (
+            self.dedupe is None
+            and cache is not None
+            and cache_policy == CachePolicy.WRITE_ONLY
+            and self.raw_cache
+        ):
+            return None
+        return decode_body(body, content_type)
+
+    def _parse_and_write(self, url: str, html: str):
+        with self._stage("parse", url):
+            parsed = self.parse(url, html)
+        with self._stage("sink_write", url):
+            self.sink.write(parsed)
+
+    def _handle_body_sync(
+        self,
+        url: str,
+        body: bytes,
+        resp,
+        cache: Cache | None,
+        cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+    ):
+        html = self._decode_if_needed(
+            body, resp.headers.get("Content-Type"), cache, cache_policy
+        )
+        if self._is_duplicate(url, html):
+            return
+        if cache:
+            self._write_cache(cache, url, body, html, resp.status_code, resp.headers)
+            # WRITE_ONLY では保存するだけで parse しない
+            if cache_policy == CachePolicy.WRITE_ONLY:
+                return
+        self._parse_and_write(url, html)
+
+    def _write_cache(
+        self,
+        cache: Cache,
+        url: str,
+        body: bytes,
+        html: str | None,
+        status: int = 200,
+        headers=None,
+    ):
+        if not self.raw_cache:
+            # 従来どおり UTF-8 に揃えてから保存する
+            body = html.encode("utf-8")
+        if not cache.compressed:
+            headers = dict(headers or {})
+            if not self.raw_cache:
+                headers = {
+                    k: v for k, v in headers.items() if k.lower() != "content-type"
+                }
+                headers["Content-Type"] = "text/html; charset=utf-8"
+            with self._stage("cache_write", url):
+                cache.write_response(url, body, status, headers)
+            return
+        with self._stage("compress", url):
+            compressed = brotli.compress(body)
+        with self._stage("cache_write", url):
+            cache.write(url, compressed)
+            if self.raw_cache:
+                # 元の charset のまま保存しているので、再生時のデコードに使う
+                cache.write_content_type(url, (headers or {}).get("Content-Type"))
 
-    async def scrape_async(self, progress: bool = False, ssl: bool = True):
+    def _with_cache_lookup(
+        self, targets, cache: Cache | None, policy: CachePolicy, max_age: float | None
+    ):
+        """
+        取得対象の (key, url, from_frontier) に、キャッシュから読めるかどうかを付けて返す
+
+        キャッシュにあるかどうかは CACHE_LOOKUP_BATCH 件ずつまとめて確認する。
+        None（フォロー中に追いついた）はそのまま返す。
+        """
+        if cache is None or policy == CachePolicy.WRITE_ONLY:
+            for target in targets:
+                yield None if target is None else (*target, False)
+            return
+
+        def lookup(buf):
+            with self._stage("cache_lookup"):
+                fresh = cache.fresh_many([_as_str(url) for _, url, _ in buf], max_age)
+            for (key, url, from_frontier), cached in zip(buf, fresh):
+                yield key, url, from_frontier, cached
+
+        buf = []
+        for target in targets:
+            if target is not None:
+                buf.append(target)
+                if len(buf) < CACHE_LOOKUP_BATCH:
+                    continue
+            if buf:
+                yield from lookup(buf)
+                buf = []
+            if target is None:
+                yield None
+        if buf:
+            yield from lookup(buf)
+
+    def _cached_content_type(self, content_type: str | None) -> str | None:
+        """
+        キャッシュの本文をデコードするときの Content-Type
+        """
+        if not self.raw_cache:
+            # 保存時に UTF-8 に揃えている（meta タグの元の charset は使わない）
+            return "text/html; charset=utf-8"
+        return content_type
+
+    def _replay_cached(
+        self, key: bytes, url: str, cache: Cache, advance_cursor: bool = True
+    ) -> bool:
+        """
+        キャッシュのページを parse する（リクエストもレート制限のトークンも使わない）
+
+        キャッシュから読めなかった場合は False を返す。
+        """
+        try:
+            with self._stage("cache_read", url):
+                raw, content_type = cache.read_with_content_type(url)
+            if raw is None:
+                return False
+            body = raw
+            if cache.compressed:
+                with self._stage("decompress", url):
+                    body = brotli.decompress(raw)
+        except Exception as e:
+            self.cache_log.warning("cache read failed: %s (%s)", url, e)
+            return False
+
+        try:
+            html = decode_body(body, self._cached_content_type(content_type))
+            if not self._is_duplicate(url, html):
+                self._parse_and_write(url, html)
+        except Exception as e:
+            self.log.error(e)
+            self._count_failure(e)
+            if self.fetch_strategy == FetchStrategy.STOP_ON_FAIL:
+                self.running = False
+                return True
+        else:
+            self.metrics.count("cached")
+        if advance_cursor:
+            self._advance_cursor(key, url)
+        return True
+
+    def _process_sync(
+        self,
+        session,
+        key: bytes,
+        url: str,
+        cached: bool,
+        cache: Cache | None,
+        cache_policy: CachePolicy,
+        advance_cursor: bool = True,
+    ):
+        if cached and self._replay_cached(key, url, cache, advance_cursor):
+            return
+        if cache is not None and cache_policy == CachePolicy.CACHE_ONLY:
+            self.metrics.count("cache_miss")
+            if advance_cursor:
+                self._advance_cursor(key, url)
+            return
+        self._fetch_one_sync(
+            session,
+            key,
+            url,
+            cache=cache,
+            advance_cursor=advance_cursor,
+            cache_policy=cache_policy,
+        )
+
+    async def scrape_async(
+        self,
+        progress: bool = False,
+        ssl: bool = True,
+        frontier=None,
+        cache: Cache | None = None,
+        cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+        cache_max_age: float | None = None,
+    ):
+        """
+        Args:
+            frontier: DiskURLManager.follow() を渡すと、フロンティアへの追加を待ちながら取得し続ける
+            cache: 取得したページの保存先
+            cache_policy: キャッシュの使い方（CachePolicy）
+            cache_max_age: READ_THROUGH でキャッシュを使う保存からの最大の秒数（省略時は無期限）
+        """
+        _check_cache_policy(cache, cache_policy)
         if self.url_manager.get_cursor() == self.url_manager.upper:
             self.url_manager.set_cursor()
 
         pbar = None
         if progress:
             pbar = tqdm(
-                total=self.url_manager.urls_total,
+                # フォロー中は総数が増え続けるので件数だけを表示する
+                total=None if frontier else self.url_manager.urls_total,
                 initial=self.url_manager.url_current_index,
                 desc=f"Scraping {self.host}",
             )
 
-        connector = aiohttp.TCPConnector(limit_per_host=self.max_concurrency, ssl=ssl)
+        connector = self.http.connector(limit_per_host=self.max_concurrency, ssl=ssl)
         async with aiohttp.ClientSession(
-            connector=connector, headers=self.headers
+            connector=connector,
+            headers=self.headers,
+            trace_configs=[trace_config()] if self.tracer.enabled else None,
         ) as session:
             sem = asyncio.Semaphore(self.max_concurrency)
 
-            async def worker(key: bytes, url: str):
-                async with sem:
-                    await self._fetch_one(session, key, url)
+            async def worker(key: bytes, url: str, advance_cursor: bool, cached: bool):
+                if not (cached and self._replay_cached(key, url, cache, advance_cursor)):
+                    if cache is not None and cache_policy == CachePolicy.CACHE_ONLY:
+                        self.metrics.count("cache_miss")
+                        if advance_cursor:
+                            self._advance_cursor(key, url)
+                    else:
+                        async with sem:
+                            await self._fetch_one(
+                                session,
+                                key,
+                                url,
+                                advance_cursor=advance_cursor,
+                                cache=cache,
+                                cache_policy=cache_policy,
+                            )
                 if pbar:
                     pbar.update(1)
 
             tasks = []
             try:
-                for key, url in self.url_manager.to_iter(self.url_manager.get_cursor()):
+                for target in self._with_cache_lookup(
+                    self._iter_targets(self.url_manager.get_cursor(), frontier),
+                    cache,
+                    cache_policy,
+                    cache_max_age,
+                ):
+                    if target is None:
+                        # 追加を待つ間も取得中のタスクは進む
+                        await asyncio.to_thread(
+                            self.url_manager.wait_for_writes, FOLLOW_POLL_INTERVAL
+                        )
+                        continue
+                    key, url, from_frontier, cached = target
                     tasks.append(
                         asyncio.create_task(
-                            worker(key.decode("utf-8"), url.decode("utf-8"))
+                            worker(key, url.decode("utf-8"), from_frontier, cached)
                         )
                     )
 
@@ -215,8 +746,21 @@ class Scraper:
         ssl: bool = True,
         cache: Cache | None = None,
         url_filter: str | None = None,
+        workers: int | None = None,
+        frontier=None,
+        cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+        cache_max_age: float | None = None,
     ):
+        """
+        Args:
+            workers: 並行してリクエストを送るスレッド数（省略時は http_client.max_workers）
+            frontier: DiskURLManager.follow() を渡すと、フロンティアへの追加を待ちながら取得し続ける
+            cache_policy: キャッシュの使い方（CachePolicy）
+            cache_max_age: READ_THROUGH でキャッシュを使う保存からの最大の秒数（省略時は無期限）
+        """
+        _check_cache_policy(cache, cache_policy)
         self.running = True
+        workers = workers or self.http.max_workers
 
         if self.url_manager.get_cursor() == self.url_manager.upper:
             self.url_manager.set_cursor()
@@ -224,46 +768,204 @@ class Scraper:
         pbar = None
         if progress:
             pbar = tqdm(
-                total=self.url_manager.urls_total,
+                total=None if frontier else self.url_manager.urls_total,
                 initial=self.url_manager.url_current_index,
                 desc=f"Scraping {self.host}",
             )
 
-        session = requests.Session()
-        if not ssl:
-            session.verify = False
+        self.http.verify = ssl
+        ptn = re.compile(url_filter) if url_filter else None
 
-        try:
-            for key, url in self.url_manager.to_iter(self.url_manager.get_cursor()):
-                key_str = key.decode("utf-8")
+        def candidates():
+            for target in self._iter_targets(self.url_manager.get_cursor(), frontier):
+                if target is None:
+                    yield None
+                    continue
+                key, url, from_frontier = target
                 url_str = url.decode("utf-8")
 
-                if url_filter:
-                    ptn = re.compile(url_filter)
-                    if not ptn.search(url_str):
-                        continue
+                if ptn and not ptn.search(url_str):
+                    continue
                 if url_str.startswith("/") or not url_str.startswith("http"):
                     url_str = f"https://{self.host}{url_str}"
+                yield key, url_str, from_frontier
 
-                self._fetch_one_sync(session, key_str, url_str, cache=cache)
+        def targets():
+            for target in self._with_cache_lookup(
+                candidates(), cache, cache_policy, cache_max_age
+            ):
+                if target is None:
+                    self.url_manager.wait_for_writes(FOLLOW_POLL_INTERVAL)
+                    continue
+                yield target
 
+        try:
+            if workers > 1:
+                self._scrape_sync_threaded(targets(), workers, cache, pbar, cache_policy)
                 if not self.running:
                     return
+            else:
+                for key, url_str, from_frontier, cached in targets():
+                    self._process_sync(
+                        self.http.session,
+                        key,
+                        url_str,
+                        cached,
+                        cache,
+                        cache_policy,
+                        advance_cursor=from_frontier,
+                    )
 
-                if pbar:
-                    pbar.update(1)
+                    if not self.running:
+                        return
+
+                    if pbar:
+                        pbar.update(1)
 
         finally:
             if pbar:
                 pbar.close()
-            session.close()
 
         # 終了位置を保存
         self.url_manager.set_cursor()
 
+    def _scrape_sync_threaded(
+        self,
+        targets,
+        workers: int,
+        cache,
+        pbar,
+        cache_policy: CachePolicy = CachePolicy.WRITE_ONLY,
+    ):
+        """
+        スレッドプールでまとめて取得する。カーソルはバッチがすべて終わってから進める
+        """
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                batch = list(itertools.islice(targets, workers * 4))
+                if not batch:
+                    return
+
+                futures = [
+                    pool.submit(
+                        self._process_sync,
+                        self.http.session,
+                        key,
+                        url_str,
+                        cached,
+                        cache,
+                        cache_policy,
+                        advance_cursor=False,
+                    )
+                    for key, url_str, _, cached in batch
+                ]
+                for future in futures:
+                    future.result()
+                    if pbar:
+                        pbar.update(1)
+
+                if not self.running:
+                    return
+
+                frontier_keys = [k for k, _, from_frontier, _ in batch if from_frontier]
+                if frontier_keys:
+                    self._advance_cursor(frontier_keys[-1])
+
     def scrape(self, progress: bool = False):
         return asyncio.run(self.scrape_async(progress=progress))
 
+    def scrape_procs(self, procs: int, progress: bool = False, **kwargs):
+        """
+        procs 個のワーカープロセスでフロンティアを取得する（シャードごとのカーソルで再開する）
+
+        ワーカーではこのクラスを引数なしで作り直す。parse した行はこのインスタンスのシンクに書く。
+
+        Args:
+            **kwargs: py_stream_scraper.procs.run_procs に渡す引数（cache_factory など）
+        """
+        from .procs import run_procs
+
+        return run_procs(self, type(self), procs, progress=progress, **kwargs)
+
+    def scrape_follow(
+        self,
+        source: Iterable[str] | Callable[[], None] | None = None,
+        progress: bool = False,
+        sync: bool = False,
+        **kwargs,
+    ):
+        """
+        source からフロンティアにURLを追加しながら、追加されたそばから取得する
+
+        収集と取得を並行に行うので、全体の所要時間は収集と取得の合計ではなく長い方になる。
+        source がすべて追加し終え、フロンティアを取得し終えたら戻る。
+
+        Args:
+            source: URLのイテラブル（stdin の行など）か、フロンティアにURLを追加する関数
+                （discover_urls など）。省略時は discover_urls
+            sync: True なら scrape_sync、False なら scrape_async で取得する
+            **kwargs: scrape_sync / scrape_async に渡す引数
+        """
+        _check_cache_policy(
+            kwargs.get("cache"), kwargs.get("cache_policy", CachePolicy.WRITE_ONLY)
+        )
+        if source is None:
+            source = self.discover_urls
+        if self.url_manager.get_cursor() == self.url_manager.upper:
+            self.url_manager.set_cursor()
+
+        done = threading.Event()
+        errors = []
+        # 追加の記録は収集を始める前に始めておく
+        frontier = self.url_manager.follow(done, self.url_manager.get_cursor())
+
+        def produce():
+            try:
+                if callable(source):
+                    source()
+                    return
+                for line in source:
+                    url = line.strip()
+                    if url:
+                        self.url_manager.add_urls([url])
+            except BaseException as e:
+                self.log.error("url source failed: %s", e)
+                errors.append(e)
+            finally:
+                done.set()
+
+        producer = threading.Thread(target=produce, name="sx-follow", daemon=True)
+        producer.start()
+        try:
+            if sync:
+                self.scrape_sync(progress=progress, frontier=frontier, **kwargs)
+            else:
+                asyncio.run(
+                    self.scrape_async(progress=progress, frontier=frontier, **kwargs)
+                )
+        finally:
+            frontier.close()
+            self.url_manager.stop_follow()
+        # 途中で止まった場合（STOP_ON_FAIL など）は収集の終わりを待たない
+        if done.is_set():
+            producer.join()
+        if errors:
+            raise errors[0]
+
+
+def _as_str(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _message_field(data: dict, name: str) -> str:
+    return _as_str(data.get(name, data.get(name.encode("utf-8"))))
+
+
+def _check_cache_policy(cache: Cache | None, cache_policy: CachePolicy):
+    # キャッシュがないと CACHE_ONLY の判定を素通りして、すべてネットワークから取得してしまう
+    if cache is None and cache_policy == CachePolicy.CACHE_ONLY:
+        raise ValueError("cache_policy=CACHE_ONLY requires a cache")
+
 
 class DistributedScraper(Scraper):
     def __init__(
@@ -274,129 +976,568 @@ class DistributedScraper(Scraper):
         max_concurrency=10,
         fetch_strategy=FetchStrategy.STOP_ON_FAIL,
         consumer_name: str | None = None,
+        recrawl: bool = False,
+        adaptive_rate: bool = False,
+        min_qps: float | None = None,
+        max_qps: float | None = None,
+        http_client: HTTPClient | None = None,
+        raw_cache: bool = False,
+        metrics: MetricsRegistry | None = None,
+        tracer: Tracer | None = None,
+        storage: StorageConfig | None = None,
+        shard_id: int | None = None,
+        num_shards: int = 1,
+        claim_idle_ms: int = 60_000,
+        claim_interval: float = 10.0,
+        claim_batch: int = 100,
+        max_deliveries: int = 5,
+        dead_letter_stream: str | None = None,
+        stream_shards: int = 1,
     ):
+        """
+        Args:
+            claim_idle_ms: この時間（ミリ秒）以上確認されないメッセージを他のワーカーから引き取る
+            claim_interval: 止まったメッセージを探す間隔（秒）
+            claim_batch: 1回に引き取るメッセージ数の上限
+            max_deliveries: この回数配信しても確認されないメッセージはデッドレターに移す
+            dead_letter_stream: デッドレターのストリーム名（省略時は "{stream_name}:dead"）
+            stream_shards: 配信ストリームのシャード数。2以上なら "{stream_name}:{i}" に
+                URLのハッシュで分けて配信し、シャードごとの XREADGROUP をパイプラインで
+                まとめて読む（Redis Cluster ではシャードが別のノードに分かれる。
+                start_stream とワーカーで同じ値にすること）
+        """
         super().__init__(
             host,
             qps,
             redis_client=redis_client,
             max_concurrency=max_concurrency,
             fetch_strategy=fetch_strategy,
+            recrawl=recrawl,
+            adaptive_rate=adaptive_rate,
+            min_qps=min_qps,
+            max_qps=max_qps,
+            http_client=http_client,
+            raw_cache=raw_cache,
+            metrics=metrics,
+            tracer=tracer,
+            storage=storage,
+            shard_id=shard_id,
+            num_shards=num_shards,
         )
 
+        self.lease_log = subsystem_logger("lease")
         self.consumer_name = consumer_name or f"{socket.gethostname()}:{os.getpid()}"
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+        self.claim_batch = claim_batch
+        self.max_deliveries = max_deliveries
+        self.dead_letter_stream = dead_letter_stream or f"{self.stream_name}:dead"
+        # recrawl の状態は start_stream を実行するノードの DB にあるので、
+        # ワーカーは取得結果をこのストリームで送り返す
+        self.recrawl_stream = f"stream-scraper:recrawl:{self.host}"
+        self.stream_shards = stream_shards
+        self.stream_names = stream_names(host, stream_shards)
+        # 受け取ってから確認するまでのメッセージ（ストリーム名, ID）
+        # （取得を待っている間もバックグラウンドでリースを延長する）
+        self._leases = set()
+        self._lease_lock = threading.Lock()
+        # バックグラウンドで引き取ったメッセージ
+        self._reclaimed = queue.Queue()
+        # 全シャードが空のときに新しいメッセージを待つシャード（順番に回す）
+        self._block_shard = 0
 
-        try:
-            self.redis.xgroup_create(
-                self.stream_name, "scrapers", id="0", mkstream=True
+        for name in self.stream_names:
+            try:
+                self.redis.xgroup_create(name, "scrapers", id="0", mkstream=True)
+            except:
+                pass
+
+    def _setup_rate_controller(self, min_qps: float, max_qps: float):
+        # 全ワーカーで Redis 上のトークンバケットとレートを共有する
+        self.limiter = Limiter(
+            self.qps, max(1, math.ceil(max_qps)), RedisStorage(self.redis)
+        )
+        self.rate_controller = AIMDController(
+            self.limiter,
+            min_qps,
+            max_qps,
+            redis_client=self.redis,
+            key=self.host,
+        )
+
+    def _message_url(self, data: dict) -> str:
+        return _message_field(data, "url")
+
+    def _dead_letter(self, stream: str, entries: list, min_idle_ms: int):
+        """
+        配信回数の上限に達したメッセージをデッドレター用のストリームに移す
+        """
+        ids = [e["message_id"] for e in entries]
+        # JUSTID で所有権だけを取る（配信回数を増やさず、本文も転送しない）。
+        # 他のワーカーが先に処理していれば空になるので二重に移すことはない
+        claimed = set(
+            _as_str(i)
+            for i in self.redis.xclaim(
+                stream,
+                "scrapers",
+                self.consumer_name,
+                min_idle_ms,
+                ids,
+                justid=True,
+            )
+        )
+        for entry in entries:
+            msg_id = _as_str(entry["message_id"])
+            if msg_id not in claimed:
+                continue
+            messages = self.redis.xrange(stream, msg_id, msg_id)
+            url = self._message_url(messages[0][1]) if messages else ""
+            self.redis.xadd(
+                self.dead_letter_stream,
+                {
+                    "url": url,
+                    "msg_id": msg_id,
+                    "stream": stream,
+                    "deliveries": entry["times_delivered"],
+                    "consumer": _as_str(entry["consumer"]),
+                },
+            )
+            self.redis.xack(stream, "scrapers", msg_id)
+            self._release(stream, msg_id)
+            self.metrics.count("dead_lettered")
+            self.lease_log.warning(
+                "dead-lettered: %s (%s deliveries)", url, entry["times_delivered"]
             )
-        except:
-            pass
 
-    def recover_stuck_messages(
-        self,
-        session,
-        cache: Cache | None = None,
-        url_filter: str | None = None,
-        min_idle_ms: int = 60_000,
-        batch: int = 100,
+    def claim_stuck_messages(
+        self, min_idle_ms: int | None = None, batch: int = 100, shard: int = 0
     ):
+        """
+        min_idle_ms 以上確認されていないメッセージを自分のコンシューマーに移して返す
+
+        配信回数が max_deliveries に達したものは返さずにデッドレターに移す。
+
+        Args:
+            shard: 対象のシャード番号（stream_names の位置）
+
+        Returns:
+            (msg_id, data) のリスト
+        """
+        if min_idle_ms is None:
+            min_idle_ms = self.claim_idle_ms
+        stream = self.stream_names[shard]
+
+        poison = [
+            e
+            for e in self.redis.xpending_range(
+                stream,
+                "scrapers",
+                "-",
+                "+",
+                batch,
+                # IDLE 0 は指定しないのと同じ
+                idle=min_idle_ms or None,
+            )
+            if e["times_delivered"] >= self.max_deliveries
+        ]
+        if poison:
+            self._dead_letter(stream, poison, min_idle_ms)
+
+        claimed = []
         cursor = "0-0"
-        while True:
-            cursor, messages, _ = self.redis.xautoclaim(
-                self.stream_name,
+        while len(claimed) < batch:
+            cursor, messages, *_ = self.redis.xautoclaim(
+                stream,
                 "scrapers",
                 self.consumer_name,
                 min_idle_ms,
                 cursor,
-                count=batch,
+                count=batch - len(claimed),
             )
-
-            if not messages:
+            # 削除済みのメッセージは data が None になる
+            claimed.extend((i, d) for i, d in messages if d)
+            if _as_str(cursor) == "0-0":
                 break
+        return claimed
 
-            for msg_id, data in messages:
-                url_str = data[b"url"].decode("utf-8")
+    def _claim_all_shards(self, min_idle_ms: int | None = None, batch: int = 100):
+        """
+        全シャードから止まっているメッセージを引き取り、(stream, msg_id, data) で返す
+        """
+        claimed = []
+        for shard, stream in enumerate(self.stream_names):
+            claimed.extend(
+                (stream, msg_id, data)
+                for msg_id, data in self.claim_stuck_messages(min_idle_ms, batch, shard)
+            )
+        return claimed
 
-                if url_filter:
-                    ptn = re.compile(url_filter)
-                    if not ptn.search(url_str):
-                        continue
-                if url_str.startswith("/") or not url_str.startswith("http"):
-                    url_str = f"https://{self.host}{url_str}"
+    def recover_stuck_messages(
+        self,
+        session,
+        cache: Cache | None = None,
+        url_filter: str | None = None,
+        min_idle_ms: int | None = None,
+        batch: int = 100,
+    ):
+        """
+        止まっているメッセージを引き取り、その場で処理する
+        """
+        ptn = re.compile(url_filter) if url_filter else None
+        while True:
+            messages = self._claim_all_shards(min_idle_ms, batch)
+            if not messages:
+                return
+            self._hold(messages)
 
-                self._fetch_one_sync(session, url_str, msg_id, cache=cache)
+            for stream, msg_id, data in messages:
+                url_str = self._normalize_message(data, ptn)
+                if url_str is None:
+                    self._ack(stream, msg_id)
+                    continue
+                self._fetch_one_sync(session, url_str, stream, msg_id, cache=cache)
 
                 if not self.running:
                     return
+            if len(messages) < batch * len(self.stream_names):
+                return
+
+    def _read_shards(self, count: int, block: bool) -> list:
+        """
+        全シャードから合わせて count 件程度を読み、(stream, msg_id, data) で返す
+
+        シャードのキーは Redis Cluster では別のスロットになり、1回の XREADGROUP では
+        読めない（CROSSSLOT）ので、シャードごとの XREADGROUP をパイプラインで送る。
+        どのシャードも空で block なら、順番に1つのシャードで新しいメッセージを待つ。
+        """
+        names = self.stream_names
+        per_stream = -(-count // len(names))
+
+        def read(pipe, name, block_ms):
+            return pipe.xreadgroup(
+                groupname="scrapers",
+                consumername=self.consumer_name,
+                streams={name: ">"},
+                count=per_stream,
+                block=block_ms,
+            )
+
+        if len(names) == 1:
+            results = [read(self.redis, names[0], 5000 if block else None)]
+        else:
+            pipe = self.redis.pipeline(transaction=False)
+            for name in names:
+                read(pipe, name, None)
+            results = pipe.execute()
+            if block and not any(results):
+                # 待つ時間をシャード数で分け、どのシャードに入ってもすぐ気づけるようにする
+                name = names[self._block_shard]
+                self._block_shard = (self._block_shard + 1) % len(names)
+                results = [read(self.redis, name, max(100, 5000 // len(names)))]
+
+        messages = []
+        for read_res in results:
+            for stream, stream_messages in read_res or []:
+                stream = _as_str(stream)
+                messages.extend((stream, msg_id, data) for msg_id, data in stream_messages)
+        return messages
+
+    def _hold(self, messages):
+        """
+        受け取ったメッセージ（stream, msg_id, data）をリースの延長の対象にする
+        """
+        with self._lease_lock:
+            self._leases.update((m[0], _as_str(m[1])) for m in messages)
+
+    def _release(self, stream: str, msg_id):
+        with self._lease_lock:
+            self._leases.discard((stream, _as_str(msg_id)))
+
+    def _ack(self, stream: str, msg_id):
+        self.redis.xack(stream, "scrapers", msg_id)
+        self._release(stream, msg_id)
+        record_ack(self.redis, self.host)
+
+    def status(self, window: float = 60.0) -> StreamStatus:
+        """
+        配信ストリームのバックログ、lag、pending、ack レートを返す（全シャードの合計）
+        """
+        return stream_status(self.redis, self.host, window, shards=self.stream_shards)
+
+    def _normalize_message(self, data: dict, ptn) -> str | None:
+        url_str = self._message_url(data)
+        if ptn and not ptn.search(url_str):
+            return None
+        if url_str.startswith("/") or not url_str.startswith("http"):
+            url_str = f"https://{self.host}{url_str}"
+        return url_str
+
+    def _lease_loop(self, stop: threading.Event):
+        """
+        バックグラウンドで処理中のメッセージのリースを延長し、止まったメッセージを引き取る
+        """
+        heartbeat = max(0.05, self.claim_idle_ms / 3000)
+        next_claim = 0.0
+        while not stop.wait(min(heartbeat, self.claim_interval)):
+            try:
+                with self._lease_lock:
+                    leases = list(self._leases)
+                by_stream = {}
+                for stream, msg_id in leases:
+                    by_stream.setdefault(stream, []).append(msg_id)
+                for stream, ids in by_stream.items():
+                    # 自分に付け直して idle 時間をリセットする（JUSTID なので配信回数は増えない）
+                    self.redis.xclaim(
+                        stream,
+                        "scrapers",
+                        self.consumer_name,
+                        0,
+                        ids,
+                        justid=True,
+                    )
+
+                now = time.monotonic()
+                if now >= next_claim and self._reclaimed.qsize() < self.claim_batch:
+                    next_claim = now + self.claim_interval
+                    for message in self._claim_all_shards(batch=self.claim_batch):
+                        with self._lease_lock:
+                            lease = (message[0], _as_str(message[1]))
+                            if lease in self._leases:
+                                continue
+                            # キューで待っている間もリースを延長する
+                            self._leases.add(lease)
+                        self._reclaimed.put(message)
+            except redis.RedisError as e:
+                self.lease_log.warning("lease loop: %s", e)
 
     def scrape_sync(
         self,
         ssl: bool = True,
         cache: Cache | None = None,
         url_filter: str | None = None,
+        workers: int | None = None,
     ):
+        """
+        Args:
+            workers: 並行してリクエストを送るスレッド数（省略時は http_client.max_workers）
+        """
         self.running = True
+        workers = workers or self.http.max_workers
 
-        session = requests.Session()
-        if not ssl:
-            session.verify = False
+        # セッションはバッチをまたいで使い回す（接続を再利用するため閉じない）
+        self.http.verify = ssl
+        session = self.http.session
 
         self.recover_stuck_messages(session, cache=cache, url_filter=url_filter)
+        ptn = re.compile(url_filter) if url_filter else None
 
-        while True:
-            read_res = self.redis.xreadgroup(
-                groupname="scrapers",
-                consumername=str(uuid.uuid4()),
-                streams={self.stream_name: ">"},
-                count=10,
-                block=5000,
-            )
-            try:
-                for stream, messages in read_res:
-                    for msg_id, data in messages:
-                        url_str = data[b"url"].decode("utf-8")
+        stop = threading.Event()
+        lease_thread = threading.Thread(
+            target=self._lease_loop, args=(stop,), daemon=True
+        )
+        lease_thread.start()
 
-                        if url_filter:
-                            ptn = re.compile(url_filter)
-                            if not ptn.search(url_str):
-                                continue
-                        if url_str.startswith("/") or not url_str.startswith("http"):
-                            url_str = f"https://{self.host}{url_str}"
+        reported_at = 0.0
+        jobs = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while self.running:
+                    if time.monotonic() - reported_at >= 10:
+                        self.report_stream_metrics()
+                        reported_at = time.monotonic()
 
-                        self._fetch_one_sync(session, url_str, msg_id, cache=cache)
+                    count = max(10, workers * 4)
+                    messages = []
+                    while len(messages) < count and not self._reclaimed.empty():
+                        messages.append(self._reclaimed.get_nowait())
+
+                    if len(messages) < count:
+                        # 引き取ったメッセージがあるときは待たない
+                        messages.extend(
+                            self._read_shards(count - len(messages), not messages)
+                        )
+                    # 取得を始めるまでの間に他のワーカーに引き取られないようにする
+                    self._hold(messages)
+
+                    jobs = []
+                    for stream, msg_id, data in messages:
+                        url_str = self._normalize_message(data, ptn)
+                        if url_str is None:
+                            self._ack(stream, msg_id)
+                            continue
+                        jobs.append((url_str, stream, msg_id))
+
+                    if workers > 1:
+                        futures = [
+                            pool.submit(
+                                self._fetch_one_sync,
+                                session,
+                                url_str,
+                                stream,
+                                msg_id,
+                                cache=cache,
+                            )
+                            for url_str, stream, msg_id in jobs
+                        ]
+                        for future in futures:
+                            future.result()
+                        continue
+
+                    for url_str, stream, msg_id in jobs:
+                        self._fetch_one_sync(
+                            session, url_str, stream, msg_id, cache=cache
+                        )
 
                         if not self.running:
                             return
-            finally:
-                session.close()
+        finally:
+            stop.set()
+            lease_thread.join()
+            # 止めたときに取得しなかった分は、リースを外して他のワーカーに任せる
+            for _, stream, msg_id in jobs:
+                self._release(stream, msg_id)
 
-    def _fetch_one_sync(self, session, url, msg_id, cache: Cache | None = None):
-        time.sleep(1.0 / self.qps)
+    def _fetch_one_sync(
+        self, session, url, stream: str, msg_id, cache: Cache | None = None
+    ):
+        lease = (stream, _as_str(msg_id))
+        with self._lease_lock:
+            self._leases.add(lease)
+        try:
+            self._fetch_message(session, url, *lease, cache)
+        finally:
+            # 確認しなかった（失敗した）メッセージは idle になって再配信される
+            self._release(*lease)
+
+    def _fetch_message(
+        self, session, url, stream: str, msg_id, cache: Cache | None = None
+    ):
+        self._throttle_sync(url)
+        started = time.monotonic()
+        self.metrics.inflight.inc(host=self.host)
         try:
-            self.log.info(f"fetching: {url}")
+            self.fetch_log.info("fetching: %s", url)
             with session.get(
-                url, headers=self.headers, allow_redirects=True, timeout=15
+                url,
+                headers=self.headers,
+                allow_redirects=True,
+                timeout=self.http.timeout,
+                stream=True,
             ) as resp:
+                self._observe(
+                    resp.status_code, started, resp.headers.get("Retry-After")
+                )
+                if self.tracer.enabled:
+                    self.tracer.record("ttfb", resp.elapsed.total_seconds(), url)
                 resp.raise_for_status()
                 if resp.status_code == 200:
-                    html = resp.text
-                    self.redis.xack(self.stream_name, "scrapers", msg_id)
-                    if cache:
-                        compressed = brotli.compress(html.encode("utf-8"))
-                        cache.write(url, compressed)
-                    else:
-                        parsed = self.parse(url, html)
-                        self.sink.write(parsed)
+                    with self._stage("body_read", url):
+                        body = self.http.read(resp)
+                    self._observe_fetch(started)
+                    self._ack(stream, msg_id)
+                    if self.recrawl:
+                        self.redis.xadd(
+                            self.recrawl_stream,
+                            {
+                                "url": url,
+                                "hash": content_digest(body),
+                                "fetched_at": time.time(),
+                            },
+                        )
+                    self._handle_body_sync(url, body, resp, cache)
+                    self.metrics.count("fetched", resp.status_code)
+        except ResponseRejected as e:
+            # 対象外のレスポンスは配信済みとして扱い、再配信させない
+            self.fetch_log.warning("skipped: %s (%s)", url, e)
+            self._count_failure(e)
+            self._ack(stream, msg_id)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self._observe(None, started)
+            self.log.error(e)
+            self._count_failure(e)
+            if self.fetch_strategy == FetchStrategy.STOP_ON_FAIL:
+                self.running = False
         except Exception as e:
             self.log.error(e)
+            self._count_failure(e)
             if self.fetch_strategy == FetchStrategy.STOP_ON_FAIL:
                 self.running = False
+        finally:
+            self.metrics.inflight.dec(host=self.host)
+
+    def report_stream_metrics(self):
+        """
+        コンシューマーグループの未確認件数（pending）と未配信件数（lag）をゲージに反映する
+        （全シャードの合計）
+        """
+        pending = 0
+        lag = 0
+        for stream in self.stream_names:
+            for group in self.redis.xinfo_groups(stream):
+                name = group["name"]
+                if isinstance(name, bytes):
+                    name = name.decode("utf-8")
+                if name != "scrapers":
+                    continue
+                pending += group["pending"]
+                if lag is not None and group.get("lag") is not None:
+                    lag += group["lag"]
+                else:
+                    # lag を返さない（Redis 7 未満の）シャードがあれば合計できない
+                    lag = None
+        self.metrics.stream_pending.set(pending, host=self.host)
+        if lag is not None:
+            self.metrics.stream_lag.set(lag, host=self.host)
 
     def scrape(self, progress: bool = False):
         return asyncio.run(self.scrape_async(progress=progress))
 
-    def start_stream(self):
-        for key, value in self.url_manager.to_iter(self.url_manager.lower):
+    def collect_recrawl_results(self, batch_size: int = 1000) -> int:
+        """
+        ワーカーが送り返した取得結果を recrawl に記録し、記録した件数を返す
+
+        start_stream の最初に呼ばれる。記録した結果はストリームから消す。
+        """
+        if not self.recrawl:
+            return 0
+        count = 0
+        while True:
+            entries = self.redis.xrange(self.recrawl_stream, count=batch_size)
+            if not entries:
+                return count
+            for _, data in entries:
+                self.recrawl.record_digest(
+                    _message_field(data, "url"),
+                    _message_field(data, "hash"),
+                    float(_message_field(data, "fetched_at")),
+                )
+            self.redis.xdel(self.recrawl_stream, *[msg_id for msg_id, _ in entries])
+            count += len(entries)
+
+    def start_stream(self, batch_size: int = 500):
+        """
+        フロンティアのURLを配信ストリームに追加する
+
+        シャードに分けている場合は、フロンティアのシャードと同じURLのハッシュで
+        配信先のストリームを決める（同じURLは常に同じシャードに入る）。
+        XADD は batch_size 件ごとにパイプラインでまとめて送る。
+
+        recrawl が有効な場合は、ワーカーが送り返した取得結果をこのノードの DB に記録してから、
+        再取得予定を過ぎたURLと未取得のURLだけを配信する（ワーカーも recrawl=True にする）。
+        """
+        offset = len(self.url_manager.lower)
+        self.collect_recrawl_results()
+        pipe = self.redis.pipeline(transaction=False)
+        pending = 0
+        # 再取得予定を過ぎたURLを先に配信する
+        for key, value, _ in self._iter_targets(self.url_manager.lower):
             url_str = value.decode("utf-8")
-            self.log.info(f"streaming: {url_str}")
-            self.redis.xadd(self.stream_name, {"url": url_str})
+            self.fetch_log.info("streaming: %s", url_str)
+            shard = shard_of(key[offset:], self.stream_shards)
+            pipe.xadd(self.stream_names[shard], {"url": url_str})
+            pending += 1
+            if pending >= batch_size:
+                pipe.execute()
+                pending = 0
+        if pending:
+            pipe.execute()
@@ -2,10 +2,15 @@
 データシンク（保存先）を定義するモジュール
 """
 import csv
+import hashlib
 import json
+import re
+import sqlite3
+import threading
+import time
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Union
 
 
 class Sink(ABC):
@@ -49,17 +54,23 @@ class FileSink(Sink):
         self._file = None
         self._writer = None
         self._headers_written = False
+        # スレッドプールで parse した行を複数のスレッドから書き込むため
+        self._lock = threading.Lock()
 
         # ディレクトリが存在しない場合は作成
         self.filepath.parent.mkdir(parents=True, exist_ok=True)
 
     def write(self, data: Any) -> None:
         """
-        データをCSVファイルに書き込む
+        データをCSVファイルに書き込む（複数のスレッドから呼んでもよい）
 
         Args:
             data: 辞書、辞書のリスト、またはその他のデータ
         """
+        with self._lock:
+            self._write(data)
+
+    def _write(self, data: Any) -> None:
         if self._file is None:
             self._file = open(self.filepath, self.mode, encoding=self.encoding, newline='')
 
@@ -95,11 +106,12 @@ class FileSink(Sink):
         """
         ファイルをクローズする
         """
-        if self._file:
-            self._file.close()
-            self._file = None
-            self._writer = None
-            self._headers_written = False
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+                self._writer = None
+                self._headers_written = False
 
     def __enter__(self):
         return self
@@ -138,3 +150,199 @@ class ConsoleSink(Sink):
         何もしない（コンソール出力なのでクローズ不要）
         """
         pass
+
+
+class NullSink(Sink):
+    """
+    データを捨てるSink（計測やドライランで使う）
+    """
+
+    def write(self, data: Any) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def record_hash(data: Dict[str, Any]) -> str:
+    """
+    レコードの内容のハッシュ（列の順序によらない）
+    """
+    raw = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SQLiteSink(Sink):
+    """
+    SQLite にレコードを自然キーで upsert する Sink
+
+    再クロールで同じ会社・店舗のレコードが何度来ても1行にまとめる。レコードの内容の
+    ハッシュを比べ、変わらなければ何も書かない。変わった場合は {table}_changes に
+    変わった列だけを記録する。書き込みは batch_size 件ごとに1つのトランザクションで
+    executemany する（WAL モード）。
+
+    changes に別の Sink を渡すと、新しいレコードと内容が変わったレコードだけをそこにも書く。
+
+    テーブルの構成:
+        {table}(key, data, hash, first_seen, updated_at, version)
+        {table}_changes(key, changed_at, fields)  -- fields は {列: [変更前, 変更後]} の JSON
+    """
+
+    def __init__(
+        self,
+        path: str,
+        key: Union[str, Sequence[str]] = "URL",
+        table: str = "records",
+        batch_size: int = 500,
+        changes: Optional[Sink] = None,
+    ):
+        """
+        Args:
+            path: SQLite のファイルパス
+            key: 自然キーにする列（複数の列を組み合わせる場合はリスト）
+            table: テーブル名
+            batch_size: まとめて書き込む件数
+            changes: 新しいレコードと変わったレコードだけを書く Sink
+        """
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"invalid table name: {table!r}")
+        self.path = Path(path)
+        self.key = (key,) if isinstance(key, str) else tuple(key)
+        self.table = table
+        self.batch_size = batch_size
+        self.changes = changes
+        self.stats = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # スレッドプールの parse から書かれるので、接続はロックで守って共有する
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, data TEXT NOT NULL, hash TEXT NOT NULL, "
+            "first_seen REAL NOT NULL, updated_at REAL NOT NULL, version INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_changes ("
+            "key TEXT NOT NULL, changed_at REAL NOT NULL, fields TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_changes_key ON {table}_changes(key)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+
+    def _natural_key(self, data: Dict[str, Any]) -> str:
+        try:
+            return "\x1f".join(str(data[k]) for k in self.key)
+        except KeyError as e:
+            raise ValueError(f"record has no natural key column {e}") from None
+
+    def write(self, data: Any) -> None:
+        """
+        レコード（辞書、または辞書のリスト）を書く。batch_size 件たまったら書き込む
+        """
+        if data is None:
+            return
+        records = data if isinstance(data, list) else [data]
+        for record in records:
+            if not isinstance(record, dict):
+                raise ValueError("SQLiteSink accepts dicts or lists of dicts")
+            self._natural_key(record)
+        with self._lock:
+            self._pending.extend(records)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        now = time.time()
+
+        keys = list({self._natural_key(r): None for r in pending})
+        current = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, data, digest in self._conn.execute(
+                f"SELECT key, data, hash FROM {self.table} WHERE key IN ({marks})",
+                chunk,
+            ):
+                current[key] = (data, digest)
+
+        # 同じバッチに同じキーが複数あっても順に比べられるよう、current を更新しながら進める
+        upserts, change_rows, emitted = [], [], []
+        for record in pending:
+            key = self._natural_key(record)
+            digest = record_hash(record)
+            old = current.get(key)
+            if old is not None and old[1] == digest:
+                self.stats["unchanged"] += 1
+                continue
+            data = json.dumps(record, ensure_ascii=False, default=str)
+            current[key] = (data, digest)
+            upserts.append((key, data, digest, now, now))
+            emitted.append(record)
+            if old is None:
+                self.stats["inserted"] += 1
+                continue
+            self.stats["updated"] += 1
+            before = json.loads(old[0])
+            fields = {
+                k: [before.get(k), record.get(k)]
+                for k in before.keys() | record.keys()
+                if before.get(k) != record.get(k)
+            }
+            change_rows.append(
+                (key, now, json.dumps(fields, ensure_ascii=False, default=str))
+            )
+
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO {self.table} "
+                "(key, data, hash, first_seen, updated_at, version) "
+                "VALUES (?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, "
+                "hash = excluded.hash, updated_at = excluded.updated_at, "
+                "version = version + 1",
+                upserts,
+            )
+            self._conn.executemany(
+                f"INSERT INTO {self.table}_changes (key, changed_at, fields) "
+                "VALUES (?, ?, ?)",
+                change_rows,
+            )
+
+        if self.changes is not None:
+            for record in emitted:
+                self.changes.write(record)
+
+    def close(self) -> None:
+        """
+        残りを書き込んで接続を閉じる（changes の Sink も閉じる）
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            self._flush()
+            self._conn.close()
+            self._conn = None
+        if self.changes is not None:
+            self.changes.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
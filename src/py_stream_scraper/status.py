@@ -0,0 +1,256 @@
+"""
+分散スクレイピングの配信状況（Redis stream のバックログ）を集計するモジュール
+
+stream_status() はストリーム長、コンシューマーグループの未配信件数（lag）、
+コンシューマーごとの未確認件数（pending）、最も古い未確認メッセージの経過時間、
+直近の確認（ack）レート、残りを処理しきるまでの推定時間を返す。
+
+配信ストリームを stream_shards 個のシャード（stream-scraper:scrape:{host}:{i}）に
+分けている場合は、シャードごとの値を合計して返す（shards にシャードごとの内訳が入る）。
+Redis Cluster ではシャードが別のスロットになるので、複数のキーにまたがるコマンドは使わない。
+
+ack レートは DistributedScraper が確認するたびに record_ack() で数えている
+10秒単位のカウンタから計算する。
+
+serve() は状況を JSON で返す HTTP サーバーを起動する。HorizontalPodAutoscaler の
+外部メトリクスアダプター（KEDA の metrics-api など）から /status/{host} をポーリングして
+backlog や eta_seconds でワーカー数を調整できる。
+
+キーの構成:
+    stream-scraper:acks:{host}:{epoch // 10} -> 10秒間に確認した件数（1時間で消える）
+"""
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+ACK_PREFIX = "stream-scraper:acks:"
+ACK_BUCKET_SECONDS = 10
+ACK_TTL = 3600
+
+GROUP = "scrapers"
+
+
+def stream_name(host: str, shard: Optional[int] = None) -> str:
+    """
+    配信ストリーム名（shard を指定するとそのシャードのストリーム名）
+    """
+    name = f"stream-scraper:scrape:{host}"
+    return name if shard is None else f"{name}:{shard}"
+
+
+def stream_names(host: str, shards: int = 1) -> List[str]:
+    """
+    シャードのストリーム名のリスト（1つなら分けずに stream_name(host) を使う）
+    """
+    if shards < 1:
+        raise ValueError("shards must be >= 1")
+    if shards == 1:
+        return [stream_name(host)]
+    return [stream_name(host, i) for i in range(shards)]
+
+
+def _as_str(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _server_time(redis_client) -> float:
+    sec, usec = redis_client.time()
+    return int(sec) + int(usec) / 1_000_000
+
+
+def record_ack(redis_client, host: str, count: int = 1, now: Optional[float] = None):
+    """
+    確認した件数を10秒単位のカウンタに加える
+    """
+    if now is None:
+        now = time.time()
+    key = f"{ACK_PREFIX}{host}:{int(now) // ACK_BUCKET_SECONDS}"
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.incrby(key, count)
+    pipe.expire(key, ACK_TTL)
+    pipe.execute()
+
+
+def ack_rate(
+    redis_client, host: str, window: float = 60.0, now: Optional[float] = None
+) -> float:
+    """
+    直近 window 秒の確認件数/秒（進行中の10秒の区間は含めない）
+    """
+    if now is None:
+        now = time.time()
+    current = int(now) // ACK_BUCKET_SECONDS
+    n = max(1, int(window) // ACK_BUCKET_SECONDS)
+    # 区間ごとのキーは Redis Cluster では別のスロットになるので MGET ではなく GET をまとめて送る
+    pipe = redis_client.pipeline(transaction=False)
+    for b in range(current - n, current):
+        pipe.get(f"{ACK_PREFIX}{host}:{b}")
+    total = sum(int(v) for v in pipe.execute() if v is not None)
+    return total / (n * ACK_BUCKET_SECONDS)
+
+
+@dataclass
+class ConsumerStatus:
+    pending: int
+    idle_seconds: float
+
+
+@dataclass
+class ShardStatus:
+    length: int
+    lag: Optional[int]
+    pending: int
+
+
+@dataclass
+class StreamStatus:
+    host: str
+    stream: str
+    length: int
+    lag: Optional[int]
+    pending: int
+    oldest_pending_age: Optional[float]
+    ack_rate: float
+    ack_window: float
+    dead_letters: int
+    consumers: Dict[str, ConsumerStatus] = field(default_factory=dict)
+    shards: Dict[str, ShardStatus] = field(default_factory=dict)
+
+    @property
+    def backlog(self) -> int:
+        """
+        まだ確認されていない件数（未配信 + 未確認）
+        """
+        return (self.lag or 0) + self.pending
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """
+        直近の ack レートのまま処理した場合に backlog がなくなるまでの秒数
+        """
+        if self.backlog == 0:
+            return 0.0
+        if self.ack_rate <= 0:
+            return None
+        return self.backlog / self.ack_rate
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["backlog"] = self.backlog
+        data["eta_seconds"] = self.eta_seconds
+        return data
+
+
+def stream_status(
+    redis_client,
+    host: str,
+    window: float = 60.0,
+    group: str = GROUP,
+    shards: int = 1,
+) -> StreamStatus:
+    """
+    ホストの配信ストリームの状況を返す
+
+    Args:
+        redis_client: Redis クライアント
+        host: 対象ホスト
+        window: ack レートを計算する期間（秒）
+        group: コンシューマーグループ名
+        shards: 配信ストリームのシャード数
+    """
+    name = stream_name(host)
+    now = _server_time(redis_client)
+
+    lags = []
+    oldest = None
+    consumers = {}
+    per_shard = {}
+    for shard in stream_names(host, shards):
+        length = redis_client.xlen(shard)
+        lag = None
+        pending = 0
+        groups = redis_client.xinfo_groups(shard) if redis_client.exists(shard) else []
+        for info in groups:
+            if _as_str(info["name"]) != group:
+                continue
+            pending = info["pending"]
+            # lag は Redis 7 以降でのみ返される
+            lag = info.get("lag")
+
+            if pending:
+                summary = redis_client.xpending(shard, group)
+                ms = int(_as_str(summary["min"]).split("-", 1)[0])
+                age = max(0.0, now - ms / 1000)
+                oldest = age if oldest is None else max(oldest, age)
+            for c in redis_client.xinfo_consumers(shard, group):
+                c_name = _as_str(c["name"])
+                prev = consumers.get(c_name)
+                idle = c["idle"] / 1000
+                consumers[c_name] = ConsumerStatus(
+                    pending=c["pending"] + (prev.pending if prev else 0),
+                    # どれかのシャードで動いていれば動いている
+                    idle_seconds=min(idle, prev.idle_seconds) if prev else idle,
+                )
+            break
+        lags.append(lag)
+        per_shard[shard] = ShardStatus(length=length, lag=lag, pending=pending)
+
+    return StreamStatus(
+        host=host,
+        stream=name,
+        length=sum(s.length for s in per_shard.values()),
+        lag=None if None in lags else sum(lags),
+        pending=sum(s.pending for s in per_shard.values()),
+        oldest_pending_age=oldest,
+        # カウンタは各ワーカーの時計で数えているので、ここも手元の時計で読む
+        ack_rate=ack_rate(redis_client, host, window),
+        ack_window=window,
+        dead_letters=redis_client.xlen(f"{name}:dead"),
+        consumers=consumers,
+        shards=per_shard,
+    )
+
+
+def serve(
+    redis_client,
+    hosts: Sequence[str],
+    window: float = 60.0,
+    port: int = 9101,
+    addr: str = "0.0.0.0",
+    shards: int = 1,
+) -> ThreadingHTTPServer:
+    """
+    /status（全ホスト）と /status/{host} を JSON で返す HTTP サーバーをバックグラウンドで起動する
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/status":
+                data = {
+                    h: stream_status(redis_client, h, window, shards=shards).to_dict()
+                    for h in hosts
+                }
+            elif path.startswith("/status/") and path[len("/status/") :] in hosts:
+                data = stream_status(
+                    redis_client, path[len("/status/") :], window, shards=shards
+                ).to_dict()
+            else:
+                self.send_error(404)
+                return
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
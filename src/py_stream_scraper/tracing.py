@@ -0,0 +1,205 @@
+"""
+URLごとの処理時間を段階（ステージ）別に記録するトレーシングフック
+
+Scraper(tracer=...) に渡すと、トークン待ち、DNS、接続、TTFB、ボディ読み込み、
+パース、圧縮、キャッシュ書き込み、シンク書き込み、カーソル更新の所要時間が
+Tracer.record() に渡される。既定の Tracer は何もしない。
+
+DNS と接続は aiohttp の TraceConfig から取るため非同期の経路でのみ記録される。
+同期の経路の TTFB は requests の Response.elapsed（ヘッダー受信までの時間）を使う。
+"""
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+STAGES = (
+    "token_wait",
+    "dns",
+    "connect",
+    "ttfb",
+    "body_read",
+    "parse",
+    "compress",
+    "cache_write",
+    "cache_lookup",
+    "cache_read",
+    "decompress",
+    "dedupe",
+    "sink_write",
+    "cursor",
+)
+
+
+class Tracer:
+    """
+    何もしない Tracer（既定）
+
+    独自の Tracer は record() をオーバーライドする。
+    """
+
+    enabled = False
+
+    def record(self, stage: str, seconds: float, url: Optional[str] = None):
+        """
+        1つのステージの所要時間を記録する
+
+        Args:
+            stage: STAGES のいずれか
+            seconds: 所要時間（秒）
+            url: 対象のURL（バッチ単位の処理など、URLに紐づかない場合は None）
+        """
+
+    @contextmanager
+    def span(self, stage: str, url: Optional[str] = None):
+        """
+        with ブロックの所要時間を記録する
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, url)
+
+
+class CallbackTracer(Tracer):
+    """
+    ステージごとに callback(stage, seconds, url) を呼ぶ Tracer
+    """
+
+    enabled = True
+
+    def __init__(self, callback: Callable[[str, float, Optional[str]], None]):
+        self.callback = callback
+
+    def record(self, stage, seconds, url=None):
+        self.callback(stage, seconds, url)
+
+
+class TimingTracer(Tracer):
+    """
+    ステージごとの所要時間をメモリに集計する Tracer（sx profile で使う）
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.urls = set()
+
+    def record(self, stage, seconds, url=None):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if url is not None:
+                self.urls.add(url)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        ステージごとの件数、合計、平均、p50、p95（秒）を返す
+        """
+        result = {}
+        order = {s: i for i, s in enumerate(STAGES)}
+        for stage in sorted(self.samples, key=lambda s: order.get(s, len(STAGES))):
+            values = sorted(self.samples[stage])
+            result[stage] = {
+                "count": len(values),
+                "total": sum(values),
+                "mean": statistics.fmean(values),
+                "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            }
+        return result
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    ステージごとに OpenTelemetry のスパン（sx.{stage}）を出力する Tracer
+
+    opentelemetry-api が必要。スパンは終了時刻から所要時間をさかのぼって作る。
+    """
+
+    enabled = True
+
+    def __init__(self, tracer=None):
+        """
+        Args:
+            tracer: opentelemetry.trace.Tracer（省略時は trace.get_tracer(__name__)）
+        """
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError(
+                "OpenTelemetryTracer requires opentelemetry-api "
+                "(pip install opentelemetry-api)"
+            ) from e
+        self._tracer = tracer or trace.get_tracer(__name__)
+
+    def record(self, stage, seconds, url=None):
+        end = time.time_ns()
+        attributes = {"url.full": url} if url is not None else {}
+        span = self._tracer.start_span(
+            f"sx.{stage}", start_time=end - int(seconds * 1e9), attributes=attributes
+        )
+        span.end(end_time=end)
+
+
+async def _on_dns_start(session, ctx, params):
+    ctx.dns_started = time.perf_counter()
+
+
+async def _on_dns_end(session, ctx, params):
+    tracer = ctx.trace_request_ctx
+    if tracer is not None and hasattr(ctx, "dns_started"):
+        tracer.record("dns", time.perf_counter() - ctx.dns_started, ctx.url)
+
+
+async def _on_connect_start(session, ctx, params):
+    ctx.connect_started = time.perf_counter()
+
+
+async def _on_connect_end(session, ctx, params):
+    tracer = ctx.trace_request_ctx
+    if tracer is not None and hasattr(ctx, "connect_started"):
+        tracer.record("connect", time.perf_counter() - ctx.connect_started, ctx.url)
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.url = str(params.url)
+    ctx.request_started = time.perf_counter()
+
+
+async def _on_request_end(session, ctx, params):
+    # on_request_end はレスポンスヘッダーを受け取った時点で呼ばれる
+    tracer = ctx.trace_request_ctx
+    if tracer is not None:
+        tracer.record("ttfb", time.perf_counter() - ctx.request_started, ctx.url)
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    """
+    DNS、接続、TTFB を記録する aiohttp の TraceConfig を作る
+
+    記録先の Tracer はリクエストごとに session.get(..., trace_request_ctx=tracer)
+    で渡す（複数の Scraper が1つのセッションを共有できるように）。
+    """
+    config = aiohttp.TraceConfig(trace_config_ctx_factory=_TraceContext)
+    config.on_dns_resolvehost_start.append(_on_dns_start)
+    config.on_dns_resolvehost_end.append(_on_dns_end)
+    config.on_connection_create_start.append(_on_connect_start)
+    config.on_connection_create_end.append(_on_connect_end)
+    config.on_request_start.append(_on_request_start)
+    config.on_request_end.append(_on_request_end)
+    return config
+
+
+class _TraceContext:
+    def __init__(self, trace_request_ctx=None):
+        self.trace_request_ctx = trace_request_ctx
+        self.url = None
@@ -1,8 +1,148 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Iterable
+import atexit
 import hashlib
+import os
+import shutil
+import threading
+import zlib
 from urllib.parse import urlparse
 import rocksdbpy
 
+# RocksDB は同一プロセスから同じパスを二重に開けないため、パスごとにハンドルを共有する
+_DB_HANDLES = {}
+
+STORAGE_MODES = ("primary", "readonly", "secondary")
+
+
+@dataclass(frozen=True)
+class StorageConfig:
+    """
+    URL を保存する RocksDB の設定
+
+    mode:
+        primary: 読み書きする（1つの DB を開けるのは1プロセスだけ）
+        readonly: 開いた時点の内容を読むだけ（書き込み中のプロセスがあっても開ける）
+        secondary: primary の変更に refresh() で追従しながら読む（sx list や監視向け）
+
+    rocksdb-py は column family、prefix extractor、圧縮方式の設定を公開していないため、
+    ここでは扱わない（ホストの範囲はキーのバイト比較で区切る）。
+    """
+
+    path: str = "./.rocksdb"
+    mode: str = "primary"
+    # secondary の情報ログ等の置き場所（省略時は "{path}.secondary/{pid}"。プロセスの終了時に消す）
+    secondary_path: str | None = None
+    # ブロックキャッシュの大きさ（MB）。指定するとキーのブルームフィルタも有効になる
+    block_cache_mb: int | None = None
+    bloom_locality: int | None = None
+    write_buffer_size: int | None = None
+    max_write_buffer_number: int | None = None
+    max_open_files: int | None = None
+    max_background_jobs: int | None = None
+
+    def __post_init__(self):
+        if self.mode not in STORAGE_MODES:
+            raise ValueError(f"mode must be one of {STORAGE_MODES}")
+
+    @property
+    def writable(self) -> bool:
+        return self.mode == "primary"
+
+    def options(self) -> rocksdbpy.Option:
+        opt = rocksdbpy.Option()
+        opt.create_if_missing(self.writable)
+        if self.block_cache_mb is not None:
+            opt.optimize_for_point_lookup(self.block_cache_mb)
+        if self.bloom_locality is not None:
+            opt.set_bloom_locality(self.bloom_locality)
+        if self.write_buffer_size is not None:
+            opt.set_write_buffer_size(self.write_buffer_size)
+        if self.max_write_buffer_number is not None:
+            opt.set_max_write_buffer_number(self.max_write_buffer_number)
+        if self.max_open_files is not None:
+            opt.set_max_open_files(self.max_open_files)
+        if self.max_background_jobs is not None:
+            opt.set_max_background_jobs(self.max_background_jobs)
+        return opt
+
+    def open(self):
+        path = os.path.abspath(self.path)
+        if self.mode == "readonly":
+            return rocksdbpy.open_for_readonly(path, self.options(), False)
+        if self.mode == "secondary":
+            # primary がまだ作っていない DB は開けないので、置き場所を作る前に確かめる
+            if not os.path.exists(os.path.join(path, "CURRENT")):
+                raise FileNotFoundError(f"no RocksDB at {path}")
+            secondary = self.secondary_path or _secondary_path(path)
+            try:
+                return rocksdbpy.open_as_secondary(path, secondary, self.options())
+            except Exception:
+                if self.secondary_path is None:
+                    shutil.rmtree(secondary, ignore_errors=True)
+                raise
+        return rocksdbpy.open(path, self.options())
+
+
+_default_storage = StorageConfig()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _secondary_path(path: str) -> str:
+    """
+    secondary の置き場所 "{path}.secondary/{pid}" を作り、プロセスの終了時に消す
+
+    強制終了などで残った、もう動いていないプロセスの分はここで消す。
+    """
+    root = f"{path}.secondary"
+    os.makedirs(root, exist_ok=True)
+    for name in os.listdir(root):
+        if name.isdigit() and int(name) != os.getpid() and not _pid_alive(int(name)):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    secondary = os.path.join(root, str(os.getpid()))
+    os.makedirs(secondary, exist_ok=True)
+    atexit.register(shutil.rmtree, secondary, True)
+    return secondary
+
+
+def set_default_storage(config: StorageConfig):
+    """
+    DiskURLManager(storage=None) が使う設定を変更する
+    """
+    global _default_storage
+    _default_storage = config
+
+
+def get_default_storage() -> StorageConfig:
+    return _default_storage
+
+
+def shard_of(tail: bytes, num_shards: int) -> int:
+    """
+    キーの path?query 部分から決まるシャード番号（プロセスやマシンをまたいで同じ値）
+    """
+    return zlib.crc32(tail) % num_shards
+
+
+def _open_db(config: StorageConfig | None = None):
+    config = config or _default_storage
+    key = (os.path.abspath(config.path), config.mode)
+    db = _DB_HANDLES.get(key)
+    if db is None:
+        db = config.open()
+        _DB_HANDLES[key] = db
+    return db
+
 
 class URLManager(ABC):
     @abstractmethod
@@ -15,26 +155,106 @@ class URLManager(ABC):
 
 
 class DiskURLManager(URLManager):
-    def __init__(self, host):
+    def __init__(
+        self,
+        host,
+        storage: StorageConfig | None = None,
+        shard_id: int | None = None,
+        num_shards: int = 1,
+    ):
+        """
+        Args:
+            host: 対象ホスト
+            storage: RocksDB の設定（省略時は set_default_storage で設定したもの）
+            shard_id: 指定するとキーのハッシュがこのシャードに当たるURLだけを扱う
+            num_shards: シャード数
+        """
         super().__init__()
 
-        self.db = rocksdbpy.open_default("./.rocksdb")
+        self.storage = storage or _default_storage
+        self.db = _open_db(self.storage)
         self.host = host
 
         self.upper = f"{host}\x01".encode("utf-8")
         self.lower = f"{host}\x00".encode("utf-8")
-        self.cursor = f"{self.host}:cursor".encode("utf-8")
-        self.db.set(self.upper, b"")
-        self.db.set(self.lower, b"")
+        self.set_shard(shard_id, num_shards)
+        if self.storage.writable:
+            self.db.set(self.upper, b"")
+            self.db.set(self.lower, b"")
 
         self._num_url = None
+        # follow() の間だけ、追加されたキーを記録して取りこぼしを防ぐ
+        self._tail_cond = threading.Condition()
+        self._tail_log = None
+
+    def set_shard(self, shard_id: int | None, num_shards: int = 1):
+        """
+        扱うシャードを切り替える。カーソルはシャードごとに別々に保存される
+        """
+        if shard_id is None:
+            num_shards = 1
+        elif not 0 <= shard_id < num_shards:
+            raise ValueError("shard_id must be in [0, num_shards)")
+
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        if shard_id is None:
+            self.cursor = f"{self.host}:cursor".encode("utf-8")
+        else:
+            self.cursor = f"{self.host}:cursor:{shard_id}-of-{num_shards}".encode(
+                "utf-8"
+            )
+
+    def owns(self, key: bytes) -> bool:
+        """
+        フロンティアのキーがこのシャードに属するかどうか
+        """
+        if self.shard_id is None:
+            return True
+        return shard_of(key[len(self.lower) :], self.num_shards) == self.shard_id
 
     def add_url(self, url: str):
         path, query = DiskURLManager.normalize_url(url)
 
         k = self.key_for(path, query)
         v = url.encode("utf-8")
-        self.db.set(k, v)
+        if self._tail_log is None:
+            self.db.set(k, v)
+            return
+        with self._tail_cond:
+            self.db.set(k, v)
+            self._tail_log.append((k, v))
+            self._tail_cond.notify_all()
+
+    def add_urls(self, urls: Iterable[str]) -> int:
+        """
+        まだフロンティアにないURLだけを1つの WriteBatch でまとめて追加し、追加した件数を返す
+        """
+        pending = {}
+        for url in urls:
+            path, query = DiskURLManager.normalize_url(url)
+            pending.setdefault(self.key_for(path, query), url)
+        if not pending:
+            return 0
+
+        keys = list(pending)
+        batch = rocksdbpy.WriteBatch()
+        added = []
+        for k, existing in zip(keys, self.db.multi_get(keys)):
+            if existing is None:
+                v = pending[k].encode("utf-8")
+                batch.add(k, v)
+                added.append((k, v))
+        if not added:
+            return 0
+        if self._tail_log is None:
+            self.db.write(batch)
+            return len(added)
+        with self._tail_cond:
+            self.db.write(batch)
+            self._tail_log.extend(added)
+            self._tail_cond.notify_all()
+        return len(added)
 
     def delete_url(self, url: str):
         path, query = DiskURLManager.normalize_url(url)
@@ -45,22 +265,156 @@ class DiskURLManager(URLManager):
     def to_iter(self, start_key: bytes | None = None):
         if start_key is None:
             start_key = self.lower
-        iter = self.db.iterator(mode="from", key=start_key)
-        for key, value in iter:
-            if key == self.lower:
-                continue
-            elif key == self.upper:
-                break
-            host = key.decode("utf-8").split("\x00")[0]
-            if host != self.host:
+        for batch in self.iter_batches(start_key):
+            yield from batch
+
+    def iter_batches(self, start_key: bytes | None = None, batch_size: int = 1000):
+        """
+        to_iter と同じ範囲を (key, url) のリストにまとめて返す
+
+        キーも URL もデコードせず RocksDB から受け取った bytes のまま返すので、
+        キーはそのまま set_cursor に渡せる。
+        """
+        if start_key is None:
+            start_key = self.lower
+        return self._batches(self.db.iterator(mode="from", key=start_key), batch_size)
+
+    def _batches(self, iterator, batch_size: int):
+        upper, lower = self.upper, self.lower
+        offset, shard_id, num_shards = len(lower), self.shard_id, self.num_shards
+        batch = []
+        for key, value in iterator:
+            # このホストのキーはすべて "{host}\x00" で始まり "{host}\x01" より小さい
+            if key >= upper:
                 break
-            yield key, value
+            if key == lower:
+                continue
+            if (
+                shard_id is not None
+                and zlib.crc32(key[offset:]) % num_shards != shard_id
+            ):
+                continue
+            batch.append((key, value))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def follow(
+        self,
+        done: threading.Event,
+        start_key: bytes | None = None,
+        batch_size: int = 1000,
+    ):
+        """
+        tail -f のように、追加され続けるフロンティアを返し続ける
+
+        start_key から末尾まで返したあとは、その間に追加されたURLを続けて返す。
+        キーの順で返し終えた位置より前に追加されたURLも、追加を記録しておいて別に返す。
+        新しいURLがなければ空のリストを返すので、呼び出し側は wait_for_writes で待つ。
+        done がセットされ、それまでに追加されたURLをすべて返し終えたら終わる。
+
+        Yields:
+            ((key, url) のリスト, キーの順に返したものなら True)。
+            False のものはカーソルより前のキーなので、カーソルを進めてはいけない
+        """
+        # 最初の走査より前の追加も記録されるよう、ジェネレータを作る前に記録を始める
+        with self._tail_cond:
+            self._tail_log = []
+        return self._follow(done, start_key or self.lower, batch_size)
+
+    def _follow(self, done: threading.Event, pos: bytes, batch_size: int):
+        try:
+            while True:
+                finished = done.is_set()
+                # イテレータは作った時点のスナップショットを返すので、作成と記録の取り出しを
+                # 同じロックの中で行う。記録のうち pos より後ろのキーはこのイテレータが返す
+                with self._tail_cond:
+                    iterator = self.db.iterator(mode="from", key=pos)
+                    late = {k: v for k, v in self._tail_log if k < pos and self.owns(k)}
+                    self._tail_log.clear()
+
+                found = False
+                if late:
+                    found = True
+                    yield sorted(late.items()), False
+                for batch in self._batches(iterator, batch_size):
+                    found = True
+                    yield batch, True
+                    pos = batch[-1][0] + b"\x00"
 
-    def set_cursor(self, key: bytes | None = None):
+                if not found:
+                    if finished:
+                        return
+                    yield [], True
+        finally:
+            self.stop_follow()
+
+    def stop_follow(self):
+        """
+        追加の記録をやめる（follow() のジェネレータを閉じるか最後まで返すと呼ばれる）
+        """
+        with self._tail_cond:
+            self._tail_log = None
+            self._tail_cond.notify_all()
+
+    def wait_for_writes(self, timeout: float) -> bool:
+        """
+        follow() の間に新しいURLが追加されるまで最大 timeout 秒待つ
+        """
+        with self._tail_cond:
+            if self._tail_log:
+                return True
+            return self._tail_cond.wait(timeout)
+
+    def partition(self, num_shards: int, out_dir: str) -> list:
+        """
+        フロンティアをシャードごとのスナップショット（1行1URLのテキスト）に書き出す
+
+        書き出したファイルは各ノードで `sx discover --from txt` で取り込める。
+
+        Returns:
+            シャードごとの (ファイルパス, URL数) のリスト
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be >= 1")
+        os.makedirs(out_dir, exist_ok=True)
+
+        name = self.host.replace(":", "_")
+        paths = [
+            os.path.join(out_dir, f"{name}.shard-{i}-of-{num_shards}.txt")
+            for i in range(num_shards)
+        ]
+        files = [open(path, "wb") for path in paths]
+        counts = [0] * num_shards
+        offset = len(self.lower)
+        try:
+            for key, value in self.db.iterator(mode="from", key=self.lower):
+                if key >= self.upper:
+                    break
+                if key == self.lower:
+                    continue
+                i = zlib.crc32(key[offset:]) % num_shards
+                files[i].write(value + b"\n")
+                counts[i] += 1
+        finally:
+            for f in files:
+                f.close()
+        return list(zip(paths, counts))
+
+    def refresh(self):
+        """
+        secondary で開いている場合、primary の最新の書き込みに追従する
+        """
+        if self.storage.mode == "secondary":
+            self.db.try_catch_up_with_primary()
+
+    def set_cursor(self, key: bytes | memoryview | None = None):
         if key is None:
             self.db.set(self.cursor, self.lower)
         else:
-            self.db.set(self.cursor, key)
+            self.db.set(self.cursor, bytes(key))
 
     def get_cursor(self) -> bytes:
         return self.db.get(self.cursor)
@@ -85,26 +439,20 @@ class DiskURLManager(URLManager):
 
     @property
     def urls_total(self):
-        num = 0
-        for key, _ in self.to_iter():
-            if key == self.lower:
-                continue
-            elif key == self.upper:
-                break
-            num += 1
-
-        return num
+        return sum(len(batch) for batch in self.iter_batches())
 
     @property
     def url_current_index(self):
+        # カーソル以下のキーの数（カーソルはループの外で一度だけ読む）
+        cursor = self.get_cursor()
+        if cursor is None:
+            return 0
         num = 0
-        for key, _ in self.to_iter():
-            if key == self.lower:
+        for batch in self.iter_batches():
+            if batch[-1][0] <= cursor:
+                num += len(batch)
                 continue
-            elif key == self.upper:
-                break
-            num += 1
-            if key == self.get_cursor():
-                break
+            num += sum(1 for key, _ in batch if key <= cursor)
+            break
 
         return num
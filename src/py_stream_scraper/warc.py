@@ -0,0 +1,659 @@
+"""
+ページキャッシュを WARC (ISO 28500, WARC/1.1) で書き出す・読み込むモジュール
+
+RedisCache / DiskCache の brotli の塊にはステータスもヘッダーも取得時刻もなく、
+このツール以外からは読めない。WARC にしておけば pywb や warcio などでそのまま読め、
+安いストレージに大量に置いておいて後で再生できる。
+
+- export_cache(): キャッシュのページを response レコードとして書き出す
+- import_warc(): WARC の response レコードをキャッシュに読み込む
+- WARCCache: WARC ファイルに追記していく Cache の実装（大きな順次書き込みで保存する）
+
+レコードは1件ずつ gzip のメンバーにするので、CDX インデックス（URL -> ファイル, オフセット, 長さ）
+から1件だけを読み出せる。インデックスは CDXJ 形式（1行1件）で、URL のキーは SURT ではなく
+URL そのものを使う:
+
+    https://example.com/a 20261019120000 {"url": ..., "status": 200, "offset": 0, "length": 512, "filename": "cache-00000.warc.gz"}
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http import HTTPStatus
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import brotli
+
+from .cache import Cache, _key
+from .log import subsystem_logger
+
+READ_CHUNK = 1 << 20
+# WARCCache は書き込みをこの大きさまでまとめてからファイルに書く
+WRITE_BUFFER = 8 << 20
+# 保存時にデコード済みの本文に合わないヘッダーは落とす
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+@dataclass
+class WARCRecord:
+    url: str
+    body: bytes
+    status: int = 200
+    headers: Dict[str, str] = field(default_factory=dict)
+    fetched_at: float = 0.0
+    offset: int = 0  # ファイル内の gzip メンバーの位置
+    length: int = 0  # gzip メンバーの長さ
+
+
+def _warc_date(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_date(value: str) -> float:
+    value = value.replace("Z", "+00:00")
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _timestamp14(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m%d%H%M%S")
+
+
+def _sha1(data: bytes) -> str:
+    return "sha1:" + base64.b32encode(hashlib.sha1(data).digest()).decode("ascii")
+
+
+def _http_block(body: bytes, status: int, headers: Optional[Dict[str, str]]) -> bytes:
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+    lines = [f"HTTP/1.1 {status} {reason}".rstrip()]
+    for name, value in (headers or {}).items():
+        if name.lower() not in _DROP_HEADERS:
+            lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(body)}")
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+    return head + body
+
+
+def _record(headers: Sequence[Tuple[str, str]], block: bytes) -> bytes:
+    head = "WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers)
+    head += f"Content-Length: {len(block)}\r\n\r\n"
+    return head.encode("utf-8") + block + b"\r\n\r\n"
+
+
+class WARCWriter:
+    """
+    WARC の response レコードを1件ずつ gzip のメンバーにして追記する
+
+    path に書く場合は既存のファイルの末尾に追記する。
+    """
+
+    def __init__(
+        self, target: Union[str, Path, BinaryIO], buffer_size: int = WRITE_BUFFER
+    ):
+        if isinstance(target, (str, Path)):
+            self.path = Path(target)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "ab", buffering=buffer_size)
+            self._owns = True
+        else:
+            self.path = None
+            self._file = target
+            self._owns = False
+        self.offset = self._file.tell()
+
+    def write_response(
+        self,
+        url: str,
+        body: bytes,
+        status: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        fetched_at: Optional[float] = None,
+    ) -> Tuple[int, int]:
+        """
+        response レコードを書き、(オフセット, 長さ) を返す
+        """
+        if fetched_at is None:
+            fetched_at = time.time()
+        block = _http_block(body, status, headers)
+        record = _record(
+            [
+                ("WARC-Type", "response"),
+                ("WARC-Record-ID", f"<urn:uuid:{uuid.uuid4()}>"),
+                ("WARC-Date", _warc_date(fetched_at)),
+                ("WARC-Target-URI", url),
+                ("WARC-Payload-Digest", _sha1(body)),
+                ("Content-Type", "application/http; msgtype=response"),
+            ],
+            block,
+        )
+        member = gzip.compress(record, compresslevel=6)
+        offset = self.offset
+        self._file.write(member)
+        self.offset += len(member)
+        return offset, len(member)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._owns:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def _gzip_members(f: BinaryIO) -> Iterator[Tuple[int, int, bytes]]:
+    """
+    gzip のメンバーを1つずつ (オフセット, 長さ, 展開したデータ) で返す
+    """
+    offset = f.tell()
+    buf = b""
+    while True:
+        if not buf:
+            buf = f.read(READ_CHUNK)
+            if not buf:
+                return
+        d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        out = []
+        consumed = 0
+        data = buf
+        while True:
+            out.append(d.decompress(data))
+            if d.eof:
+                consumed += len(data) - len(d.unused_data)
+                buf = d.unused_data
+                break
+            consumed += len(data)
+            data = f.read(READ_CHUNK)
+            if not data:
+                raise ValueError(f"truncated gzip member at offset {offset}")
+        yield offset, consumed, b"".join(out)
+        offset += consumed
+
+
+def _parse_records(data: bytes) -> Iterator[Tuple[Dict[str, str], bytes]]:
+    """
+    展開したデータに含まれる WARC レコードを (ヘッダー, ブロック) で返す
+    """
+    pos = 0
+    while pos < len(data):
+        # レコード間の空行を飛ばす
+        while data.startswith(b"\r\n", pos):
+            pos += 2
+        if pos >= len(data):
+            return
+        end = data.find(b"\r\n\r\n", pos)
+        if end < 0:
+            raise ValueError("malformed WARC record header")
+        lines = data[pos:end].decode("utf-8").split("\r\n")
+        if not lines[0].startswith("WARC/"):
+            raise ValueError(f"not a WARC record: {lines[0][:40]!r}")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        start = end + 4
+        length = int(headers["content-length"])
+        yield headers, data[start : start + length]
+        pos = start + length
+
+
+def _parse_http(block: bytes) -> Tuple[int, Dict[str, str], bytes]:
+    end = block.find(b"\r\n\r\n")
+    if end < 0:
+        return 200, {}, block
+    lines = block[:end].decode("utf-8", errors="replace").split("\r\n")
+    parts = lines[0].split(" ", 2)
+    status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    return status, headers, block[end + 4 :]
+
+
+def _to_record(headers: Dict[str, str], block: bytes, offset: int, length: int):
+    if headers.get("warc-type") != "response":
+        return None
+    status, http_headers, body = _parse_http(block)
+    date = headers.get("warc-date")
+    return WARCRecord(
+        url=headers.get("warc-target-uri", ""),
+        body=body,
+        status=status,
+        headers=http_headers,
+        fetched_at=_parse_date(date) if date else 0.0,
+        offset=offset,
+        length=length,
+    )
+
+
+def iter_records(
+    source: Union[str, Path, BinaryIO], offset: int = 0
+) -> Iterator[WARCRecord]:
+    """
+    WARC（レコードごとに gzip したもの）の response レコードを順に読む
+
+    1つの gzip メンバーに複数のレコードが入ったファイルも読めるが、その場合の
+    offset / length はメンバー単位になる。
+    """
+    f = open(source, "rb") if isinstance(source, (str, Path)) else source
+    try:
+        f.seek(offset)
+        for member_offset, length, data in _gzip_members(f):
+            for headers, block in _parse_records(data):
+                record = _to_record(headers, block, member_offset, length)
+                if record is not None:
+                    yield record
+    finally:
+        if f is not source:
+            f.close()
+
+
+def read_record(
+    source: Union[str, Path, BinaryIO], offset: int, length: Optional[int] = None
+) -> Optional[WARCRecord]:
+    """
+    offset の gzip メンバーの response レコードを1件読む（CDX から引いた位置を読む）
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            return read_record(f, offset, length)
+    source.seek(offset)
+    if length is not None:
+        return _member_record(source.read(length), offset)
+    _, length, data = next(_gzip_members(source))
+    return _first_response(data, offset, length)
+
+
+def _member_record(member: bytes, offset: int) -> Optional[WARCRecord]:
+    data = zlib.decompress(member, zlib.MAX_WBITS | 16)
+    return _first_response(data, offset, len(member))
+
+
+def _first_response(data: bytes, offset: int, length: int) -> Optional[WARCRecord]:
+    for headers, block in _parse_records(data):
+        record = _to_record(headers, block, offset, length)
+        if record is not None:
+            return record
+    return None
+
+
+def cdx_line(record: WARCRecord, filename: str) -> str:
+    meta = {
+        "url": record.url,
+        "status": record.status,
+        "offset": record.offset,
+        "length": record.length,
+        "filename": filename,
+    }
+    return f"{record.url} {_timestamp14(record.fetched_at)} {json.dumps(meta)}\n"
+
+
+def write_cdx(path: Union[str, Path], warc_paths: Iterable[Union[str, Path]]) -> int:
+    """
+    WARC ファイルを読んで、URL 順に並べた CDXJ インデックスを書く。件数を返す
+    """
+    lines = []
+    for warc_path in warc_paths:
+        name = Path(warc_path).name
+        lines.extend(cdx_line(r, name) for r in iter_records(warc_path))
+    lines.sort()
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    return len(lines)
+
+
+def load_cdx(path: Union[str, Path]) -> Dict[str, dict]:
+    """
+    CDXJ インデックスを URL -> {status, offset, length, filename, fetched_at} にする
+
+    同じ URL が複数ある場合は新しいものを使う。
+    """
+    index = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            try:
+                url, ts, meta = line.split(" ", 2)
+                entry = json.loads(meta)
+            except ValueError:
+                # 書き込みの途中で止まった最後の行
+                continue
+            entry["fetched_at"] = (
+                datetime.strptime(ts, "%Y%m%d%H%M%S")
+                .replace(tzinfo=timezone.utc)
+                .timestamp()
+            )
+            old = index.get(url)
+            if old is None or old["fetched_at"] <= entry["fetched_at"]:
+                index[url] = entry
+    return index
+
+
+def export_cache(
+    cache: Cache,
+    urls: Iterable[str],
+    path: Union[str, Path],
+    content_type: str = "text/html; charset=utf-8",
+    batch_size: int = 256,
+) -> Tuple[int, int]:
+    """
+    urls のうちキャッシュにあるページを WARC に書き出し、path + ".cdxj" にインデックスを書く
+
+    キャッシュにはステータスとヘッダーが残っていないので、200 と content_type で書く
+    （キャッシュに入るのは 200 のページだけで、既定では UTF-8 に揃えて保存している。
+    raw_cache で Content-Type も保存していればそれを使う）。
+    取得時刻はキャッシュの保存時刻を使う。
+
+    Returns:
+        (書き出した件数, キャッシュになかった件数)
+    """
+    path = Path(path)
+    written = missing = 0
+    lines = []
+
+    def export(writer, batch):
+        nonlocal written, missing
+        for url, ts in zip(batch, cache.fetched_at_many(batch)):
+            raw = stored_type = None
+            if ts is not None:
+                try:
+                    raw, stored_type = cache.read_with_content_type(url)
+                except FileNotFoundError:
+                    pass
+            if raw is None:
+                missing += 1
+                continue
+            body = brotli.decompress(raw) if cache.compressed else raw
+            # 時刻の分からないもの（0）は書き出した時刻にする
+            fetched_at = ts or time.time()
+            headers = {"Content-Type": stored_type or content_type}
+            offset, length = writer.write_response(url, body, 200, headers, fetched_at)
+            record = WARCRecord(url, b"", 200, {}, fetched_at, offset, length)
+            lines.append(cdx_line(record, path.name))
+            written += 1
+
+    with WARCWriter(path) as writer:
+        batch = []
+        for url in urls:
+            batch.append(url)
+            if len(batch) >= batch_size:
+                export(writer, batch)
+                batch = []
+        if batch:
+            export(writer, batch)
+
+    lines.sort()
+    with open(str(path) + ".cdxj", "a", encoding="utf-8") as f:
+        f.writelines(lines)
+    return written, missing
+
+
+def import_warc(
+    source: Union[str, Path, BinaryIO], cache: Cache, statuses: Sequence[int] = (200,)
+) -> List[str]:
+    """
+    WARC の response レコードのうち statuses のものをキャッシュに書き込み、URL のリストを返す
+
+    フロンティアに加える場合は返り値を DiskURLManager.add_urls に渡す。
+    """
+    urls = []
+    for record in iter_records(source):
+        if record.status not in statuses:
+            continue
+        if cache.compressed:
+            cache.write(record.url, brotli.compress(record.body))
+            content_type = next(
+                (v for k, v in record.headers.items() if k.lower() == "content-type"),
+                None,
+            )
+            cache.write_content_type(record.url, content_type)
+        else:
+            cache.write_response(
+                record.url, record.body, record.status, record.headers, record.fetched_at
+            )
+        urls.append(record.url)
+    return urls
+
+
+class WARCCache(Cache):
+    """
+    WARC ファイルに追記していくキャッシュ
+
+    ページは圧縮せずにステータス・ヘッダー・取得時刻とともに {prefix}-{n:05d}.warc.gz に
+    追記し、max_file_size を超えたら次のファイルに移る。書き込みは WRITE_BUFFER まで
+    まとめてから書くので、大量のページを順次書き込みで保存できる。
+    インデックスは {prefix}.cdxj に追記し、開くときにメモリに読み込む
+    （最後のファイルがインデックスより先に進んでいれば、その分を読んで補う。
+    書き込みの途中で止まって末尾のレコードが欠けていれば、最後の完全なレコードまで切り詰める）。
+
+    同じ URL を書き直すと新しいレコードを追記し、読むときは新しい方を返す。
+    """
+
+    compressed = False
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        prefix: str = "cache",
+        max_file_size: int = 1 << 30,
+        buffer_size: int = WRITE_BUFFER,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_file_size = max_file_size
+        self.buffer_size = buffer_size
+        self.index_path = self.directory / f"{prefix}.cdxj"
+        self._lock = threading.Lock()
+        self._readers: Dict[str, int] = {}
+
+        self._index = load_cdx(self.index_path) if self.index_path.exists() else {}
+        files = sorted(self.directory.glob(f"{prefix}-*.warc.gz"))
+        self._seq = int(files[-1].name[len(prefix) + 1 : -len(".warc.gz")]) if files else 0
+        self._cdx = open(self.index_path, "a", encoding="utf-8")
+        self._recover(self._file_name(self._seq))
+        self._writer = WARCWriter(self.directory / self._file_name(self._seq), buffer_size)
+        self._unflushed = False
+
+    def _file_name(self, seq: int) -> str:
+        return f"{self.prefix}-{seq:05d}.warc.gz"
+
+    def _recover(self, name: str):
+        # インデックスを書く前に止まった分を、最後のファイルの末尾から読み直す
+        path = self.directory / name
+        if not path.exists():
+            return
+        size = path.stat().st_size
+        # 本文を書き出す前に止まったレコード（インデックスだけがある）は捨てる
+        lost = [
+            url
+            for url, e in self._index.items()
+            if e["filename"] == name and e["offset"] + e["length"] > size
+        ]
+        for url in lost:
+            del self._index[url]
+        end = max(
+            (e["offset"] + e["length"] for e in self._index.values() if e["filename"] == name),
+            default=0,
+        )
+        if end < size:
+            good = end
+            with open(path, "rb") as f:
+                f.seek(end)
+                try:
+                    for offset, length, data in _gzip_members(f):
+                        record = _first_response(data, offset, length)
+                        if record is not None:
+                            self._add(record, name)
+                        good = offset + length
+                except (ValueError, EOFError, zlib.error):
+                    pass
+            if good < size:
+                # 書き込みの途中で止まった末尾の欠けたメンバーを落とし、続きから追記する
+                subsystem_logger("warc").warning(
+                    "truncating %s from %d to %d bytes (incomplete record)",
+                    path,
+                    size,
+                    good,
+                )
+                os.truncate(path, good)
+        if lost:
+            self._rewrite_index()
+        self._cdx.flush()
+
+    def _rewrite_index(self):
+        # 追記のままだと捨てたレコードが次に開くときに戻るので、今のインデックスで書き直す
+        self._cdx.close()
+        tmp = self.index_path.with_suffix(".cdxj.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for e in self._index.values():
+                record = WARCRecord(
+                    e["url"], b"", e["status"], {}, e["fetched_at"], e["offset"], e["length"]
+                )
+                f.write(cdx_line(record, e["filename"]))
+        os.replace(tmp, self.index_path)
+        self._cdx = open(self.index_path, "a", encoding="utf-8")
+
+    def _add(self, record: WARCRecord, filename: str):
+        self._index[record.url] = {
+            "url": record.url,
+            "status": record.status,
+            "offset": record.offset,
+            "length": record.length,
+            "filename": filename,
+            "fetched_at": record.fetched_at,
+        }
+        self._cdx.write(cdx_line(record, filename))
+
+    def write(self, k: bytes, v: bytes):
+        """
+        v は圧縮していない本文（compressed = False なので Scraper もそのまま渡す）
+        """
+        self.write_response(k, v)
+
+    def write_response(
+        self,
+        k,
+        body: bytes,
+        status: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        fetched_at: Optional[float] = None,
+    ):
+        url = _key(k)
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            offset, length = self._writer.write_response(
+                url, body, status, headers, fetched_at
+            )
+            name = self._file_name(self._seq)
+            self._add(WARCRecord(url, b"", status, {}, fetched_at, offset, length), name)
+            self._unflushed = True
+            if self._writer.offset >= self.max_file_size:
+                self._rotate()
+
+    def _rotate(self):
+        self._flush()
+        self._writer.close()
+        self._seq += 1
+        self._writer = WARCWriter(
+            self.directory / self._file_name(self._seq), self.buffer_size
+        )
+
+    def _flush(self):
+        if self._unflushed:
+            self._writer.flush()
+            self._cdx.flush()
+            self._unflushed = False
+
+    def _reader(self, name: str) -> int:
+        fd = self._readers.get(name)
+        if fd is None:
+            fd = self._readers[name] = os.open(self.directory / name, os.O_RDONLY)
+        return fd
+
+    def read_record(self, k) -> Optional[WARCRecord]:
+        """
+        保存したレコード（ステータス・ヘッダー・取得時刻つき）を返す。なければ None
+        """
+        with self._lock:
+            entry = self._index.get(_key(k))
+            if entry is None:
+                return None
+            if entry["filename"] == self._file_name(self._seq):
+                # まだバッファにある分を書き出してから読む
+                self._flush()
+            fd = self._reader(entry["filename"])
+        # 位置を指定して読むのでロックの外で並行に読める
+        member = os.pread(fd, entry["length"], entry["offset"])
+        return _member_record(member, entry["offset"])
+
+    def read(self, k: bytes):
+        record = self.read_record(k)
+        return None if record is None else record.body
+
+    def read_with_content_type(self, k) -> Tuple[Optional[bytes], Optional[str]]:
+        record = self.read_record(k)
+        if record is None:
+            return None, None
+        content_type = next(
+            (v for name, v in record.headers.items() if name.lower() == "content-type"),
+            None,
+        )
+        return record.body, content_type
+
+    def fetched_at_many(self, keys: Sequence) -> List[Optional[float]]:
+        with self._lock:
+            entries = [self._index.get(_key(k)) for k in keys]
+        return [None if e is None else e["fetched_at"] for e in entries]
+
+    def urls(self) -> List[str]:
+        """
+        保存しているURL（書き出しや再生の対象の確認に使う）
+        """
+        with self._lock:
+            return list(self._index)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._writer.close()
+            self._cdx.close()
+            for fd in self._readers.values():
+                os.close(fd)
+            self._readers.clear()
@@ -0,0 +1,241 @@
+import asyncio
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fakeredis
+import pytest
+
+from py_stream_scraper import scraper as scraper_mod
+from py_stream_scraper.cache import CachePolicy, DiskCache, RedisCache
+from py_stream_scraper.scraper import FetchStrategy, Scraper
+from py_stream_scraper.sink import Sink
+
+
+class _Handler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        charset = "utf-8"
+        head = ""
+        if self.path.startswith("/sjis/"):
+            charset = "Shift_JIS"
+            if "/meta/" in self.path:
+                head = '<meta charset="Shift_JIS">'
+        body = f"<html>{head}<title>店{self.path}</title></html>".encode(charset)
+        self.send_response(200)
+        self.send_header("Content-Type", f"text/html; charset={charset}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.requests = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        pass
+
+
+class TitleScraper(Scraper):
+    def parse(self, url, html):
+        return {
+            "URL": url,
+            "title": html.split("<title>")[1].split("</title>")[0].lstrip("店"),
+        }
+
+
+def _scraper(redis_client, server, n=3):
+    s = TitleScraper(
+        "cache.test",
+        1000,
+        redis_client=redis_client,
+        fetch_strategy=FetchStrategy.NEVER_STOP,
+    )
+    s.sink = ListSink()
+    for i in range(n):
+        s.url_manager.add_url(f"{server}/page/{i}")
+    return s
+
+
+def test_redis_cache_reports_existence_and_age_in_one_round_trip():
+    cache = RedisCache(fakeredis.FakeRedis())
+    cache.write("https://a.test/1", b"x")
+    cache.redis.set("https://a.test/legacy", b"y")
+
+    stamps = cache.fetched_at_many(["https://a.test/1", "https://a.test/legacy", "nope"])
+
+    assert abs(stamps[0] - time.time()) < 5
+    assert stamps[1:] == [0.0, None]
+    assert cache.fresh_many(["https://a.test/1", "https://a.test/legacy"]) == [True, True]
+    assert cache.fresh_many(["https://a.test/1", "https://a.test/legacy"], 60) == [
+        True,
+        False,
+    ]
+
+
+def test_disk_cache_uses_file_mtime(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.write("https://a.test/1", b"x")
+    os.utime(cache._cache_path("https://a.test/1"), (0, time.time() - 120))
+
+    assert cache.fresh_many(["https://a.test/1", "https://a.test/2"]) == [True, False]
+    assert cache.fresh_many(["https://a.test/1"], max_age=60) == [False]
+
+
+@pytest.mark.parametrize("mode", ["sync", "threaded", "async"])
+def test_read_through_replays_cached_pages_without_requests(
+    tmp_path, monkeypatch, redis_client, server, mode
+):
+    monkeypatch.chdir(tmp_path)
+    cache = DiskCache(str(tmp_path / "cache"))
+
+    def run(s, policy):
+        if mode == "async":
+            asyncio.run(s.scrape_async(cache=cache, cache_policy=policy))
+        else:
+            s.scrape_sync(
+                cache=cache, cache_policy=policy, workers=4 if mode == "threaded" else 1
+            )
+
+    s = _scraper(redis_client, server)
+    run(s, CachePolicy.WRITE_ONLY)
+    # WRITE_ONLY は保存するだけ
+    assert s.sink.rows == []
+    assert _Handler.requests == 3
+
+    s.url_manager.add_url(f"{server}/page/new")
+    run(s, CachePolicy.READ_THROUGH)
+
+    assert _Handler.requests == 4
+    assert sorted(r["title"] for r in s.sink.rows) == [
+        "/page/0",
+        "/page/1",
+        "/page/2",
+        "/page/new",
+    ]
+
+
+def test_cache_only_skips_uncached_urls(tmp_path, monkeypatch, redis_client, server):
+    monkeypatch.chdir(tmp_path)
+    cache = DiskCache(str(tmp_path / "cache"))
+    s = _scraper(redis_client, server, n=1)
+    s.scrape_sync(cache=cache, workers=1)
+    s.url_manager.add_url(f"{server}/page/uncached")
+
+    s.scrape_sync(cache=cache, cache_policy=CachePolicy.CACHE_ONLY, workers=1)
+
+    assert _Handler.requests == 1
+    assert [r["title"] for r in s.sink.rows] == ["/page/0"]
+    assert s.url_manager.get_cursor() == s.url_manager.lower
+
+
+def test_cache_only_without_cache_is_rejected(
+    tmp_path, monkeypatch, redis_client, server
+):
+    monkeypatch.chdir(tmp_path)
+    s = _scraper(redis_client, server, n=1)
+
+    with pytest.raises(ValueError):
+        s.scrape_sync(cache_policy=CachePolicy.CACHE_ONLY, workers=1)
+    with pytest.raises(ValueError):
+        asyncio.run(s.scrape_async(cache_policy=CachePolicy.CACHE_ONLY))
+    with pytest.raises(ValueError):
+        s.scrape_follow([], sync=True, cache_policy=CachePolicy.CACHE_ONLY)
+    assert _Handler.requests == 0
+
+
+def test_warc_cache_keeps_status_and_headers(tmp_path, monkeypatch, redis_client, server):
+    from py_stream_scraper.warc import WARCCache
+
+    monkeypatch.chdir(tmp_path)
+    cache = WARCCache(tmp_path / "warc")
+    s = _scraper(redis_client, server, n=2)
+    s.scrape_sync(cache=cache, workers=1)
+
+    record = cache.read_record(f"{server}/page/1")
+    assert record.status == 200
+    assert record.headers["Content-Type"] == "text/html; charset=utf-8"
+    assert record.body == "<html><title>店/page/1</title></html>".encode("utf-8")
+
+    s.url_manager.set_cursor(s.url_manager.lower)
+    s.scrape_sync(cache=cache, cache_policy=CachePolicy.CACHE_ONLY, workers=1)
+    assert _Handler.requests == 2
+    assert sorted(r["title"] for r in s.sink.rows) == ["/page/0", "/page/1"]
+    cache.close()
+
+
+@pytest.mark.parametrize(
+    "raw_cache, path",
+    # 既定では UTF-8 に揃えて保存するので meta タグの charset は使わない。
+    # raw_cache では元の charset のまま保存するので Content-Type も保存する
+    [(False, "/sjis/meta/0"), (True, "/sjis/0")],
+)
+def test_cache_replay_decodes_with_the_original_charset(
+    tmp_path, monkeypatch, redis_client, server, raw_cache, path
+):
+    monkeypatch.chdir(tmp_path)
+    s = TitleScraper(
+        "cache.test",
+        1000,
+        redis_client=redis_client,
+        fetch_strategy=FetchStrategy.NEVER_STOP,
+        raw_cache=raw_cache,
+    )
+    s.sink = ListSink()
+    s.url_manager.add_url(f"{server}{path}")
+    cache = DiskCache(str(tmp_path / "cache"))
+    s.scrape_sync(cache=cache, cache_policy=CachePolicy.READ_THROUGH, workers=1)
+
+    s.url_manager.set_cursor()
+    s.scrape_sync(cache=cache, cache_policy=CachePolicy.CACHE_ONLY, workers=1)
+
+    assert _Handler.requests == 1
+    assert [r["title"] for r in s.sink.rows] == [path, path]
+    assert all(r["URL"] == f"{server}{path}" for r in s.sink.rows)
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_raw_cache_write_only_does_not_decode_bodies(
+    tmp_path, monkeypatch, redis_client, server, mode
+):
+    monkeypatch.chdir(tmp_path)
+    decoded = []
+    decode_body = scraper_mod.decode_body
+    monkeypatch.setattr(
+        scraper_mod,
+        "decode_body",
+        lambda body, content_type=None: decoded.append(body)
+        or decode_body(body, content_type),
+    )
+    s = _scraper(redis_client, server, n=2)
+    s.raw_cache = True
+    cache = DiskCache(str(tmp_path / "cache"))
+
+    if mode == "async":
+        asyncio.run(s.scrape_async(cache=cache))
+    else:
+        s.scrape_sync(cache=cache)
+
+    # バイト列のまま保存するだけなので、デコードしない
+    assert _Handler.requests == 2
+    assert decoded == []
+    assert cache.read(f"{server}/page/0") is not None
@@ -0,0 +1,126 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from click.testing import CliRunner
+
+from py_stream_scraper import log as sx_log
+from py_stream_scraper import url_manager
+from py_stream_scraper.cli import _cli
+from py_stream_scraper.log import FETCH_LOGGER_NAME, LOGGER_NAME, shutdown_logging
+from py_stream_scraper.url_manager import DiskURLManager, StorageConfig
+
+
+@pytest.fixture(autouse=True)
+def restore_globals(monkeypatch):
+    # sx は既定のストレージとロギングをプロセス全体に設定するので、テストごとに戻す
+    monkeypatch.setattr(url_manager, "_default_storage", url_manager._default_storage)
+    logger = logging.getLogger(LOGGER_NAME)
+    handlers, level = list(logger.handlers), logger.level
+    yield
+    shutdown_logging()
+    logger.handlers = handlers
+    logger.setLevel(level)
+    logger.propagate = True
+    logging.getLogger(FETCH_LOGGER_NAME).filters = []
+    sx_log._configured = False
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["list", "--host", "a.com"],
+        ["partition", "--host", "a.com", "--shards", "2"],
+        ["failures", "--host", "a.com"],
+        ["dupes", "--host", "a.com"],
+    ],
+)
+def test_read_commands_without_db_fail_cleanly(tmp_path, args):
+    db = tmp_path / "db"
+
+    result = CliRunner().invoke(_cli, ["--db", str(db), *args])
+
+    assert result.exit_code == 1
+    assert "見つかりません" in result.output
+    assert isinstance(result.exception, SystemExit)
+    # 開けなかったときは DB も secondary の置き場所も作らない
+    assert sorted(p.name for p in tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("levels", ["retyr=DEBUG", "retry"])
+def test_log_levels_rejects_unknown_subsystems(tmp_path, levels):
+    result = CliRunner().invoke(
+        _cli, ["--log-levels", levels, "--db", str(tmp_path / "db"), "list"]
+    )
+
+    assert result.exit_code == 2
+    assert "--log-levels" in result.output
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/fail"):
+            self.send_error(500)
+            return
+        body = b"<html><title>same</title></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+PROFILED = """
+import fakeredis
+
+from py_stream_scraper.dedupe import DedupeMode
+from py_stream_scraper.scraper import FetchStrategy, Scraper
+
+
+class ProfiledScraper(Scraper):
+    def __init__(self):
+        super().__init__(
+            "127.0.0.1",
+            1000,
+            redis_client=fakeredis.FakeRedis(decode_responses=True),
+            fetch_strategy=FetchStrategy.RETRY,
+            recrawl=True,
+            dedupe=DedupeMode.EXACT,
+        )
+
+    def parse(self, url, html):
+        return {"URL": url}
+"""
+
+
+def _dump(manager):
+    return [item for item in manager.db.iterator(mode="from", key=b"")]
+
+
+def test_profile_does_not_change_scrape_state(tmp_path, monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    server = f"http://127.0.0.1:{httpd.server_address[1]}"
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "profiled.py").write_text(PROFILED, encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    db = str(tmp_path / "db")
+    manager = DiskURLManager("127.0.0.1", StorageConfig(path=db))
+    manager.add_urls([f"{server}/a", f"{server}/b", f"{server}/fail"])
+    before = _dump(manager)
+
+    try:
+        result = CliRunner().invoke(
+            _cli, ["--db", db, "profile", "profiled.ProfiledScraper", "-n", "3"]
+        )
+    finally:
+        httpd.shutdown()
+
+    assert result.exit_code == 0, result.output
+    assert "3 urls" in result.output
+    # recrawl・再試行キュー・dedupe のどれも記録しない
+    assert _dump(manager) == before
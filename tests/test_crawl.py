@@ -0,0 +1,141 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from py_stream_scraper import crawl
+from py_stream_scraper.crawl import CrawlSpec
+from py_stream_scraper.scraper import Scraper
+
+PAGES = 3
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/broken":
+            self._send(
+                b'<html><body><a class="detail" href="http://[broken/x">x</a>'
+                b'<a class="detail" href="/shop/ok">ok</a></body></html>'
+            )
+            return
+        m = re.match(r"/list/(\d+)$", self.path)
+        if not m:
+            self.send_error(404)
+            return
+        page = int(m.group(1))
+        shops = "".join(
+            f'<div class="shop"><a class="detail" href="/shop/{page}-{i}#top">詳細</a>'
+            f'<a href="/ad/{i}">広告</a></div>'
+            for i in range(2)
+        )
+        nav = "".join(
+            f'<li><a href="/list/{p}">{p}</a></li>' for p in range(1, PAGES + 1)
+        )
+        body = (
+            f'<html><body>{shops}<a class="detail" href="/shop/closed">閉店</a>'
+            f'<a class="detail" href="https://other.test/shop/x">外部</a>'
+            f'<ul class="pagination">{nav}</ul></body></html>'
+        ).encode("utf-8")
+        self._send(body)
+
+    def _send(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def _spec(server, **kwargs):
+    return CrawlSpec(
+        seeds=[f"{server}/list/1"],
+        follow=["ul.pagination"],
+        detail=["a.detail"],
+        deny=[r"/closed$"],
+        **kwargs,
+    )
+
+
+def _frontier(scraper):
+    return sorted(v.decode("utf-8") for _, v in scraper.url_manager.to_iter())
+
+
+@pytest.mark.parametrize("use_lxml", [True, False])
+def test_crawl_follows_pagination_and_adds_detail_links(
+    tmp_path, monkeypatch, redis_client, server, use_lxml
+):
+    monkeypatch.chdir(tmp_path)
+    if not use_lxml:
+        monkeypatch.setattr(crawl, "etree", None)
+    elif crawl.etree is None:
+        pytest.skip("lxml is not installed")
+
+    class ListingScraper(Scraper):
+        crawl_spec = _spec(server)
+
+    s = ListingScraper("127.0.0.1", 1000, redis_client=redis_client)
+    s.url_manager.add_url(f"{server}/shop/1-0")
+    s.discover_urls()
+
+    assert _frontier(s) == sorted(
+        f"{server}/shop/{p}-{i}" for p in range(1, PAGES + 1) for i in range(2)
+    )
+
+
+def test_crawl_limits_depth_and_dedupes_against_frontier(
+    tmp_path, monkeypatch, redis_client, server
+):
+    monkeypatch.chdir(tmp_path)
+    s = Scraper("127.0.0.1", 1000, redis_client=redis_client)
+    s.url_manager.add_url(f"{server}/shop/1-0")
+
+    stats = s.crawl(_spec(server, max_depth=0, batch_size=1))
+
+    assert (stats.pages, stats.failed, stats.links, stats.added) == (1, 0, 2, 1)
+    assert _frontier(s) == [f"{server}/shop/1-0", f"{server}/shop/1-1"]
+
+
+def test_crawl_counts_failed_pages(tmp_path, monkeypatch, redis_client, server):
+    monkeypatch.chdir(tmp_path)
+    s = Scraper("127.0.0.1", 1000, redis_client=redis_client)
+
+    stats = s.crawl(CrawlSpec(seeds=[f"{server}/missing"]))
+
+    assert (stats.pages, stats.failed, stats.added) == (0, 1, 0)
+
+
+def test_crawl_skips_malformed_links(tmp_path, monkeypatch, redis_client, server):
+    monkeypatch.chdir(tmp_path)
+    s = Scraper("127.0.0.1", 1000, redis_client=redis_client)
+
+    stats = s.crawl(CrawlSpec(seeds=[f"{server}/broken"], detail=["a.detail"]))
+
+    assert (stats.pages, stats.failed, stats.added) == (1, 0, 1)
+    assert _frontier(s) == [f"{server}/shop/ok"]
+
+
+def test_crawl_counts_extract_errors_as_failed(
+    tmp_path, monkeypatch, redis_client, server
+):
+    monkeypatch.chdir(tmp_path)
+    s = Scraper("127.0.0.1", 1000, redis_client=redis_client)
+
+    def boom(self, html):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(crawl.LinkExtractor, "extract", boom)
+    stats = s.crawl(_spec(server))
+
+    assert (stats.pages, stats.failed, stats.added) == (0, 1, 0)
@@ -0,0 +1,96 @@
+import pytest
+
+from py_stream_scraper.dedupe import (
+    DedupeIndex,
+    DedupeMode,
+    fingerprint,
+    hamming,
+    simhash,
+)
+from py_stream_scraper.scraper import Scraper
+from py_stream_scraper.sink import Sink
+from py_stream_scraper.url_manager import DiskURLManager
+
+
+def _page(items, footer="2026-10-19"):
+    rows = "".join(f"<li>{item} の詳細な説明文がここに入ります</li>" for item in items)
+    return (
+        f"<html><head><script>var t={footer!r};</script></head>"
+        f"<body><ul>{rows}</ul><footer>{footer}</footer></body></html>"
+    )
+
+
+ITEMS = [f"商品{i}" for i in range(40)]
+
+
+def test_fingerprint_ignores_whitespace():
+    assert fingerprint("<p>a  b</p>\n") == fingerprint(b"<p>a b</p>")
+    assert fingerprint("<p>a b</p>") != fingerprint("<p>a c</p>")
+
+
+def test_simhash_is_close_for_small_changes_and_far_otherwise():
+    base = simhash(_page(ITEMS))
+
+    assert hamming(base, simhash(_page(ITEMS, footer="2026-10-20"))) <= 3
+    assert hamming(base, simhash(_page([f"別の{i}" for i in range(40)]))) > 3
+
+
+def test_index_detects_exact_and_near_duplicates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index = DedupeIndex(DiskURLManager("dupe.test"), DedupeMode.NEAR)
+
+    assert index.check("https://dupe.test/list?sort=new", _page(ITEMS)) is None
+    # 同じURLの取り直しは重複ではない
+    assert index.check("https://dupe.test/list?sort=new", _page(ITEMS)) is None
+
+    exact = index.check("https://dupe.test/list?sort=old", _page(ITEMS))
+    near = index.check("https://dupe.test/list?sid=1", _page(ITEMS, "2026-10-20"))
+    other = index.check("https://dupe.test/other", _page([f"別の{i}" for i in range(40)]))
+
+    assert (exact.url, exact.kind) == ("https://dupe.test/list?sort=new", "exact")
+    assert (near.url, near.kind) == ("https://dupe.test/list?sort=new", "near")
+    assert other is None
+    assert index.clusters() == {
+        "https://dupe.test/list?sort=new": [
+            "https://dupe.test/list?sid=1",
+            "https://dupe.test/list?sort=old",
+        ]
+    }
+    assert dict(index.normalization_candidates()) == {"sort": 2, "sid": 1}
+
+
+def test_index_rejects_distance_beyond_bands(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        DedupeIndex(DiskURLManager("dupe.test"), max_distance=4)
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        pass
+
+
+def test_scraper_skips_parse_and_sink_for_duplicates(tmp_path, monkeypatch, redis_client):
+    monkeypatch.chdir(tmp_path)
+
+    class PageScraper(Scraper):
+        def parse(self, url, html):
+            return {"URL": url}
+
+    s = PageScraper("dupe.test", 1, redis_client=redis_client, dedupe=DedupeMode.EXACT)
+    s.sink = ListSink()
+    for url in ("https://dupe.test/a", "https://dupe.test/a?utm=x", "https://dupe.test/b"):
+        html = _page(ITEMS) if url != "https://dupe.test/b" else _page(["b"])
+        s._handle_body_sync(url, html.encode("utf-8"), _Resp(), cache=None)
+
+    assert [r["URL"] for r in s.sink.rows] == ["https://dupe.test/a", "https://dupe.test/b"]
+
+
+class _Resp:
+    headers = {"Content-Type": "text/html; charset=utf-8"}
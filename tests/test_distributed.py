@@ -0,0 +1,293 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from redis.commands.core import StreamCommands
+
+from py_stream_scraper.scraper import DistributedScraper, FetchStrategy
+from py_stream_scraper.url_manager import StorageConfig
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"<html><title>ok</title></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+class CountingScraper(DistributedScraper):
+    def __init__(self, *args, stop_after: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_after = stop_after
+        self.parsed = []
+
+    def parse(self, url, html):
+        self.parsed.append(url)
+        if len(self.parsed) >= self.stop_after:
+            self.running = False
+        return {"URL": url}
+
+
+def _deliver_to_dead_consumer(redis_client, scraper, n):
+    for i in range(n):
+        redis_client.xadd(scraper.stream_name, {"url": f"/page/{i}"})
+    redis_client.xreadgroup("scrapers", "dead-pod", {scraper.stream_name: ">"}, count=n)
+
+
+def test_claim_stuck_messages_takes_over_idle_work(tmp_path, monkeypatch, redis_client):
+    monkeypatch.chdir(tmp_path)
+    s = DistributedScraper(
+        "claim.test", 10, redis_client=redis_client, consumer_name="me", claim_idle_ms=0
+    )
+    _deliver_to_dead_consumer(redis_client, s, 3)
+
+    claimed = s.claim_stuck_messages()
+
+    assert [d["url"] for _, d in claimed] == ["/page/0", "/page/1", "/page/2"]
+    pending = redis_client.xpending_range(s.stream_name, "scrapers", "-", "+", 10)
+    assert {p["consumer"] for p in pending} == {"me"}
+
+
+def test_poison_messages_go_to_dead_letter_stream(tmp_path, monkeypatch, redis_client):
+    monkeypatch.chdir(tmp_path)
+    s = DistributedScraper(
+        "poison.test",
+        10,
+        redis_client=redis_client,
+        consumer_name="me",
+        claim_idle_ms=0,
+        max_deliveries=2,
+    )
+    _deliver_to_dead_consumer(redis_client, s, 1)
+    # 2回目の配信
+    assert len(s.claim_stuck_messages()) == 1
+
+    assert s.claim_stuck_messages() == []
+    dead = redis_client.xrange(s.dead_letter_stream)
+    assert [d["url"] for _, d in dead] == ["/page/0"]
+    assert dead[0][1]["deliveries"] == "2"
+    assert redis_client.xpending(s.stream_name, "scrapers")["pending"] == 0
+
+
+def test_scrape_sync_processes_work_left_by_dead_pod(
+    tmp_path, monkeypatch, redis_client, server
+):
+    monkeypatch.chdir(tmp_path)
+    s = CountingScraper(
+        "127.0.0.1",
+        100,
+        redis_client=redis_client,
+        consumer_name="me",
+        fetch_strategy=FetchStrategy.NEVER_STOP,
+        claim_idle_ms=0,
+        stop_after=3,
+    )
+    for i in range(3):
+        redis_client.xadd(s.stream_name, {"url": f"{server}/page/{i}"})
+    redis_client.xreadgroup("scrapers", "dead-pod", {s.stream_name: ">"}, count=3)
+
+    s.scrape_sync()
+
+    assert len(s.parsed) == 3
+    assert redis_client.xpending(s.stream_name, "scrapers")["pending"] == 0
+
+
+def test_lease_heartbeat_keeps_slow_fetch_from_being_reclaimed(
+    tmp_path, monkeypatch, redis_client
+):
+    monkeypatch.chdir(tmp_path)
+    s = DistributedScraper(
+        "lease.test",
+        10,
+        redis_client=redis_client,
+        consumer_name="me",
+        claim_idle_ms=150,
+        claim_interval=60,
+    )
+    redis_client.xadd(s.stream_name, {"url": "/slow"})
+    [[_, [(msg_id, _)]]] = redis_client.xreadgroup(
+        "scrapers", "me", {s.stream_name: ">"}
+    )
+    s._leases.add((s.stream_name, msg_id))
+
+    stop = threading.Event()
+    t = threading.Thread(target=s._lease_loop, args=(stop,))
+    t.start()
+    time.sleep(0.4)
+    stop.set()
+    t.join()
+
+    [entry] = redis_client.xpending_range(s.stream_name, "scrapers", "-", "+", 10)
+    assert entry["consumer"] == "me"
+    assert entry["time_since_delivered"] < 150
+    assert entry["times_delivered"] == 1
+
+
+def test_start_stream_publishes_each_url_to_a_consistent_shard(
+    tmp_path, monkeypatch, redis_client
+):
+    monkeypatch.chdir(tmp_path)
+    s = DistributedScraper(
+        "shards.test", 10, redis_client=redis_client, stream_shards=3
+    )
+    urls = [f"https://shards.test/page/{i}" for i in range(30)]
+    s.url_manager.add_urls(urls)
+
+    s.start_stream(batch_size=7)
+
+    assert s.stream_names == [f"{s.stream_name}:{i}" for i in range(3)]
+    published = {
+        d["url"]: name for name in s.stream_names for _, d in redis_client.xrange(name)
+    }
+    assert sorted(published) == sorted(urls)
+    # どのシャードにも配信され、同じURLは常に同じシャードに入る
+    assert set(published.values()) == set(s.stream_names)
+    s.start_stream()
+    again = {}
+    for name in s.stream_names:
+        for _, d in redis_client.xrange(name):
+            again.setdefault(d["url"], set()).add(name)
+    assert all(again[u] == {published[u]} for u in urls)
+
+
+def test_scrape_sync_reads_and_reclaims_across_shards(
+    tmp_path, monkeypatch, redis_client, server
+):
+    monkeypatch.chdir(tmp_path)
+    s = CountingScraper(
+        "127.0.0.1",
+        100,
+        redis_client=redis_client,
+        consumer_name="me",
+        fetch_strategy=FetchStrategy.NEVER_STOP,
+        claim_idle_ms=0,
+        stream_shards=2,
+        stop_after=4,
+    )
+    a, b = s.stream_names
+    redis_client.xadd(a, {"url": f"{server}/a/0"})
+    redis_client.xadd(b, {"url": f"{server}/b/0"})
+    # 止まったワーカーが読んだまま残したメッセージ
+    redis_client.xreadgroup("scrapers", "dead-pod", {a: ">", b: ">"})
+    redis_client.xadd(a, {"url": f"{server}/a/1"})
+    redis_client.xadd(b, {"url": f"{server}/b/1"})
+
+    streams_per_read = []
+    xreadgroup = StreamCommands.xreadgroup
+
+    def spy(self, groupname, consumername, streams, *args, **kwargs):
+        streams_per_read.append(len(streams))
+        return xreadgroup(self, groupname, consumername, streams, *args, **kwargs)
+
+    monkeypatch.setattr(StreamCommands, "xreadgroup", spy)
+    s.scrape_sync()
+
+    assert sorted(s.parsed) == [
+        f"{server}/{p}" for p in ("a/0", "a/1", "b/0", "b/1")
+    ]
+    # Redis Cluster では別のスロットのストリームを1回で読めない（CROSSSLOT）
+    assert streams_per_read and set(streams_per_read) == {1}
+    for name in s.stream_names:
+        assert redis_client.xpending(name, "scrapers")["pending"] == 0
+    status = s.status()
+    assert (status.length, status.pending) == (4, 0)
+    assert set(status.shards) == {a, b}
+
+
+def test_messages_waiting_in_a_batch_keep_their_lease(
+    tmp_path, monkeypatch, redis_client
+):
+    monkeypatch.chdir(tmp_path)
+    s = DistributedScraper(
+        "batch-lease.test",
+        10,
+        redis_client=redis_client,
+        consumer_name="me",
+        fetch_strategy=FetchStrategy.NEVER_STOP,
+        claim_idle_ms=150,
+        claim_interval=60,
+    )
+    fetched = []
+
+    def slow_fetch(session, url, stream, msg_id, cache):
+        time.sleep(0.3)
+        fetched.append(url)
+        s._ack(stream, msg_id)
+        if len(fetched) == 3:
+            s.running = False
+
+    monkeypatch.setattr(s, "_fetch_message", slow_fetch)
+    for i in range(3):
+        redis_client.xadd(s.stream_name, {"url": f"/page/{i}"})
+
+    t = threading.Thread(target=s.scrape_sync, kwargs={"workers": 1})
+    t.start()
+    try:
+        time.sleep(0.45)
+        assert len(fetched) == 1
+        other = DistributedScraper(
+            "batch-lease.test",
+            10,
+            redis_client=redis_client,
+            consumer_name="other",
+            claim_idle_ms=150,
+        )
+        # 3件目はまだ取得を始めていないが、リースが延長されているので引き取られない
+        assert other.claim_stuck_messages() == []
+    finally:
+        t.join(timeout=5)
+        s.running = False
+        t.join()
+
+    assert len(fetched) == 3
+    assert s._leases == set()
+    assert redis_client.xpending(s.stream_name, "scrapers")["pending"] == 0
+
+
+def test_start_stream_records_recrawl_results_sent_back_by_workers(
+    tmp_path, monkeypatch, redis_client, server
+):
+    monkeypatch.chdir(tmp_path)
+    producer = DistributedScraper("127.0.0.1", 100, redis_client=redis_client, recrawl=True)
+    urls = [f"{server}/page/{i}" for i in range(2)]
+    producer.url_manager.add_urls(urls)
+    producer.start_stream()
+
+    # ワーカーは別のPCで、自分のローカルの DB を使う
+    worker = CountingScraper(
+        "127.0.0.1",
+        100,
+        redis_client=redis_client,
+        consumer_name="worker",
+        fetch_strategy=FetchStrategy.NEVER_STOP,
+        recrawl=True,
+        storage=StorageConfig(path=str(tmp_path / "worker")),
+        stop_after=2,
+    )
+    worker.scrape_sync()
+    assert sorted(worker.parsed) == urls
+    assert redis_client.xlen(producer.recrawl_stream) == 2
+
+    producer.start_stream()
+
+    # 取得済みで予定前のURLは配信し直さない
+    assert redis_client.xlen(producer.stream_name) == 2
+    assert redis_client.xlen(producer.recrawl_stream) == 0
+    for url in urls:
+        key = producer.recrawl._key_for_url(url)
+        assert producer.recrawl.get_state(key)["fetches"] == 1
@@ -0,0 +1,96 @@
+import pytest
+
+pytest.importorskip("lxml")
+pytest.importorskip("cssselect")
+
+from py_stream_scraper.extract import Field, Pairs, Schema, digits, regex  # noqa: E402
+from py_stream_scraper.scraper import Scraper  # noqa: E402
+
+HTML = """
+<html><head><meta charset="shift_jis"><title> 店舗情報 </title></head><body>
+<span id="header_area_name"> 東京都 </span>
+<table class="basic_information_table">
+  <tr><th>店名</th><td> <b>居酒屋</b> さくら </td></tr>
+  <tr><th>所在地</th><td><div class="address">新宿区1-2-3</div><a>地図</a></td></tr>
+  <tr><th>電話番号</th><td>03-1234-5678</td></tr>
+  <tr><th>備考</th><td>出力しない</td></tr>
+</table>
+<ul><li><a href="/a">A</a></li><li><a href="/b">B</a></li><li><a>no href</a></li></ul>
+</body></html>
+"""
+
+SHOP = Schema(
+    columns=["URL", "都道府県", "店名", "所在地", "電話番号", "職種"],
+    fields=[Field("都道府県", css="#header_area_name")],
+    pairs=[
+        Pairs(
+            "table.basic_information_table",
+            value_css={"所在地": "div.address"},
+        )
+    ],
+)
+
+
+def test_schema_pairs_table_headings_with_columns():
+    row = SHOP.extract(HTML, "https://example.com/shop/1")
+
+    assert row == {
+        "URL": "https://example.com/shop/1",
+        "都道府県": "東京都",
+        "店名": "居酒屋さくら",
+        "所在地": "新宿区1-2-3",
+        "電話番号": "03-1234-5678",
+        "職種": "",
+    }
+    assert list(row) == list(SHOP.columns)
+
+
+def test_schema_fields_attr_many_xpath_and_post():
+    schema = Schema(
+        fields=[
+            Field("title", xpath="//title/text()"),
+            Field("links", css="ul a", attr="href", many=True),
+            Field(
+                "tel",
+                xpath="//th[.='電話番号']/following-sibling::td",
+                post=(digits,),
+            ),
+            Field("ward", css=".address", post=(regex(r"(\w+区)"),)),
+            Field("missing", css="#nope", default=None),
+        ],
+        pairs=[Pairs("table", rename={"店名": "name"})],
+    )
+
+    row = schema.extract(HTML.encode("shift_jis"), "u")
+
+    assert row["title"] == "店舗情報"
+    assert row["links"] == ["/a", "/b"]
+    assert row["tel"] == "0312345678"
+    assert row["ward"] == "新宿区"
+    assert row["missing"] is None
+    # columns を省略するとすべての見出しを列にする
+    assert row["name"] == "居酒屋さくら"
+    assert row["備考"] == "出力しない"
+
+
+def test_schema_on_empty_document_returns_defaults():
+    assert SHOP.extract("", "u")["店名"] == ""
+
+
+def test_schema_decodes_bytes_with_meta_charset():
+    # meta で Shift_JIS を宣言した bytes も str と同じ結果になる
+    expected = SHOP.extract(HTML, "u")
+    assert SHOP.extract(HTML.encode("shift_jis"), "u") == expected
+    assert expected["所在地"] == "新宿区1-2-3"
+    assert SHOP.extract("<p>店名</p>".encode("utf-8"), "u")["店名"] == ""
+    assert SHOP.parse_html("<p>店名</p>".encode("utf-8")).findtext(".//p") == "店名"
+
+
+def test_scraper_parse_uses_schema(tmp_path, monkeypatch, redis_client):
+    monkeypatch.chdir(tmp_path)
+
+    class ShopScraper(Scraper):
+        schema = SHOP
+
+    s = ShopScraper("schema.test", 1, redis_client=redis_client)
+    assert s.parse("u", HTML)["店名"] == "居酒屋さくら"
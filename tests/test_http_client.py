@@ -0,0 +1,113 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from py_stream_scraper import Scraper, http_client
+from py_stream_scraper.http_client import (
+    BodyTooLarge,
+    ContentTypeNotAllowed,
+    HTTPClient,
+    decode_body,
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers = set()
+
+    def do_GET(self):
+        self.peers.add(self.client_address)
+        content_type = "text/html; charset=utf-8"
+        body = b"<html>ok</html>"
+        if self.path == "/big":
+            body = b"x" * 100_000
+        elif self.path == "/pdf":
+            content_type = "application/pdf"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if self.path != "/big":
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == "/big":
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class RecordingScraper(Scraper):
+    def parse(self, url, html):
+        return {"URL": url}
+
+
+def test_threaded_scrape_sync_reuses_pooled_connections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    scraper = RecordingScraper(
+        "local.test", 1000, http_client=HTTPClient(max_workers=4, pool_maxsize=4)
+    )
+    for i in range(40):
+        scraper.url_manager.add_url(f"{base}/page/{i}")
+
+    written = []
+    monkeypatch.setattr(scraper.sink, "write", written.append)
+    scraper.scrape_sync()
+    server.shutdown()
+
+    assert len(written) == 40
+    assert len(_Handler.peers) <= 4
+    assert scraper.url_manager.get_cursor() == scraper.url_manager.lower
+
+
+def test_streaming_read_enforces_size_and_content_type():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    client = HTTPClient(max_body_bytes=10_000)
+
+    with client.get(f"{base}/ok", stream=True) as resp:
+        assert client.read(resp) == b"<html>ok</html>"
+    with client.get(f"{base}/big", stream=True) as resp:
+        with pytest.raises(BodyTooLarge):
+            client.read(resp)
+    with client.get(f"{base}/pdf", stream=True) as resp:
+        with pytest.raises(ContentTypeNotAllowed):
+            client.read(resp)
+    server.shutdown()
+
+
+def test_decode_body_uses_declared_charset():
+    sjis = "日本語".encode("shift_jis")
+    assert decode_body(sjis, "text/html; charset=Shift_JIS") == "日本語"
+    meta = b'<meta charset="shift_jis">' + sjis
+    assert decode_body(meta, "text/html").endswith("日本語")
+    assert decode_body("日本語".encode("utf-8"), None) == "日本語"
+
+
+def test_process_dns_cache_is_opt_in_bounded_and_removed_on_close(monkeypatch):
+    calls = []
+
+    def fake_getaddrinfo(host, *args, **kwargs):
+        calls.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 80))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", fake_getaddrinfo)
+    monkeypatch.setattr(http_client, "_DNS_CACHE", http_client._DNSCache(max_entries=2))
+
+    HTTPClient().close()
+    assert socket.getaddrinfo is fake_getaddrinfo
+
+    client = HTTPClient(process_dns_cache=True)
+    for host in ("a.test", "a.test", "b.test", "c.test", "a.test"):
+        socket.getaddrinfo(host, 80)
+    # a.test は2回目だけキャッシュから返り、c.test を入れた時点で追い出される
+    assert calls == ["a.test", "b.test", "c.test", "a.test"]
+
+    client.close()
+    assert socket.getaddrinfo is fake_getaddrinfo
@@ -0,0 +1,85 @@
+import io
+import json
+import logging
+
+import pytest
+
+from py_stream_scraper import log as sx_log
+from py_stream_scraper.log import (
+    FETCH_LOGGER_NAME,
+    LOGGER_NAME,
+    SamplingFilter,
+    configure_logging,
+    shutdown_logging,
+)
+
+
+@pytest.fixture(autouse=True)
+def restore_logging():
+    logger = logging.getLogger(LOGGER_NAME)
+    fetch_logger = logging.getLogger(FETCH_LOGGER_NAME)
+    handlers, level = list(logger.handlers), logger.level
+    yield
+    shutdown_logging()
+    logger.handlers = handlers
+    logger.setLevel(level)
+    logger.propagate = True
+    fetch_logger.filters = []
+    fetch_logger.setLevel(logging.NOTSET)
+    sx_log._configured = False
+
+
+def test_json_lines_with_extra_fields():
+    out = io.StringIO()
+    logger = configure_logging(structured=True, background=False, stream=out)
+    logger.info("fetched %s", "https://example.com/a", extra={"status": 200})
+
+    record = json.loads(out.getvalue())
+    assert record["msg"] == "fetched https://example.com/a"
+    assert record["level"] == "INFO"
+    assert record["status"] == 200
+
+
+def test_background_writer_defers_formatting():
+    out = io.StringIO()
+    configure_logging(structured=True, stream=out)
+
+    class Lazy:
+        calls = 0
+
+        def __str__(self):
+            Lazy.calls += 1
+            return "lazy"
+
+    logging.getLogger(FETCH_LOGGER_NAME).info("fetching: %s", Lazy())
+    shutdown_logging()
+
+    assert Lazy.calls == 1
+    assert json.loads(out.getvalue())["logger"] == FETCH_LOGGER_NAME
+
+
+def test_sampling_and_subsystem_levels():
+    out = io.StringIO()
+    configure_logging(
+        background=False, stream=out, sample_rate=0.1, levels={"retry": "ERROR"}
+    )
+    fetch_logger = logging.getLogger(FETCH_LOGGER_NAME)
+    for i in range(100):
+        fetch_logger.info("fetching: %d", i)
+    fetch_logger.warning("skipped")
+    logging.getLogger(f"{LOGGER_NAME}.retry").warning("hidden")
+
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 11
+    assert "skipped" in lines[-1]
+
+
+def test_sampling_filter_rejects_invalid_rate():
+    with pytest.raises(ValueError):
+        SamplingFilter(0)
+
+
+def test_unknown_subsystem_is_rejected():
+    with pytest.raises(ValueError, match="lease"):
+        configure_logging(background=False, levels={"retyr": "DEBUG"})
+    assert sx_log.subsystem_logger("lease").name == f"{LOGGER_NAME}.lease"
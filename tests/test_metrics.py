@@ -0,0 +1,63 @@
+import threading
+import urllib.request
+
+from py_stream_scraper.metrics import MetricsRegistry, ScraperMetrics
+
+
+def test_registry_snapshot_and_prometheus_text():
+    registry = MetricsRegistry()
+    m = ScraperMetrics("a.com", registry)
+    m.count("fetched", 200)
+    m.count("fetched", 204)
+    m.count("failed", None)
+    m.stage_seconds.observe(0.02, host="a.com", stage="parse")
+    m.stage_seconds.observe(3.0, host="a.com", stage="parse")
+    with m.track_inflight():
+        assert m.inflight.get(host="a.com") == 1
+    assert m.inflight.get(host="a.com") == 0
+
+    snap = registry.snapshot()
+    assert snap["sx_requests_total"][("a.com", "fetched", "2xx")] == 2
+    assert snap["sx_requests_total"][("a.com", "failed", "error")] == 1
+    parse = snap["sx_stage_seconds"][("a.com", "parse")]
+    assert parse["count"] == 2
+    assert parse["buckets"][0.025] == 1
+    assert parse["buckets"][float("inf")] == 2
+
+    text = registry.render()
+    assert "# TYPE sx_requests_total counter" in text
+    assert 'sx_requests_total{host="a.com",outcome="fetched",status_class="2xx"} 2' in text
+    assert 'sx_stage_seconds_bucket{host="a.com",stage="parse",le="+Inf"} 2' in text
+
+
+def test_metrics_endpoint():
+    registry = MetricsRegistry()
+    registry.counter("sx_test_total", "test").inc()
+    server = registry.serve(port=0, addr="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        body = urllib.request.urlopen(url).read().decode("utf-8")
+    finally:
+        server.shutdown()
+    assert "sx_test_total 1" in body
+
+
+def test_render_while_other_threads_add_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("sx_test_total", "test", ["path"])
+    hist = registry.histogram("sx_test_seconds", "test", ["path"])
+
+    def writer():
+        for i in range(20_000):
+            counter.inc(path=f"/{i}")
+            hist.observe(0.1, path=f"/{i}")
+
+    t = threading.Thread(target=writer)
+    t.start()
+    # 描画中に別スレッドが新しいラベルを足しても例外にならない
+    while t.is_alive():
+        registry.render()
+        registry.snapshot()
+    t.join()
+
+    assert len(registry.snapshot()["sx_test_total"]) == 20_000
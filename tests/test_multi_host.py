@@ -0,0 +1,75 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from py_stream_scraper import MultiHostScraper, Scraper
+from py_stream_scraper.http_client import HTTPClient
+
+
+class RecordingScraper(Scraper):
+    def __init__(self, host, qps, max_concurrency, seen):
+        super().__init__(host, qps, max_concurrency=max_concurrency)
+        self.seen = seen
+
+    def parse(self, url, html):
+        self.seen.append((self.host, url))
+        return {"URL": url}
+
+
+def test_multi_host_scrapes_every_host_in_one_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def handler(request):
+        return web.Response(text="<html></html>", content_type="text/html")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", handler)
+        server = TestServer(app)
+        await server.start_server()
+        base = f"http://{server.host}:{server.port}"
+
+        seen = []
+        scrapers = [
+            RecordingScraper("a.test", 50, 2, seen),
+            RecordingScraper("b.test", 50, 1, seen),
+        ]
+        for s in scrapers:
+            for i in range(5):
+                s.url_manager.add_url(f"{base}/{s.host}/{i}")
+
+        await MultiHostScraper(scrapers, max_concurrency=4).scrape_async()
+        await server.close()
+        return seen
+
+    seen = asyncio.run(run())
+
+    assert len(seen) == 10
+    assert {host for host, _ in seen} == {"a.test", "b.test"}
+    # round-robin: 両ホストが交互に処理され、一方が他方を待たせ続けない
+    assert {host for host, _ in seen[:4]} == {"a.test", "b.test"}
+
+
+def test_multi_host_uses_the_http_client_connector_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    http = HTTPClient(keep_alive=False)
+    connectors = []
+    connector = http.connector
+    monkeypatch.setattr(
+        http,
+        "connector",
+        lambda **kwargs: connectors.append((kwargs, connector(**kwargs)))
+        or connectors[-1][1],
+    )
+    scrapers = [
+        Scraper("a.test", 50, max_concurrency=2, http_client=http),
+        Scraper("b.test", 50, max_concurrency=1, http_client=http),
+    ]
+
+    asyncio.run(MultiHostScraper(scrapers, max_concurrency=4).scrape_async())
+
+    [(kwargs, conn)] = connectors
+    assert kwargs == {"limit": 4, "limit_per_host": 2, "ssl": True}
+    # keep_alive=False がマルチホストのセッションにも効く
+    assert conn.force_close
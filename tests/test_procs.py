@@ -0,0 +1,128 @@
+import multiprocessing
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from py_stream_scraper.metrics import MetricsRegistry
+from py_stream_scraper.rate_limiter import Limiter, SharedMemoryStorage
+from py_stream_scraper.scraper import FetchStrategy, Scraper
+from py_stream_scraper.sink import Sink
+from py_stream_scraper.url_manager import DiskURLManager
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = f"<html><title>{self.path}</title></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        pass
+
+
+class ProcScraper(Scraper):
+    def __init__(self):
+        super().__init__(
+            "127.0.0.1", 1000, max_concurrency=4, fetch_strategy=FetchStrategy.NEVER_STOP
+        )
+
+    def parse(self, url, html):
+        return {"URL": url, "title": html.split("<title>")[1].split("</title>")[0]}
+
+
+def _drain(limiter, seconds, out):
+    deadline = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < deadline:
+        if limiter.consume("host"):
+            n += 1
+    out.put(n)
+
+
+def test_shared_memory_storage_limits_the_total_across_processes():
+    ctx = multiprocessing.get_context("spawn")
+    limiter = Limiter(20, 5, SharedMemoryStorage(ctx=ctx))
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_drain, args=(limiter, 1.0, out)) for _ in range(3)]
+    for p in procs:
+        p.start()
+    total = sum(out.get(timeout=30) for _ in procs)
+    for p in procs:
+        p.join()
+
+    # 容量 5 + 20/秒 × 1秒（起動のずれの分だけ余裕を見る）
+    assert 5 <= total <= 5 + 20 * 1.5
+
+
+def test_registry_merge_adds_only_the_difference():
+    registry = MetricsRegistry()
+    counter = registry.counter("c", "help", ["host"])
+    hist = registry.histogram("h", "help", ["host"], buckets=[1, 10])
+    worker = MetricsRegistry()
+    wc = worker.counter("c", "help", ["host"])
+    wh = worker.histogram("h", "help", ["host"], buckets=[1, 10])
+
+    wc.inc(3, host="a")
+    wh.observe(0.5, host="a")
+    first = worker.snapshot()
+    registry.merge(first)
+    wc.inc(2, host="a")
+    wh.observe(5, host="a")
+    registry.merge(worker.snapshot(), first)
+
+    assert counter.get(host="a") == 5
+    assert hist.snapshot() == wh.snapshot()
+
+
+def test_scrape_procs_shards_the_frontier_over_worker_processes(
+    tmp_path, monkeypatch, server
+):
+    monkeypatch.chdir(tmp_path)
+    s = ProcScraper()
+    s.sink = ListSink()
+    for i in range(20):
+        s.url_manager.add_url(f"{server}/page/{i}")
+    labels = {"host": "127.0.0.1", "outcome": "fetched", "status_class": "2xx"}
+    fetched = s.metrics.requests.get(**labels)
+
+    s.scrape_procs(2)
+
+    assert sorted(r["title"] for r in s.sink.rows) == sorted(
+        f"/page/{i}" for i in range(20)
+    )
+    assert s.metrics.requests.get(**labels) == fetched + 20
+    for shard_id in range(2):
+        m = DiskURLManager("127.0.0.1", shard_id=shard_id, num_shards=2)
+        assert m.get_cursor() == m.lower
+
+
+def test_scrape_procs_rejects_state_kept_in_rocksdb(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = ProcScraper()
+    s.recrawl = object()
+    with pytest.raises(ValueError):
+        s.scrape_procs(2)
@@ -0,0 +1,56 @@
+from py_stream_scraper.rate_limiter import (
+    AIMDController,
+    Limiter,
+    MemoryStorage,
+    RedisStorage,
+    parse_retry_after,
+)
+
+
+def _controller(**kwargs):
+    limiter = Limiter(5, 10, MemoryStorage())
+    params = dict(floor=1, ceiling=10, increase=1, interval=0, min_samples=3)
+    params.update(kwargs)
+    return AIMDController(limiter, **params)
+
+
+def test_aimd_increases_while_healthy_and_cuts_on_429():
+    controller = _controller()
+    for _ in range(3):
+        controller.observe(200, 0.1)
+    assert controller.rate == 6
+
+    controller.observe(429, 0.1)
+    assert controller.rate == 3
+    assert controller.state()["decreases"] == 1
+
+    for _ in range(10):
+        controller.observe(503, 0.1)
+    assert controller.rate == 1
+
+
+def test_aimd_cuts_on_slow_p95_and_respects_retry_after():
+    controller = _controller(latency_target=1.0)
+    for _ in range(3):
+        controller.observe(200, 5.0)
+    assert controller.rate == 2.5
+
+    controller.observe(200, 0.1, retry_after="30")
+    assert controller.paused_for() > 25
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_distributed_controllers_share_rate_and_bucket(redis_client):
+    limiters = [Limiter(5, 5, RedisStorage(redis_client)) for _ in range(2)]
+    controllers = [
+        AIMDController(l, 1, 10, interval=0, redis_client=redis_client, key="a.com")
+        for l in limiters
+    ]
+
+    controllers[0].observe(500, 0.1)
+    controllers[1]._last_sync = 0
+    controllers[1].paused_for()
+    assert limiters[1].rate == 2.5
+
+    consumed = sum(l.consume("a.com") for l in limiters for _ in range(5))
+    assert consumed == 5
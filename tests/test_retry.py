@@ -0,0 +1,47 @@
+import aiohttp
+import requests
+
+from py_stream_scraper.retry import RetryQueue, classify_error
+from py_stream_scraper.url_manager import DiskURLManager
+
+
+def _http_error(status):
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(response=resp)
+
+
+def test_classify_error():
+    assert classify_error(_http_error(503)) == "http_5xx"
+    assert classify_error(_http_error(429)) == "http_429"
+    assert classify_error(_http_error(404)) == "http_4xx"
+    assert classify_error(requests.Timeout()) == "timeout"
+    assert classify_error(aiohttp.ServerDisconnectedError()) == "connection"
+    assert classify_error(ValueError("parse")) == "other"
+
+
+def test_transient_failures_are_retried_then_dead_lettered(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    queue = RetryQueue(DiskURLManager("a.com"), max_attempts=3, base_delay=10)
+    url = "https://a.com/flaky"
+
+    assert queue.fail(url, _http_error(503), now=0) == "retry"
+    assert list(queue.due(now=4)) == []
+    assert [u for _, u in queue.due(now=10)] == [url.encode("utf-8")]
+
+    assert queue.fail(url, requests.Timeout(), now=10) == "retry"
+    assert [s["attempts"] for s in queue.pending()] == [2]
+    assert queue.fail(url, requests.Timeout(), now=40) == "dead"
+    assert list(queue.pending()) == []
+    assert list(queue.due(now=1000)) == []
+
+    dead = list(queue.dead_letters())
+    assert [(d["url"], d["kind"], d["attempts"]) for d in dead] == [
+        (url, "timeout", 3)
+    ]
+
+    assert queue.fail("https://a.com/gone", _http_error(404), now=0) == "dead"
+    assert queue.requeue_dead(kind="http_4xx", now=50) == 1
+    assert [u for _, u in queue.due(now=50)] == [b"https://a.com/gone"]
+    queue.succeed("https://a.com/gone")
+    assert list(queue.due(now=50)) == []
@@ -0,0 +1,30 @@
+from py_stream_scraper.scheduler import RecrawlScheduler
+from py_stream_scraper.url_manager import DiskURLManager
+
+
+def test_recrawl_interval_follows_content_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    url_manager = DiskURLManager(host="a.com")
+    url_manager.add_url("https://a.com/static")
+    url_manager.add_url("https://a.com/news")
+    scheduler = RecrawlScheduler(
+        url_manager, min_interval=10, max_interval=1000, initial_interval=100
+    )
+
+    assert scheduler.record("https://a.com/static", "same", fetched_at=0)
+    assert scheduler.record("https://a.com/news", "v1", fetched_at=0)
+    assert list(scheduler.due(now=50)) == []
+
+    assert not scheduler.record("https://a.com/static", "same", fetched_at=100)
+    assert scheduler.record("https://a.com/news", "v2", fetched_at=100)
+
+    static = scheduler.get_state(url_manager.key_for("/static", ""))
+    news = scheduler.get_state(url_manager.key_for("/news", ""))
+    assert static["interval"] == 150
+    assert news["interval"] == 50
+    assert news["changes"] == 1
+
+    due = [url for _, url in scheduler.due(now=200)]
+    assert due == [b"https://a.com/news"]
+    due = [url for _, url in scheduler.due(now=300)]
+    assert due == [b"https://a.com/news", b"https://a.com/static"]
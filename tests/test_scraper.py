@@ -1,9 +1,15 @@
+import asyncio
+import re
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from types import SimpleNamespace
-from py_stream_scraper.scraper import Scraper, ScraperBuilder
-from py_stream_scraper.sink import FileSink
+
+import pytest
+
 from py_stream_scraper import scraper as scraper_mod
-import tempfile
-from pathlib import Path
+from py_stream_scraper.scraper import DistributedScraper, FetchStrategy, Scraper
+from py_stream_scraper.sink import FileSink
 
 
 class DummyTree:
@@ -26,70 +32,155 @@ def _dummy_sitemap(_):
     )
 
 
-def test_discover_urls_pushes_to_stream(redis_client, url_filter, monkeypatch):
-    from py_stream_scraper import scraper as scraper_mod
+class TitleScraper(Scraper):
+    def parse(self, url, html):
+        return {"URL": url, "title": re.search(r"<title>(.*)</title>", html).group(1)}
 
-    monkeypatch.setattr(scraper_mod, "sitemap_tree_for_homepage", _dummy_sitemap)
 
-    s = Scraper(
-        host="example.com", qps=2, url_filter=url_filter, redis_client=redis_client
-    )
-    s.discover_urls()
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/fail"):
+            self.send_error(500)
+            return
+        body = f"<html><title>{self.path}</title></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
 
-    entries = redis_client.xrange(s.stream_name, min="-", max="+")
-    pushed = [fields["url"] for _id, fields in entries]
 
-    assert "https://example.com/" not in pushed
-    assert "https://example.com/blog/a.html" in pushed
-    assert "https://example.com/news/today.html" in pushed
-    assert "https://example.com/wp-admin/panel" not in pushed
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
 
 
-def test_builder_builds_and_discovers_urls(monkeypatch, redis_client):
-    """
-    set_host / set_qps / set_filter で build した Scraper が
-    discover_urls 時に filter を満たすURLだけを Redis Stream に積むことを検証。
-    """
+def test_discover_urls_from_sitemap_keeps_matching_urls(
+    tmp_path, monkeypatch, redis_client
+):
+    monkeypatch.chdir(tmp_path)
     monkeypatch.setattr(scraper_mod, "sitemap_tree_for_homepage", _dummy_sitemap)
 
-    scraper = (
-        ScraperBuilder()
-        .set_host("example.com")
-        .set_qps(2)
-        .set_filter(r"^/(blog|news)/")
-        .set_redis_client(redis_client)
-        .build()
+    s = Scraper(host="example.com", qps=2, redis_client=redis_client)
+    s.discover_urls_from_sitemap(re.compile(r"/(blog|news)/"))
+
+    urls = [v.decode("utf-8") for _, v in s.url_manager.to_iter()]
+    assert sorted(urls) == [
+        "https://example.com/blog/a.html",
+        "https://example.com/news/today.html",
+    ]
+
+
+def test_scrape_sync_writes_parsed_rows_to_sink(
+    tmp_path, monkeypatch, redis_client, server
+):
+    monkeypatch.chdir(tmp_path)
+    s = TitleScraper(host="sync.test", qps=100, redis_client=redis_client)
+    s.sink = FileSink(str(tmp_path / "out.csv"))
+    for i in range(3):
+        s.url_manager.add_url(f"{server}/page/{i}")
+
+    s.scrape_sync()
+    s.sink.close()
+
+    rows = (tmp_path / "out.csv").read_text(encoding="utf-8-sig").splitlines()
+    assert rows[0] == "URL,title"
+    assert len(rows) == 4
+    assert s.url_manager.get_cursor() == s.url_manager.lower
+
+
+@pytest.mark.parametrize("sync", [False, True])
+def test_recrawl_hashes_raw_response_bytes(
+    tmp_path, monkeypatch, redis_client, server, sync
+):
+    monkeypatch.chdir(tmp_path)
+    recorded = []
+    monkeypatch.setattr(
+        scraper_mod.RecrawlScheduler,
+        "record",
+        lambda self, url, content, fetched_at=None: recorded.append(content),
     )
+    s = TitleScraper(
+        host=f"recrawl-{sync}.test", qps=100, redis_client=redis_client, recrawl=True
+    )
+    s.sink = FileSink(str(tmp_path / "out.csv"))
+    s.url_manager.add_url(f"{server}/page/0")
+
+    if sync:
+        s.scrape_sync()
+    else:
+        asyncio.run(s.scrape_async())
+    s.sink.close()
+
+    # 同期・非同期のどちらもデコード前のボディでハッシュする
+    assert recorded == [b"<html><title>/page/0</title></html>"]
+
+
+def test_scrape_sync_stops_on_failure(tmp_path, monkeypatch, redis_client, server):
+    monkeypatch.chdir(tmp_path)
+    s = TitleScraper(
+        host="stop.test",
+        qps=100,
+        redis_client=redis_client,
+        fetch_strategy=FetchStrategy.STOP_ON_FAIL,
+    )
+    s.sink = FileSink(str(tmp_path / "out.csv"))
+    s.url_manager.add_url(f"{server}/a")
+    s.url_manager.add_url(f"{server}/fail")
+    s.url_manager.add_url(f"{server}/z")
+
+    s.scrape_sync()
+
+    # 失敗したURLの手前でカーソルが止まり、次回はそこから再開する
+    assert s.url_manager.get_cursor().endswith(b"/a")
+    assert not s.running
 
-    scraper.discover_urls()
-
-    entries = redis_client.xrange(scraper.stream_name, min="-", max="+")
-    pushed = [fields["url"] for _id, fields in entries]
-
-    assert "https://example.com/" not in pushed
-    assert "https://example.com/blog/a.html" in pushed
-    assert "https://example.com/news/today.html" in pushed
-    assert "https://example.com/wp-admin/panel" not in pushed
-
-
-def test_builder_with_sink(redis_client):
-    """
-    set_sink で Sink を設定できることを検証
-    """
-    with tempfile.TemporaryDirectory() as tmpdir:
-        filepath = Path(tmpdir) / "output.csv"
-        sink = FileSink(str(filepath))
-
-        scraper = (
-            ScraperBuilder()
-            .set_host("example.com")
-            .set_qps(2)
-            .set_filter(r"^/(blog|news)/")
-            .set_sink(sink)
-            .set_redis_client(redis_client)
-            .build()
-        )
-
-        # Scraperにsink属性が追加されていることを確認
-        assert hasattr(scraper, "sink")
-        assert scraper.sink == sink
+
+def test_start_stream_pushes_frontier_urls(tmp_path, monkeypatch, redis_client):
+    monkeypatch.chdir(tmp_path)
+    s = DistributedScraper(host="stream.test", qps=2, redis_client=redis_client)
+    s.url_manager.add_url("https://stream.test/a")
+    s.url_manager.add_url("https://stream.test/b")
+
+    s.start_stream()
+
+    entries = redis_client.xrange(s.stream_name, min="-", max="+")
+    assert [fields["url"] for _id, fields in entries] == [
+        "https://stream.test/a",
+        "https://stream.test/b",
+    ]
+
+
+@pytest.mark.parametrize("sync", [False, True])
+def test_scrape_follow_fetches_urls_as_they_arrive(
+    tmp_path, monkeypatch, redis_client, server, sync
+):
+    monkeypatch.chdir(tmp_path)
+    s = TitleScraper(host=f"follow-{sync}.test", qps=100, redis_client=redis_client)
+    s.sink = FileSink(str(tmp_path / "out.csv"))
+    fetched = []
+    parse = s.parse
+    monkeypatch.setattr(s, "parse", lambda url, html: fetched.append(url) or parse(url, html))
+
+    def source():
+        for i in (3, 1, 2, 0):
+            yield f"{server}/page/{i}\n"
+            # 最初のURLは収集が終わる前に取得される
+            if i == 3:
+                deadline = time.monotonic() + 5
+                while not fetched and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                assert fetched
+
+    s.scrape_follow(source(), sync=sync)
+    s.sink.close()
+
+    assert sorted(fetched) == sorted(f"{server}/page/{i}" for i in range(4))
+    rows = (tmp_path / "out.csv").read_text(encoding="utf-8-sig").splitlines()
+    assert len(rows) == 5
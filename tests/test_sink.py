@@ -0,0 +1,80 @@
+import csv
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from py_stream_scraper.sink import FileSink, Sink, SQLiteSink
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.rows = []
+        self.closed = False
+
+    def write(self, data):
+        self.rows.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+def _rows(path, sql):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def test_sqlite_sink_upserts_by_natural_key(tmp_path):
+    path = tmp_path / "out.db"
+    with SQLiteSink(str(path), key="法人番号", batch_size=2) as sink:
+        sink.write({"法人番号": "1", "名前": "A社"})
+        sink.write([{"法人番号": "2", "名前": "B社"}, {"法人番号": "1", "名前": "A社"}])
+        sink.write({"法人番号": "1", "名前": "A社"})
+
+    assert sink.stats == {"inserted": 2, "updated": 0, "unchanged": 2}
+    rows = _rows(path, "SELECT key, data, version FROM records ORDER BY key")
+    assert [(k, json.loads(d), v) for k, d, v in rows] == [
+        ("1", {"法人番号": "1", "名前": "A社"}, 1),
+        ("2", {"法人番号": "2", "名前": "B社"}, 1),
+    ]
+    assert _rows(path, "PRAGMA journal_mode") == [("wal",)]
+
+
+def test_sqlite_sink_records_changed_fields_and_emits_changes(tmp_path):
+    path = str(tmp_path / "out.db")
+    with SQLiteSink(path) as sink:
+        sink.write({"URL": "/a", "店名": "旧", "電話番号": "03"})
+        sink.write({"URL": "/b", "店名": "B"})
+
+    downstream = ListSink()
+    with SQLiteSink(path, changes=downstream) as sink:
+        sink.write({"URL": "/a", "店名": "新", "電話番号": "03"})
+        sink.write({"URL": "/b", "店名": "B"})
+        sink.write({"URL": "/c", "店名": "C"})
+
+    assert sink.stats == {"inserted": 1, "updated": 1, "unchanged": 1}
+    assert [r["URL"] for r in downstream.rows] == ["/a", "/c"]
+    assert downstream.closed
+    [(key, fields)] = _rows(path, "SELECT key, fields FROM records_changes")
+    assert key == "/a"
+    assert json.loads(fields) == {"店名": ["旧", "新"]}
+    assert _rows(path, "SELECT version FROM records WHERE key = '/a'") == [(2,)]
+
+
+def test_sqlite_sink_rejects_records_without_key(tmp_path):
+    sink = SQLiteSink(str(tmp_path / "out.db"), key=["URL", "id"], batch_size=1)
+    with pytest.raises(ValueError):
+        sink.write({"URL": "/a"})
+    sink.close()
+
+
+def test_file_sink_writes_one_header_from_many_threads(tmp_path):
+    path = tmp_path / "out.csv"
+    with FileSink(str(path)) as sink:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: sink.write({"URL": f"/{i}", "n": i}), range(400)))
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(int(r["n"]) for r in rows) == list(range(400))
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import py_stream_scraper
+
+SRC = str(Path(py_stream_scraper.__file__).resolve().parent.parent)
+
+# sx の起動時に読み込んではいけない重い依存
+HEAVY = ("aiohttp", "requests", "redis", "rich", "usp", "brotli", "tqdm", "rocksdbpy")
+
+
+def _importtime(code: str):
+    """
+    python -X importtime で code を実行し、{モジュール: 累積 μs} を返す
+    """
+    env = dict(os.environ, PYTHONPATH=SRC)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_does_not_load_heavy_dependencies():
+    times = _importtime("import py_stream_scraper.cli")
+
+    loaded = {name.split(".")[0] for name in times}
+    assert not loaded & set(HEAVY), sorted(loaded & set(HEAVY))
+    # 重い依存を読まなければ遅い CI でも 1 秒はかからない
+    assert times["py_stream_scraper.cli"] < 1_000_000
+
+
+def test_package_exports_load_on_first_use():
+    times = _importtime(
+        "import sys, py_stream_scraper\n"
+        "assert 'py_stream_scraper.scraper' not in sys.modules\n"
+        "from py_stream_scraper import Scraper\n"
+        "assert Scraper.__module__ == 'py_stream_scraper.scraper'"
+    )
+
+    assert "aiohttp" in times
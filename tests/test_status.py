@@ -0,0 +1,72 @@
+import json
+import urllib.request
+
+from py_stream_scraper import status
+from py_stream_scraper.status import ack_rate, record_ack, stream_status
+
+
+def test_ack_rate_counts_completed_buckets_in_window(redis_client):
+    now = 1_000_000.0
+    record_ack(redis_client, "rate.test", 30, now=now - 25)
+    record_ack(redis_client, "rate.test", 30, now=now - 5)
+    # 進行中の区間は数えない
+    record_ack(redis_client, "rate.test", 100, now=now)
+
+    assert ack_rate(redis_client, "rate.test", window=60, now=now) == 1.0
+    assert ack_rate(redis_client, "rate.test", window=10, now=now) == 3.0
+
+
+def test_stream_status_reports_lag_pending_and_consumers(redis_client):
+    name = status.stream_name("status.test")
+    redis_client.xgroup_create(name, "scrapers", id="0", mkstream=True)
+    for i in range(5):
+        redis_client.xadd(name, {"url": f"/page/{i}"})
+    redis_client.xreadgroup("scrapers", "pod-a", {name: ">"}, count=2)
+    redis_client.xadd(f"{name}:dead", {"url": "/poison"})
+
+    s = stream_status(redis_client, "status.test")
+
+    assert s.length == 5
+    assert s.pending == 2
+    assert s.consumers["pod-a"].pending == 2
+    assert s.oldest_pending_age is not None
+    assert s.dead_letters == 1
+    assert s.backlog == (s.lag or 0) + 2
+    # ack がまだないので推定できない
+    assert s.eta_seconds is None
+    assert json.loads(json.dumps(s.to_dict()))["pending"] == 2
+
+
+def test_stream_status_for_unknown_host_is_empty(redis_client):
+    s = stream_status(redis_client, "missing.test")
+
+    assert (s.length, s.pending, s.lag, s.consumers) == (0, 0, None, {})
+    assert s.eta_seconds == 0.0
+
+
+def test_serve_returns_status_as_json(redis_client):
+    server = status.serve(redis_client, ["a.test"], port=0, addr="127.0.0.1")
+    port = server.server_address[1]
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/status/a.test") as r:
+            assert json.load(r)["host"] == "a.test"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/status") as r:
+            assert list(json.load(r)) == ["a.test"]
+    finally:
+        server.shutdown()
+
+
+def test_stream_status_sums_shards(redis_client):
+    names = status.stream_names("sharded.test", 2)
+    assert names == [status.stream_name("sharded.test", i) for i in range(2)]
+    for i, name in enumerate(names):
+        redis_client.xgroup_create(name, "scrapers", id="0", mkstream=True)
+        for j in range(i + 2):
+            redis_client.xadd(name, {"url": f"/{i}/{j}"})
+        redis_client.xreadgroup("scrapers", "pod-a", {name: ">"}, count=1)
+
+    s = stream_status(redis_client, "sharded.test", shards=2)
+
+    assert (s.length, s.pending) == (5, 2)
+    assert s.consumers["pod-a"].pending == 2
+    assert [(sh.length, sh.pending) for sh in s.shards.values()] == [(2, 1), (3, 1)]
@@ -0,0 +1,63 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from py_stream_scraper import Scraper
+from py_stream_scraper.tracing import CallbackTracer, TimingTracer, Tracer
+
+
+class PageScraper(Scraper):
+    def parse(self, url, html):
+        return {"URL": url}
+
+
+def test_noop_tracer_span_does_nothing():
+    tracer = Tracer()
+    with tracer.span("parse", "https://example.com/"):
+        pass
+    assert not tracer.enabled
+
+
+def test_timing_tracer_summary_orders_stages():
+    tracer = TimingTracer()
+    tracer.record("parse", 0.2, "u1")
+    tracer.record("token_wait", 0.1, "u1")
+    tracer.record("parse", 0.4, "u2")
+
+    summary = tracer.summary()
+    assert list(summary) == ["token_wait", "parse"]
+    assert summary["parse"]["count"] == 2
+    assert abs(summary["parse"]["total"] - 0.6) < 1e-9
+    assert tracer.urls == {"u1", "u2"}
+
+
+def test_scrape_async_records_per_url_stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    events = []
+
+    async def handler(request):
+        return web.Response(text="<html></html>", content_type="text/html")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", handler)
+        server = TestServer(app)
+        await server.start_server()
+        base = f"http://{server.host}:{server.port}"
+
+        scraper = PageScraper(
+            "trace.test",
+            100,
+            tracer=CallbackTracer(lambda stage, sec, url: events.append((stage, url))),
+        )
+        for i in range(3):
+            scraper.url_manager.add_url(f"{base}/page/{i}")
+        await scraper.scrape_async()
+        await server.close()
+
+    asyncio.run(run())
+
+    stages = {stage for stage, _ in events}
+    assert {"token_wait", "connect", "ttfb", "body_read", "parse", "sink_write", "cursor"} <= stages
+    assert len({url for stage, url in events if stage == "parse"}) == 3
@@ -1,4 +1,13 @@
-from py_stream_scraper.url_manager import DiskURLManager
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import py_stream_scraper
+
+from py_stream_scraper.url_manager import DiskURLManager, StorageConfig
 
 
 def test_url_parititioned_by_host():
@@ -9,3 +18,147 @@ def test_url_parititioned_by_host():
 
     iterated = [url for url in url_manager.to_iter()]
     assert len(iterated) == 3
+
+
+def test_to_iter_stops_at_host_boundary(tmp_path):
+    storage = StorageConfig(path=str(tmp_path / "db"), block_cache_mb=8)
+    a = DiskURLManager("a.co", storage)
+    b = DiskURLManager("a.com", storage)
+    a.add_url("https://a.co/x")
+    b.add_url("https://a.com/y")
+    a.set_cursor()
+
+    assert [v for _, v in a.to_iter()] == [b"https://a.co/x"]
+    assert [v for _, v in b.to_iter()] == [b"https://a.com/y"]
+
+
+def test_secondary_reads_while_primary_writes(tmp_path):
+    path = str(tmp_path / "db")
+    writer = DiskURLManager("a.com", StorageConfig(path=path))
+    writer.add_url("https://a.com/1")
+
+    reader = DiskURLManager("a.com", StorageConfig(path=path, mode="secondary"))
+    assert len(list(reader.to_iter())) == 1
+
+    writer.add_url("https://a.com/2")
+    writer.db.flush()
+    reader.refresh()
+    assert len(list(reader.to_iter())) == 2
+
+
+def test_secondary_files_are_removed_when_the_process_exits(tmp_path):
+    path = tmp_path / "db"
+    DiskURLManager("a.com", StorageConfig(path=str(path))).add_url("https://a.com/1")
+    # 強制終了したプロセスの残り
+    stale = tmp_path / "db.secondary" / "999999999"
+    stale.mkdir(parents=True)
+
+    code = (
+        "import os\n"
+        "from py_stream_scraper.url_manager import DiskURLManager, StorageConfig\n"
+        f"m = DiskURLManager('a.com', StorageConfig(path={str(path)!r}, mode='secondary'))\n"
+        "assert len(list(m.to_iter())) == 1\n"
+        "print(os.getpid())\n"
+    )
+    src = str(Path(py_stream_scraper.__file__).resolve().parent.parent)
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONPATH=src),
+        check=True,
+    )
+
+    assert proc.stdout.strip().isdigit()
+    assert list((tmp_path / "db.secondary").iterdir()) == []
+
+
+def test_storage_config_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        StorageConfig(mode="replica")
+
+
+def test_iter_batches_and_cursor_index(tmp_path):
+    m = DiskURLManager("batch.test", StorageConfig(path=str(tmp_path / "db")))
+    for i in range(25):
+        m.add_url(f"https://batch.test/{i:02d}")
+
+    batches = list(m.iter_batches(batch_size=10))
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert all(isinstance(k, bytes) and isinstance(v, bytes) for k, v in batches[0])
+    assert m.urls_total == 25
+
+    m.set_cursor()
+    assert m.url_current_index == 0
+    m.set_cursor(memoryview(batches[1][2][0]))
+    assert m.url_current_index == 13
+    assert m.get_cursor() == batches[1][2][0]
+
+
+def test_shards_split_frontier_with_independent_cursors(tmp_path):
+    storage = StorageConfig(path=str(tmp_path / "db"))
+    full = DiskURLManager("shard.test", storage)
+    for i in range(50):
+        full.add_url(f"https://shard.test/item/{i}")
+
+    shards = [DiskURLManager("shard.test", storage, i, 3) for i in range(3)]
+    seen = [[k for k, _ in s.to_iter()] for s in shards]
+    assert sum(len(keys) for keys in seen) == 50
+    assert len(set().union(*map(set, seen))) == 50
+    assert all(shards[i].owns(k) for i in range(3) for k in seen[i])
+
+    shards[0].set_cursor(seen[0][-1])
+    assert shards[1].get_cursor() != shards[0].get_cursor()
+    assert full.get_cursor() != shards[0].get_cursor()
+
+    files = full.partition(3, str(tmp_path / "out"))
+    for (path, cnt), keys in zip(files, seen):
+        assert cnt == len(keys)
+        assert len(open(path, "rb").read().splitlines()) == cnt
+
+
+def test_set_shard_rejects_out_of_range(tmp_path):
+    m = DiskURLManager("shard.test", StorageConfig(path=str(tmp_path / "db")))
+    with pytest.raises(ValueError):
+        m.set_shard(3, 3)
+
+
+def test_add_urls_writes_only_new_urls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    m = DiskURLManager("batch.test")
+    m.add_url("https://batch.test/a")
+
+    added = m.add_urls(
+        ["https://batch.test/a", "https://batch.test/b", "https://batch.test/b "]
+    )
+
+    assert added == 1
+    assert [v for _, v in m.to_iter()] == [
+        b"https://batch.test/a",
+        b"https://batch.test/b",
+    ]
+    assert m.add_urls([]) == 0
+
+
+def test_follow_yields_urls_added_while_tailing(tmp_path, monkeypatch):
+    import threading
+
+    monkeypatch.chdir(tmp_path)
+    m = DiskURLManager("follow.test")
+    m.add_url("https://follow.test/b")
+    m.add_url("https://follow.test/d")
+    done = threading.Event()
+
+    frontier = m.follow(done, m.key_for("/c", ""))
+
+    assert next(frontier) == ([(m.key_for("/d", ""), b"https://follow.test/d")], True)
+    m.add_urls(["https://follow.test/a", "https://follow.test/e"])
+    # カーソルより前に追加されたものは、カーソルを進めない印を付けて返す
+    assert next(frontier) == ([(m.key_for("/a", ""), b"https://follow.test/a")], False)
+    assert next(frontier) == ([(m.key_for("/e", ""), b"https://follow.test/e")], True)
+    assert next(frontier) == ([], True)
+    assert not m.wait_for_writes(0.01)
+
+    done.set()
+    assert list(frontier) == []
+    assert m._tail_log is None
@@ -0,0 +1,127 @@
+import gzip
+
+import brotli
+
+from py_stream_scraper.cache import DiskCache
+from py_stream_scraper.warc import (
+    WARCCache,
+    WARCWriter,
+    export_cache,
+    import_warc,
+    iter_records,
+    load_cdx,
+    read_record,
+)
+
+
+def test_writer_records_are_standard_gzip_members_readable_by_offset(tmp_path):
+    path = tmp_path / "a.warc.gz"
+    with WARCWriter(path) as w:
+        first = w.write_response(
+            "https://a.test/1", b"<p>1</p>", 200, {"Content-Type": "text/html"}, 0
+        )
+        second = w.write_response("https://a.test/2", "<p>二</p>".encode(), 404)
+
+    # gzip のメンバーをつなげたものなので標準の gzip でも読める
+    raw = gzip.decompress(path.read_bytes())
+    assert raw.startswith(b"WARC/1.1\r\nWARC-Type: response\r\n")
+    assert b"WARC-Target-URI: https://a.test/2\r\n" in raw
+
+    records = list(iter_records(path))
+    assert [(r.url, r.status, r.offset, r.length) for r in records] == [
+        ("https://a.test/1", 200, *first),
+        ("https://a.test/2", 404, *second),
+    ]
+    assert records[0].headers["Content-Type"] == "text/html"
+    assert records[0].fetched_at == 0
+
+    record = read_record(path, second[0])
+    assert record.body == "<p>二</p>".encode()
+    assert read_record(path, *first).body == b"<p>1</p>"
+
+
+def test_export_and_import_round_trip_through_cdx(tmp_path):
+    disk = DiskCache(str(tmp_path / "disk"))
+    disk.write("https://a.test/1", brotli.compress(b"<html>1</html>"))
+    disk.write("https://a.test/2", brotli.compress(b"<html>2</html>"))
+    out = tmp_path / "export.warc.gz"
+
+    written, missing = export_cache(
+        disk, ["https://a.test/1", "https://a.test/2", "https://a.test/3"], out
+    )
+
+    assert (written, missing) == (2, 1)
+    index = load_cdx(str(out) + ".cdxj")
+    entry = index["https://a.test/2"]
+    assert entry["filename"] == "export.warc.gz"
+    assert read_record(out, entry["offset"], entry["length"]).body == b"<html>2</html>"
+
+    restored = DiskCache(str(tmp_path / "restored"))
+    assert import_warc(out, restored) == ["https://a.test/1", "https://a.test/2"]
+    assert brotli.decompress(restored.read("https://a.test/1")) == b"<html>1</html>"
+
+
+def test_warc_cache_reads_back_and_recovers_unindexed_tail(tmp_path):
+    cache = WARCCache(tmp_path, max_file_size=1)
+    cache.write_response("https://a.test/1", b"one", 200, {"X-Test": "1"})
+    cache.write("https://a.test/2", b"two")
+    cache.write("https://a.test/1", b"one again")
+
+    assert cache.read("https://a.test/1") == b"one again"
+    assert cache.read("https://a.test/missing") is None
+    assert cache.fresh_many(["https://a.test/2", "https://a.test/missing"]) == [
+        True,
+        False,
+    ]
+    # max_file_size を超えるたびに次のファイルに移る
+    assert len(sorted(tmp_path.glob("cache-*.warc.gz"))) == 4
+    cache.close()
+
+    # インデックスに書く前に止まった分は、開くときに最後のファイルから補う
+    with WARCWriter(tmp_path / "cache-00003.warc.gz") as w:
+        w.write_response("https://a.test/3", b"three")
+    reopened = WARCCache(tmp_path)
+    assert sorted(reopened.urls()) == [f"https://a.test/{i}" for i in (1, 2, 3)]
+    assert reopened.read_record("https://a.test/1").body == b"one again"
+    assert reopened.read("https://a.test/3") == b"three"
+    reopened.close()
+
+
+def test_warc_cache_truncates_incomplete_tail_and_keeps_appending(tmp_path):
+    cache = WARCCache(tmp_path)
+    cache.write("https://a.test/1", b"one")
+    cache.write("https://a.test/2", b"two" * 1000)
+    cache.close()
+
+    # 2件目の書き込みの途中で止まり、インデックスだけが書かれていた
+    path = tmp_path / "cache-00000.warc.gz"
+    size = path.stat().st_size
+    entry = load_cdx(tmp_path / "cache.cdxj")["https://a.test/2"]
+    with open(path, "r+b") as f:
+        f.truncate(entry["offset"] + entry["length"] // 2)
+
+    reopened = WARCCache(tmp_path)
+    assert reopened.urls() == ["https://a.test/1"]
+    assert path.stat().st_size == entry["offset"] < size
+    reopened.write("https://a.test/3", b"three")
+    reopened.close()
+
+    again = WARCCache(tmp_path)
+    assert sorted(again.urls()) == ["https://a.test/1", "https://a.test/3"]
+    assert again.read("https://a.test/3") == b"three"
+    assert [r.url for r in iter_records(path)] == ["https://a.test/1", "https://a.test/3"]
+    again.close()
+
+
+def test_warc_cache_recovers_unindexed_records_before_a_truncated_one(tmp_path):
+    with WARCWriter(tmp_path / "cache-00000.warc.gz") as w:
+        w.write_response("https://a.test/1", b"one")
+        w.write_response("https://a.test/2", b"two")
+    path = tmp_path / "cache-00000.warc.gz"
+    with open(path, "r+b") as f:
+        f.truncate(path.stat().st_size - 10)
+
+    cache = WARCCache(tmp_path)
+    assert cache.urls() == ["https://a.test/1"]
+    assert cache.read("https://a.test/1") == b"one"
+    cache.close()